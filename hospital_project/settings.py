@@ -54,11 +54,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main_app.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main_app.middleware.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -67,7 +69,8 @@ ROOT_URLCONF = 'hospital_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates که زمان رندر را در پروفایل درخواست ثبت می‌کند (main_app/template_backends.py)
+        'BACKEND': 'main_app.template_backends.ProfiledDjangoTemplates',
         'DIRS': [BASE_DIR / "templates"],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -83,14 +86,47 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'hospital_project.wsgi.application'
 
+# پروفایل پایگاه‌داده: 'production' (پیش‌فرض) یا 'default' برای SQLite بدون تنظیمات اضافه
+# production: WAL تا خواندن پزشکان هنگام نوشتن پرستاران مسدود نشود، busy_timeout به‌جای خطای
+# "database is locked"، synchronous=NORMAL (در WAL امن است)، mmap و کش صفحه بزرگ‌تر،
+# تراکنش‌های IMMEDIATE (قفل نوشتن از ابتدای تراکنش، بدون بن‌بست ارتقای قفل) و اتصال پایدار
+DB_PROFILE = os.environ.get('DB_PROFILE', 'production')
+SQLITE_PRAGMAS = {
+    # اول busy_timeout تا خود تغییر journal_mode هم منتظر قفل بماند
+    'busy_timeout': 5000,  # میلی‌ثانیه
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # منفی = کیلوبایت
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        # زیر ASGI اتصال‌ها بین درخواست‌ها نگه داشته نمی‌شوند؛ آنجا DB_CONN_MAX_AGE=0 بگذارید
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    })
 
 
+# Loads the nurse/doctor profile together with the user (one query per request).
+# ModelBackend stays listed: sessions store their backend's path, and sessions from before
+# ProfileModelBackend name ModelBackend; without it those users would all be logged out.
+AUTHENTICATION_BACKENDS = [
+    'main_app.backends.ProfileModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -125,6 +161,13 @@ LOCALE_PATHS = [
 
 MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
 
+# کش خلاصه‌های AI (main_app/services/summary_cache.py)
+AI_SUMMARY_CACHE_TTL = 24 * 60 * 60  # ثانیه
+AI_SUMMARY_CACHE_MAX_ENTRIES = 1000
+# اگر هیچ run_summary_worker یک job را در این مدت (ثانیه) برنداشت، خلاصه محلی برگردانده و این‌قدر کش می‌شود
+AI_SUMMARY_JOB_CLAIM_GRACE = 10
+AI_SUMMARY_FALLBACK_TTL = 5 * 60
+
 # تنظیمات ایمیل)
 # EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 # EMAIL_HOST = 'smtp.example.com'
@@ -132,3 +175,46 @@ MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
 # EMAIL_USE_TLS = True
 # EMAIL_HOST_USER = 'your_email@example.com'
 # EMAIL_HOST_PASSWORD = 'your_email_password'
+
+# مدیریت g4f در سطح پروسه (main_app/services/g4f_provider.py)
+G4F_COOKIES_DIR = os.path.join(BASE_DIR, 'har_and_cookies')
+AI_SUMMARY_MAX_WORKERS = 4
+
+# پروفایل هر درخواست (main_app/middleware.py): هدر Server-Timing و بافر حلقوی آخرین درخواست‌ها
+PROFILING_ENABLED = True
+PROFILING_BUFFER_SIZE = 500
+
+# فید زنده داشبورد پزشک (main_app/services/live_feed.py): تعداد رویدادهای نگه‌داشته برای اتصال مجدد
+LIVE_FEED_BUFFER_SIZE = 500
+
+# کش سری علائم حیاتی هر بیمار در حافظه پروسه (main_app/services/vitals_series.py): سقف حجم آرایه‌ها (بایت) و عمر هر ورودی (ثانیه)
+VITALS_SERIES_CACHE_BYTES = 64 * 1024 * 1024
+VITALS_SERIES_CACHE_TTL = 300
+
+# کش فرگمنت‌های قالب داشبوردها و لیست‌ها (main_app/services/fragment_cache.py)
+# CACHE_BACKEND: locmem (پیش‌فرض، هر پروسه جدا)، file (مشترک بین پروسه‌های یک سرور) یا redis (مثلاً یک Redis محلی)
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND == 'file':
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }}
+elif CACHE_BACKEND == 'redis':
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+    }}
+else:
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }}
+FRAGMENT_CACHE_TIMEOUT = 300  # ثانیه
+
+# API دریافت دسته‌ای علائم حیاتی از مانیتورها (main_app/services/vitals_ingest.py): حداکثر خوانش در هر درخواست
+INGEST_MAX_BATCH = 10000
+
+# آپلود اکسل چندبیماره (main_app/services/workbook_import.py): تعداد پروسه‌هایی که شیت‌ها را موازی می‌خوانند
+WORKBOOK_IMPORT_WORKERS = 4
@@ -0,0 +1,43 @@
+# main_app/backends.py
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import ObjectDoesNotExist
+
+UserModel = get_user_model()
+
+# Reverse one-to-one profiles; a user has at most one of them
+PROFILE_RELATIONS = ('nurse', 'doctor')
+
+
+class ProfileModelBackend(ModelBackend):
+    """
+    ModelBackend whose per-request user lookup also joins the nurse/doctor profile,
+    so role checks and `request.profile` need no further queries.
+    """
+
+    def get_user(self, user_id):
+        try:
+            user = UserModel._default_manager.select_related(*PROFILE_RELATIONS).get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        try:
+            user = await UserModel._default_manager.select_related(*PROFILE_RELATIONS).aget(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
+def resolve_role(user):
+    """('nurse' | 'doctor' | None, profile or None) for a user; free when loaded by ProfileModelBackend."""
+    if not user.is_authenticated:
+        return None, None
+    for role in PROFILE_RELATIONS:
+        try:
+            return role, getattr(user, role)
+        except ObjectDoesNotExist:
+            continue
+    return None, None
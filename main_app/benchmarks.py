@@ -0,0 +1,516 @@
+# main_app/benchmarks.py
+"""
+Benchmarks run with `python manage.py benchmark <name> [--size N]`.
+
+The command creates a throwaway on-disk SQLite database before calling a
+benchmark, so each function may freely create and delete rows. A benchmark
+takes the requested size (or None for its default) and returns a JSON-able dict.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import jdatetime
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError, close_old_connections, connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+import numpy as np
+import pandas as pd
+
+from .models import Nurse, Patient, VitalSigns
+from .services import g4f_provider
+from .services import ai_summary_async
+from .services.alert_rules import alerts_frame, evaluate_masks
+from .services.bulk_import import import_file
+from .services.synthetic import seed_synthetic
+from .services.vitals_export import stream_vital_signs
+from .services.vitals_import import import_vitals_frame
+from .services.vitals_ingest import create_token
+from .services.workbook_import import import_workbook
+from .services.vitals_series import SeriesCache
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+def synthetic_vitals_frame(rows, start=jdatetime.date(1380, 1, 1), seed=0):
+    """A monitor-export-like DataFrame with one reading per day and Jalali date strings."""
+    rng = np.random.default_rng(seed)
+    dates = [(start + jdatetime.timedelta(days=i)).strftime('%Y-%m-%d') for i in range(rows)]
+    return pd.DataFrame({
+        'date': dates,
+        'blood_pressure_systolic': rng.integers(95, 165, rows),
+        'blood_pressure_diastolic': rng.integers(55, 100, rows),
+        'heart_rate': rng.integers(50, 130, rows),
+        'blood_sugar': rng.integers(70, 220, rows),
+        'body_temperature': np.round(rng.normal(37.0, 0.7, rows), 1),
+    })
+
+
+def _timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - t0
+
+
+def _legacy_upload_excel(df, patient):
+    """The pre-engine upload_excel loop: get_or_create + save per row, autocommit."""
+    for _, row in df.iterrows():
+        vital_sign, created = VitalSigns.objects.get_or_create(
+            patient=patient,
+            date=row['date'],
+            defaults={c: row[c] for c in df.columns if c != 'date'},
+        )
+        if not created:
+            for c in df.columns:
+                if c != 'date':
+                    setattr(vital_sign, c, row[c])
+            vital_sign.save()
+
+
+@benchmark('excel_import')
+def excel_import(size=None):
+    rows = size or 10000
+    df = synthetic_vitals_frame(rows)
+    legacy_patient = Patient.objects.create(first_name='legacy', last_name='bench')
+    bulk_patient = Patient.objects.create(first_name='bulk', last_name='bench')
+
+    result = {'rows': rows}
+    result['legacy_insert_s'] = _timed(_legacy_upload_excel, df, legacy_patient)
+    result['legacy_update_s'] = _timed(_legacy_upload_excel, df, legacy_patient)
+    result['bulk_insert_s'] = _timed(import_vitals_frame, df, patient=bulk_patient)
+    result['bulk_update_s'] = _timed(import_vitals_frame, df, patient=bulk_patient)
+    result['insert_speedup'] = result['legacy_insert_s'] / result['bulk_insert_s']
+    result['update_speedup'] = result['legacy_update_s'] / result['bulk_update_s']
+    return result
+
+
+@benchmark('export_memory')
+def export_memory(size=None):
+    """Peak Python heap while streaming each export format, for a small and a large history."""
+    sizes = [100, size or 100000]
+    result = {}
+    for rows in sizes:
+        patient = Patient.objects.create(first_name='export', last_name=str(rows))
+        import_vitals_frame(synthetic_vitals_frame(rows), patient=patient)
+        for fmt in ('csv', 'xlsx', 'parquet'):
+            # Trace from before the call, so anything it loads up front counts too
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            try:
+                stream, _, _ = stream_vital_signs(patient, fmt)
+            except ValueError as e:
+                tracemalloc.stop()
+                result[f'{fmt}_{rows}'] = str(e)
+                continue
+            total = sum(len(block) for block in stream)
+            elapsed = time.perf_counter() - t0
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result[f'{fmt}_{rows}'] = {'bytes': total, 'seconds': elapsed, 'peak_heap_kb': peak // 1024}
+    return result
+
+
+def _noop(client):
+    return client
+
+
+@benchmark('g4f_setup')
+def g4f_setup(size=None):
+    """
+    Per-request overhead before the first byte goes to a provider: the old
+    per-call cookie read + Client() + ThreadPoolExecutor against the shared manager.
+    """
+    if g4f_provider.Client is None:
+        return {'error': 'g4f is not installed'}
+    calls = size or 200
+    cookies_dir = tempfile.mkdtemp()
+    with open(os.path.join(cookies_dir, 'bench.json'), 'w') as fh:
+        fh.write('[]')
+
+    def legacy():
+        g4f_provider.set_cookies_dir(cookies_dir)
+        g4f_provider.read_cookie_files()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pool.submit(lambda: g4f_provider.Client()).result()
+
+    manager = g4f_provider.ProviderManager(cookies_dir, max_workers=1)
+
+    def managed():
+        manager.ensure_cookies()
+        manager.submit(_noop).result()
+
+    managed()  # first call loads cookies and builds the worker's client
+    result = {'calls': calls}
+    result['per_call_ms'] = _timed(lambda: [legacy() for _ in range(calls)]) / calls * 1000
+    result['manager_ms'] = _timed(lambda: [managed() for _ in range(calls)]) / calls * 1000
+    result['speedup'] = result['per_call_ms'] / result['manager_ms']
+    manager.shutdown()
+    return result
+
+
+def synthetic_readings_frame(rows, seed=0):
+    """Readings for many patients, the shape alerts_frame takes (no database involved)."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'patient_id': rng.integers(1, rows // 100 + 2, rows),
+        'vital_signs_id': np.arange(1, rows + 1),
+        'date': np.zeros(rows, dtype='datetime64[D]'),
+        'blood_pressure_systolic': rng.integers(95, 165, rows),
+        'blood_pressure_diastolic': rng.integers(55, 100, rows),
+        'heart_rate': rng.integers(50, 130, rows),
+        'blood_sugar': rng.integers(70, 220, rows),
+        'body_temperature': np.round(rng.normal(37.0, 1.2, rows), 1),
+        'age': rng.integers(1, 95, rows),
+    })
+
+
+@benchmark('alert_rules')
+def alert_rules(size=None):
+    """Time to evaluate the rule table over `size` readings (default 1M)."""
+    rows = size or 1000000
+    frame = synthetic_readings_frame(rows)
+    result = {'rows': rows}
+    result['masks_s'] = _timed(evaluate_masks, frame)
+    t0 = time.perf_counter()
+    hits = alerts_frame(frame)
+    result['alerts_frame_s'] = time.perf_counter() - t0
+    result['alerts'] = len(hits)
+    result['readings_per_s'] = rows / result['alerts_frame_s']
+    return result
+
+
+@benchmark('profiling_overhead')
+def profiling_overhead(size=None):
+    """Mean latency of the nurse dashboard and patient page with and without ProfilingMiddleware."""
+    requests = size or 200
+    seed_synthetic(50, 60)
+    user = User.objects.create_user('bench-nurse', password='bench')
+    Nurse.objects.create(user=user)
+    patient = Patient.objects.latest('pk')
+    urls = ['/nurse_dashboard/', f'/patient_nr/{patient.pk}/']
+    without = [m for m in settings.MIDDLEWARE if m != 'main_app.middleware.ProfilingMiddleware']
+
+    def run():
+        client = Client()
+        client.force_login(user)
+        for url in urls:
+            client.get(url)
+        t0 = time.perf_counter()
+        for i in range(requests):
+            client.get(urls[i % len(urls)])
+        return (time.perf_counter() - t0) / requests * 1000
+
+    result = {'requests': requests}
+    with override_settings(ALLOWED_HOSTS=['*'], PROFILING_ENABLED=True):
+        result['with_profiling_ms'] = run()
+    with override_settings(ALLOWED_HOSTS=['*'], MIDDLEWARE=without):
+        result['without_profiling_ms'] = run()
+    result['overhead_pct'] = (result['with_profiling_ms'] / result['without_profiling_ms'] - 1) * 100
+    return result
+
+
+@benchmark('async_summary_concurrency')
+def async_summary_concurrency(size=None):
+    """
+    `size` (default 500) summaries pending at once on one event loop against a provider
+    that answers after one second: wall time and the process's peak thread count.
+    """
+    pending = size or 500
+    latency = 1.0
+    patient = Patient(first_name='بنچمارک', last_name='همزمانی', age=50)
+    threads = [threading.active_count()]
+
+    async def create(model, **kwargs):
+        threads.append(threading.active_count())
+        await asyncio.sleep(latency)
+        return mock.Mock(choices=[mock.Mock(message=mock.Mock(content='خلاصه'))])
+
+    manager = mock.Mock()
+    manager.async_client.return_value.chat.completions.create = create
+
+    async def run():
+        return await asyncio.gather(*[
+            ai_summary_async.agenerate_patient_summary_with_source(patient, []) for _ in range(pending)
+        ])
+
+    with mock.patch.object(ai_summary_async, 'get_provider_manager', return_value=manager), \
+            mock.patch.object(ai_summary_async, 'AsyncClient', object):
+        t0 = time.perf_counter()
+        results = asyncio.run(run())
+        elapsed = time.perf_counter() - t0
+    return {
+        'pending': pending,
+        'provider_latency_s': latency,
+        'seconds': elapsed,
+        'answered': sum(1 for _, _, source in results if source == ai_summary_async.SOURCE_AI),
+        'peak_threads': max(threads),
+        # The sync path holds one executor thread per pending call
+        'sync_executor_seconds': pending / getattr(settings, 'AI_SUMMARY_MAX_WORKERS', g4f_provider.DEFAULT_MAX_WORKERS) * latency,
+    }
+
+
+def _chart_lists_from_instances(patient):
+    """The pre-cache chart path: model instances, one strftime per row, six Python lists."""
+    rows = list(VitalSigns.objects.filter(patient=patient).order_by('date'))
+    return (
+        [vs.date.strftime('%Y-%m-%d') for vs in rows],
+        [vs.blood_pressure_systolic for vs in rows],
+        [vs.blood_pressure_diastolic for vs in rows],
+        [vs.heart_rate for vs in rows],
+        [vs.blood_sugar for vs in rows],
+        [vs.body_temperature for vs in rows],
+    )
+
+
+def _traced(fn, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    value = fn(*args)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, {'seconds': elapsed, 'peak_heap_kb': peak // 1024}
+
+
+@benchmark('vitals_series')
+def vitals_series(size=None):
+    """Reading one patient's `size` (default 20000) readings: model instances vs the series cache."""
+    rows = size or 20000
+    patient = Patient.objects.create(first_name='series', last_name='bench')
+    import_vitals_frame(synthetic_vitals_frame(rows), patient=patient)
+    cache = SeriesCache()
+
+    _, result_instances = _traced(_chart_lists_from_instances, patient)
+    series, result_cold = _traced(cache.get, patient.pk)
+    _, result_warm = _traced(cache.get, patient.pk)
+    return {
+        'rows': rows,
+        'instances': result_instances,
+        'series_cold': result_cold,
+        'series_warm': result_warm,
+        'series_bytes': series.nbytes,
+    }
+
+
+def _percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000) if samples else None
+
+
+# Writers pause between saves like a nurse between patients; back-to-back writers starve
+# each other under busy_timeout polling, which is not the workload being measured
+WRITER_PAUSE = 0.05
+
+
+def _reader_writer_run(patient_ids, readers, writers, seconds):
+    """Readers load a patient page's rows while writers save readings; one "request" per loop."""
+    stop = threading.Event()
+    latencies = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    lock = threading.Lock()
+
+    def read(rng):
+        patient_id = int(rng.choice(patient_ids))
+        Patient.objects.get(pk=patient_id)
+        list(VitalSigns.objects.filter(patient_id=patient_id).order_by('-date')[:50])
+
+    def write(rng):
+        with transaction.atomic():
+            reading = VitalSigns.objects.filter(patient_id=int(rng.choice(patient_ids))).order_by('?').first()
+            reading.heart_rate = int(rng.integers(50, 130))
+            reading.save()
+
+    def worker(kind, op, seed):
+        rng = np.random.default_rng(seed)
+        try:
+            while not stop.wait(WRITER_PAUSE if kind == 'write' else 0):
+                t0 = time.perf_counter()
+                try:
+                    op(rng)
+                except OperationalError:
+                    with lock:
+                        errors[kind] += 1
+                else:
+                    with lock:
+                        latencies[kind].append(time.perf_counter() - t0)
+                # End of "request": CONN_MAX_AGE decides whether the connection survives
+                close_old_connections()
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=('read', read, i)) for i in range(readers)]
+    threads += [threading.Thread(target=worker, args=('write', write, 100 + i)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return {
+        kind: {
+            'ops_per_s': len(latencies[kind]) / seconds,
+            'p50_ms': _percentile_ms(latencies[kind], 50),
+            'p99_ms': _percentile_ms(latencies[kind], 99),
+            'errors': errors[kind],
+        }
+        for kind in ('read', 'write')
+    }
+
+
+@benchmark('sqlite_concurrency')
+def sqlite_concurrency(size=None):
+    """
+    Throughput and p99 of 6 reader and 2 writer threads for `size` (default 5) seconds,
+    with plain SQLite (rollback journal, deferred transactions, a connection per request)
+    and with the production profile from settings (WAL, PRAGMAs, IMMEDIATE, persistent).
+    """
+    seconds = size or 5
+    seed_synthetic(200, 30)
+    patient_ids = np.array(Patient.objects.values_list('pk', flat=True))
+    db = connection.settings_dict
+    production = {'OPTIONS': dict(db['OPTIONS']), 'CONN_MAX_AGE': db['CONN_MAX_AGE']}
+    plain = {'OPTIONS': {}, 'CONN_MAX_AGE': 0}
+
+    result = {'seconds': seconds, 'readers': 6, 'writers': 2}
+    try:
+        for name, profile, journal_mode in (('plain', plain, 'DELETE'), ('production', production, 'WAL')):
+            # Thread connections are built from this same settings dict. The journal mode is
+            # persistent and can only be switched while no other connection is open.
+            connection.close()
+            db.update(profile)
+            with connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+            connection.close()
+            result[name] = _reader_writer_run(patient_ids, readers=6, writers=2, seconds=seconds)
+    finally:
+        connection.close()
+        db.update(production)
+    return result
+
+
+def _ingest_batch(patient_ids, days, start, rng):
+    """One gateway batch: `days` consecutive daily readings for each patient, as JSON."""
+    dates = [(start + jdatetime.timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days)]
+    rows = len(patient_ids) * days
+    columns = {
+        'blood_pressure_systolic': rng.integers(95, 165, rows).tolist(),
+        'blood_pressure_diastolic': rng.integers(55, 100, rows).tolist(),
+        'heart_rate': rng.integers(50, 130, rows).tolist(),
+        'blood_sugar': rng.integers(70, 220, rows).tolist(),
+        'body_temperature': np.round(rng.normal(37.0, 0.7, rows), 1).tolist(),
+    }
+    readings = [
+        {'patient_id': pid, 'date': date, **{k: v[i] for k, v in columns.items()}}
+        for i, (pid, date) in enumerate((pid, date) for pid in patient_ids for date in dates)
+    ]
+    return json.dumps({'readings': readings})
+
+
+@benchmark('ingest_api')
+def ingest_api(size=None):
+    """
+    `size` (default 10) POSTs of 10000 new readings (200 patients x 50 days) to the JSON
+    ingestion endpoint, then the first batch again as updates; readings/s end to end.
+    """
+    batches = size or 10
+    rng = np.random.default_rng(0)
+    seed_synthetic(200, 0)
+    patient_ids = list(Patient.objects.values_list('pk', flat=True))
+    _, key = create_token('bench')
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {key}')
+    bodies = [_ingest_batch(patient_ids, 50, jdatetime.date(1380, 1, 1) + jdatetime.timedelta(days=50 * b), rng)
+              for b in range(batches)]
+
+    def post(body):
+        t0 = time.perf_counter()
+        response = client.post('/api/vitals/batch/', body, content_type='application/json')
+        elapsed = time.perf_counter() - t0
+        assert response.status_code == 200, response.content[:200]
+        return elapsed, response.json()
+
+    with override_settings(ALLOWED_HOSTS=['*']):
+        inserts = [post(body) for body in bodies]
+        update_s, update = post(bodies[0])
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        journal_mode = cursor.fetchone()[0]
+
+    insert_s = [elapsed for elapsed, _ in inserts]
+    readings = 200 * 50
+    return {
+        'journal_mode': journal_mode,
+        'batches': batches,
+        'batch_readings': readings,
+        'inserted': sum(body['inserted'] for _, body in inserts),
+        'insert_readings_per_s': round(readings * batches / sum(insert_s)),
+        'insert_batch_p50_ms': _percentile_ms(insert_s, 50),
+        'insert_batch_max_ms': round(max(insert_s) * 1000, 1),
+        'updated': update['updated'],
+        'update_readings_per_s': round(readings / update_s),
+    }
+
+
+@benchmark('bulk_import')
+def bulk_import(size=None):
+    """
+    rows/s of `manage.py import_vitals` on a `size`-row (default 500000) CSV for 500 new
+    patients, with one parser process and with one per CPU (the writer is always one process).
+    """
+    rows = size or 500000
+    result = {'rows': rows, 'cpus': os.cpu_count()}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, workers in (('one_parser', 1), ('parallel', os.cpu_count())):
+            # Fresh patients per run, so both runs insert rather than update
+            patient_ids = [p.pk for p in Patient.objects.bulk_create(Patient(first_name=name, last_name=str(i)) for i in range(500))]
+            frame = synthetic_vitals_frame(rows // len(patient_ids) + 1)
+            frame = pd.concat([frame.assign(patient_id=pid) for pid in patient_ids], ignore_index=True)[:rows]
+            path = os.path.join(tmp, f'{name}.csv')
+            frame.to_csv(path, index=False)
+
+            t0 = time.perf_counter()
+            imported, _ = import_file(path, patient_column='patient_id', workers=workers)
+            elapsed = time.perf_counter() - t0
+            result[name] = {'workers': workers, 'seconds': round(elapsed, 2),
+                            'rows_per_s': round(rows / elapsed), 'inserted': imported.inserted}
+    return result
+
+
+@benchmark('workbook_import')
+def workbook_import(size=None):
+    """
+    Seconds to import a 40-sheet ward workbook (`size` days per patient, default 365)
+    parsing the sheets in-process, then on the sheet pool cold (spawning it) and warm.
+    """
+    days = size or 365
+    pool = max(os.cpu_count() or 1, 2)
+    result = {'sheets': 40, 'days': days, 'cpus': os.cpu_count()}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, workers in (('in_process', 1), ('pool_cold', pool), ('pool_warm', pool)):
+            # Fresh patients per run, so every run inserts rather than updates
+            patients = Patient.objects.bulk_create(Patient(first_name=name, last_name=str(i)) for i in range(40))
+            path = os.path.join(tmp, f'{name}.xlsx')
+            with pd.ExcelWriter(path) as writer:
+                for patient in patients:
+                    synthetic_vitals_frame(days).to_excel(writer, sheet_name=str(patient.pk), index=False)
+
+            with override_settings(WORKBOOK_IMPORT_WORKERS=workers):
+                t0 = time.perf_counter()
+                imported = import_workbook(path)
+                elapsed = time.perf_counter() - t0
+            result[name] = {'workers': workers, 'seconds': round(elapsed, 2), 'inserted': imported.inserted}
+    return result
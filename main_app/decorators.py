@@ -1,11 +1,47 @@
 # main_app/decorators.py
 
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
 from django.core.exceptions import PermissionDenied
+from django.http import JsonResponse
+
+from .services.vitals_ingest import authenticate as authenticate_ingest_token
 
 def nurse_required(function):
     def wrap(request, *args, **kwargs):
-        if request.user.is_authenticated and hasattr(request.user, 'nurse'):
+        # request.role is set by RoleMiddleware from the user/profile loaded in one query
+        if getattr(request, 'role', None) == 'nurse':
             return function(request, *args, **kwargs)
         else:
             raise PermissionDenied
     return wrap
+
+def doctor_required(function):
+    # Works for sync and async views alike (the live feed views are async)
+    if iscoroutinefunction(function):
+        @wraps(function)
+        async def wrap(request, *args, **kwargs):
+            if getattr(request, 'role', None) != 'doctor':
+                raise PermissionDenied
+            return await function(request, *args, **kwargs)
+    else:
+        @wraps(function)
+        def wrap(request, *args, **kwargs):
+            if getattr(request, 'role', None) != 'doctor':
+                raise PermissionDenied
+            return function(request, *args, **kwargs)
+    return wrap
+
+def ingest_token_required(function):
+    # Device API: a bearer IngestToken instead of a session; sets request.ingest_token
+    @wraps(function)
+    def wrap(request, *args, **kwargs):
+        token = authenticate_ingest_token(request)
+        if token is None:
+            response = JsonResponse({'error': 'توکن دسترسی نامعتبر است.'}, status=401)
+            response['WWW-Authenticate'] = 'Bearer'
+            return response
+        request.ingest_token = token
+        return function(request, *args, **kwargs)
+    return wrap
@@ -26,6 +26,19 @@ class VitalSignsForm(forms.ModelForm):
         model = VitalSigns
         fields = ['date', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'heart_rate', 'blood_sugar', 'body_temperature']
 
+    def __init__(self, *args, patient=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # patient is not a form field, so the (patient, date) constraint is checked here
+        self.patient = patient
+
+    def clean_date(self):
+        date = self.cleaned_data['date']
+        if self.patient is not None:
+            clash = VitalSigns.objects.filter(patient=self.patient, date=date).exclude(pk=self.instance.pk)
+            if clash.exists():
+                raise forms.ValidationError("برای این تاریخ قبلاً علائم حیاتی ثبت شده است.")
+        return date
+
 
 class PatientForm(forms.ModelForm):
     class Meta:
@@ -77,4 +90,7 @@ class DoctorProfileForm(forms.ModelForm):
 
 class ExcelUploadForm(forms.Form):
     file = forms.FileField(label="فایل اکسل", widget=forms.FileInput(attrs={'accept': '.xlsx'}))
-    patient = forms.ModelChoiceField(queryset=Patient.objects.all(), label="بیمار")
\ No newline at end of file
+    patient = forms.ModelChoiceField(
+        queryset=Patient.objects.all(), label="بیمار", required=False,
+        help_text="برای فایل چندبیماره خالی بگذارید: ستون patient_id یا یک شیت برای هر بیمار که نامش با شناسه بیمار شروع می‌شود.",
+    )
\ No newline at end of file
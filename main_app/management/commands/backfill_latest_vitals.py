@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from main_app.models import LatestVitals
+from main_app.services.alerts import sync_alerts
+from main_app.services.latest_vitals import rebuild_latest_vitals
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the LatestVitals projection (one row per patient) from VitalSigns, "
+        "then bring the persisted alerts up to date with it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = rebuild_latest_vitals(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"LatestVitals rebuilt for {count} patients."))
+        sync_alerts(LatestVitals.objects.values_list('patient_id', flat=True))
+        self.stdout.write(self.style.SUCCESS("Alerts synced."))
@@ -0,0 +1,33 @@
+import json
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from main_app.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = "Run a named benchmark from main_app.benchmarks against a throwaway on-disk database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(BENCHMARKS))
+        parser.add_argument('--size', type=int, default=None, help="Problem size (benchmark-specific default).")
+        parser.add_argument('--output', help="Append the JSON result to this file (one line per run).")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            # On disk rather than SQLite's in-memory test DB, so commit/fsync costs are real
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tmp, 'benchmark.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                result = BENCHMARKS[options['name']](options['size'])
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        result = {'benchmark': options['name'], **result}
+        if options['output']:
+            with open(options['output'], 'a', encoding='utf-8') as fh:
+                fh.write(json.dumps(result, ensure_ascii=False) + '\n')
+        self.stdout.write(json.dumps(result, ensure_ascii=False, indent=2))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from main_app.services.vitals_ingest import create_token
+
+
+class Command(BaseCommand):
+    help = "Create an API token for a bedside monitor or ward gateway and print its key (shown only once)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help="Device or gateway name, e.g. 'ICU-2 gateway'")
+
+    def handle(self, *args, **options):
+        token, key = create_token(options['name'])
+        self.stdout.write(self.style.SUCCESS(f"Token {token.pk} ({token.name}) created."))
+        self.stdout.write(f"Authorization: Bearer {key}")
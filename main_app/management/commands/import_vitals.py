@@ -0,0 +1,65 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.models import Patient
+from main_app.services.bulk_import import CHUNK_ROWS, CheckpointMismatch, import_file
+
+MAX_ERROR_LINES = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a large CSV/xlsx dump of vital signs: chunks are parsed and validated in a "
+        "process pool and written by this process with bulk upserts, with a resumable checkpoint. "
+        "Only CSV is read in parallel; an xlsx sheet is streamed by this process and only its "
+        "validation runs in the pool, so convert big workbooks to CSV first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or xlsx (first sheet) file with date and the vital columns.")
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--patient', type=int, help="Patient id every row belongs to.")
+        target.add_argument('--patient-column', help="Column holding each row's patient id, e.g. patient_id.")
+        parser.add_argument('--workers', type=int, default=None, help="Parser processes (default: CPU count).")
+        parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="Rows per chunk (approximate for CSV).")
+        parser.add_argument('--checkpoint', help="Checkpoint file (default: <path>.checkpoint.json).")
+        parser.add_argument('--resume', action='store_true', help="Continue after the chunks the checkpoint records.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"File not found: {path}")
+        patient = None
+        if options['patient'] is not None:
+            patient = Patient.objects.filter(pk=options['patient']).first()
+            if patient is None:
+                raise CommandError(f"Patient {options['patient']} does not exist.")
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint.json'
+
+        def progress(checkpoint, rows_per_s, fraction):
+            done = f" ({fraction:.0%})" if fraction is not None else ''
+            self.stdout.write(
+                f"chunk {checkpoint.done_chunks}{done}: {checkpoint.rows:,} rows, "
+                f"{checkpoint.inserted:,} inserted, {checkpoint.updated:,} updated, "
+                f"{checkpoint.rejected:,} rejected | {rows_per_s:,.0f} rows/s"
+            )
+
+        try:
+            result, checkpoint = import_file(
+                path, patient=patient, patient_column=options['patient_column'], workers=options['workers'],
+                chunk_rows=options['chunk_rows'], checkpoint_path=checkpoint_path, resume=options['resume'],
+                progress=progress,
+            )
+        except (CheckpointMismatch, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in result.errors[:MAX_ERROR_LINES]:
+            self.stderr.write(error)
+        if result.rejected > MAX_ERROR_LINES:
+            self.stderr.write(f"... and {result.rejected - MAX_ERROR_LINES} more rejected rows.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {checkpoint.rows:,} rows in {checkpoint.done_chunks} chunks; this run inserted "
+            f"{result.inserted:,}, updated {result.updated:,} and rejected {result.rejected:,}. "
+            f"Checkpoint: {checkpoint_path}"
+        ))
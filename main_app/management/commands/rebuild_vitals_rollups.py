@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from main_app.services.rollups import BATCH_SIZE, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily and weekly VitalsRollup rows of every patient from VitalSigns."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Patients per batch")
+
+    def handle(self, *args, **options):
+        count = rebuild_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{count} rollup rows written."))
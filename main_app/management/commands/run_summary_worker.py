@@ -0,0 +1,40 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main_app.services.summary_jobs import claim_next_job, purge_finished_jobs, run_job
+
+PURGE_EVERY = 300  # seconds
+
+
+class Command(BaseCommand):
+    help = "Process queued AI summary jobs (run one or more of these next to the web server)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"Summary worker {worker_id} started.")
+        last_purge = 0.0
+
+        while True:
+            close_old_connections()
+            if time.monotonic() - last_purge > PURGE_EVERY:
+                purge_finished_jobs()
+                last_purge = time.monotonic()
+
+            job = claim_next_job(worker_id)
+            if job is None:
+                if options['burst']:
+                    self.stdout.write(self.style.SUCCESS("Queue empty, exiting."))
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Running job {job.pk} (patient {job.patient_id}, attempt {job.attempts}).")
+            run_job(job)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from main_app.services.synthetic import seed_synthetic
+
+
+class Command(BaseCommand):
+    help = "Create synthetic patients with daily, Jalali-dated vital signs in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=100)
+        parser.add_argument('--vitals-per-patient', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for reproducible data sets.")
+
+    def handle(self, *args, **options):
+        counts = seed_synthetic(options['patients'], options['vitals_per_patient'], seed=options['seed'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {counts['patients']} patients and {counts['vital_signs']} vital signs."
+        ))
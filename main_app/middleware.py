@@ -0,0 +1,102 @@
+# main_app/middleware.py
+
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .backends import resolve_role
+from .services import profiling
+
+
+def _install_sql_wrapper():
+    connection.execute_wrappers.append(profiling.sql_wrapper)
+
+
+def _remove_sql_wrapper():
+    connection.execute_wrappers.remove(profiling.sql_wrapper)
+
+
+class ProfilingMiddleware:
+    """
+    Records query count, SQL time, template time and AI time per request, sends them
+    as a Server-Timing header and keeps the request in the profiling ring buffer.
+    Disabled with PROFILING_ENABLED = False. Place it first in MIDDLEWARE so session
+    and auth queries are included. Template time comes from the ProfiledDjangoTemplates
+    backend (main_app/template_backends.py) set in TEMPLATES.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profile = profiling.RequestProfile(method=request.method, path=request.path)
+        token = profiling.activate(profile)
+        t0 = time.perf_counter()
+        try:
+            with connection.execute_wrapper(profiling.sql_wrapper):
+                response = self.get_response(request)
+        finally:
+            profiling.deactivate(token)
+        return self._finish(profile, t0, response)
+
+    async def __acall__(self, request):
+        profile = profiling.RequestProfile(method=request.method, path=request.path)
+        token = profiling.activate(profile)
+        t0 = time.perf_counter()
+        # The ORM runs in the request's thread-sensitive worker thread; the wrapper has to be
+        # installed on that thread's connection, not on one created in the event loop thread
+        await sync_to_async(_install_sql_wrapper)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_remove_sql_wrapper)()
+            profiling.deactivate(token)
+        return self._finish(profile, t0, response)
+
+    def _finish(self, profile, t0, response):
+        # Streaming bodies are produced after this point; total covers time to first byte
+        profile.total_ms = (time.perf_counter() - t0) * 1000
+        profile.status = response.status_code
+        response['Server-Timing'] = profile.server_timing()
+        profiling.record(profile)
+        return response
+
+
+class RoleMiddleware:
+    """
+    Sets request.role ('nurse', 'doctor' or None) and request.profile (the Nurse/Doctor
+    row or None). Must come after AuthenticationMiddleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        request.role, request.profile = resolve_role(request.user)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # ProfileModelBackend.aget_user already joined the profiles, so this touches no database
+        request.role, request.profile = resolve_role(await request.auser())
+        return await self.get_response(request)
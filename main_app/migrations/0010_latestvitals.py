@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:05
+
+import django.db.models.deletion
+import django_jalali.db.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0009_alter_clinicalinfo_date_alter_vitalsigns_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestVitals',
+            fields=[
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='latest_vitals', serialize=False, to='main_app.patient')),
+                ('date', django_jalali.db.models.jDateField()),
+                ('vital_signs', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main_app.vitalsigns')),
+            ],
+        ),
+    ]
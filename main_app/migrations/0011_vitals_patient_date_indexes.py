@@ -0,0 +1,92 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:06
+
+import csv
+import datetime
+import logging
+
+import jdatetime
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+logger = logging.getLogger(__name__)
+
+# Same-day readings the unique constraint cannot hold are moved here, not lost; the
+# reverse migration puts them back.
+BACKUP_PATH = settings.BASE_DIR / 'migration_backups' / '0011_duplicate_vitals.csv'
+BACKUP_FIELDS = [
+    'id', 'patient_id', 'date', 'blood_pressure_systolic', 'blood_pressure_diastolic',
+    'heart_rate', 'blood_sugar', 'body_temperature',
+]
+
+
+def move_duplicate_vitals(apps, schema_editor):
+    """
+    Keep the newest row (highest id) for each (patient, date) before adding the constraint.
+    The older rows are written to BACKUP_PATH (dates in Gregorian ISO form) and logged, then deleted.
+    """
+    VitalSigns = apps.get_model('main_app', 'VitalSigns')
+    dupes = (
+        VitalSigns.objects.values('patient', 'date')
+        .annotate(n=Count('id'), keep=Max('id'))
+        .filter(n__gt=1)
+    )
+    rows = []
+    for dupe in dupes:
+        rows.extend(
+            VitalSigns.objects.filter(patient=dupe['patient'], date=dupe['date'])
+            .exclude(id=dupe['keep']).order_by('id').values(*BACKUP_FIELDS)
+        )
+    if not rows:
+        return
+
+    BACKUP_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(BACKUP_PATH, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=BACKUP_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({**row, 'date': row['date'].togregorian().isoformat()})
+    logger.warning(
+        "0011: moved %d same-day duplicate vital signs rows (ids %s) to %s; "
+        "migrating back to 0010 restores them.",
+        len(rows), ', '.join(str(row['id']) for row in rows), BACKUP_PATH,
+    )
+    VitalSigns.objects.filter(id__in=[row['id'] for row in rows]).delete()
+
+
+def restore_duplicate_vitals(apps, schema_editor):
+    """Re-insert the rows saved by move_duplicate_vitals (runs after the constraint is dropped)."""
+    if not BACKUP_PATH.exists():
+        return
+    VitalSigns = apps.get_model('main_app', 'VitalSigns')
+    with open(BACKUP_PATH, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    VitalSigns.objects.bulk_create([
+        VitalSigns(
+            id=int(row['id']), patient_id=int(row['patient_id']),
+            date=jdatetime.date.fromgregorian(date=datetime.date.fromisoformat(row['date'])),
+            body_temperature=float(row['body_temperature']),
+            **{name: int(row[name]) for name in BACKUP_FIELDS[3:-1]},
+        )
+        for row in rows
+    ], ignore_conflicts=True)
+    logger.warning("0011 reversed: restored %d vital signs rows from %s.", len(rows), BACKUP_PATH)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0010_latestvitals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(condition=models.Q(('emergency', True)), fields=['created_at'], name='patient_emergency_created_idx'),
+        ),
+        migrations.RunPython(move_duplicate_vitals, restore_duplicate_vitals),
+        migrations.AddConstraint(
+            model_name='vitalsigns',
+            constraint=models.UniqueConstraint(fields=('patient', 'date'), name='vitalsigns_patient_date_uniq'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:16
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0012_aisummarycache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SummaryJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('queued', 'در صف'), ('running', 'در حال اجرا'), ('done', 'انجام شد'), ('failed', 'ناموفق')], default='queued', max_length=10)),
+                ('summary', models.TextField(blank=True, default='')),
+                ('error', models.TextField(blank=True, default='')),
+                ('source', models.CharField(blank=True, default='', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('worker', models.CharField(blank=True, default='', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main_app.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='summaryjob_status_created_idx'), models.Index(fields=['patient', 'status'], name='summaryjob_patient_status_idx')],
+            },
+        ),
+    ]
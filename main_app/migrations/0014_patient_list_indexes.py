@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:24
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0013_summaryjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['created_at'], name='patient_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(django.db.models.functions.comparison.Collate('first_name', 'nocase'), name='patient_first_name_ci_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(django.db.models.functions.comparison.Collate('last_name', 'nocase'), name='patient_last_name_ci_idx'),
+        ),
+    ]
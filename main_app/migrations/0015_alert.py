@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:37
+
+import django.db.models.deletion
+import django_jalali.db.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0014_patient_list_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Alert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', django_jalali.db.models.jDateField()),
+                ('code', models.CharField(max_length=30)),
+                ('severity', models.CharField(choices=[('warning', 'هشدار'), ('high', 'شدید'), ('critical', 'بحرانی')], max_length=10)),
+                ('label', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('active', 'فعال'), ('dismissed', 'بررسی شده'), ('resolved', 'برطرف شده')], default='active', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('dismissed_at', models.DateTimeField(blank=True, null=True)),
+                ('dismissed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='main_app.patient')),
+                ('vital_signs', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='main_app.vitalsigns')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'patient'], name='alert_status_patient_idx')],
+                'constraints': [models.UniqueConstraint(fields=('vital_signs', 'code'), name='alert_vitals_code_uniq')],
+            },
+        ),
+    ]
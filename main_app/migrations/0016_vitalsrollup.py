@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:42
+
+import django.db.models.deletion
+import django_jalali.db.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0015_alert'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VitalsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'روزانه'), ('week', 'هفتگی')], max_length=4)),
+                ('period_start', django_jalali.db.models.jDateField()),
+                ('count', models.IntegerField()),
+                ('blood_pressure_systolic_min', models.FloatField()),
+                ('blood_pressure_systolic_max', models.FloatField()),
+                ('blood_pressure_systolic_mean', models.FloatField()),
+                ('blood_pressure_diastolic_min', models.FloatField()),
+                ('blood_pressure_diastolic_max', models.FloatField()),
+                ('blood_pressure_diastolic_mean', models.FloatField()),
+                ('heart_rate_min', models.FloatField()),
+                ('heart_rate_max', models.FloatField()),
+                ('heart_rate_mean', models.FloatField()),
+                ('blood_sugar_min', models.FloatField()),
+                ('blood_sugar_max', models.FloatField()),
+                ('blood_sugar_mean', models.FloatField()),
+                ('body_temperature_min', models.FloatField()),
+                ('body_temperature_max', models.FloatField()),
+                ('body_temperature_mean', models.FloatField()),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='main_app.patient')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('patient', 'period', 'period_start'), name='rollup_patient_period_start_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:51
+
+import django_jalali.db.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0016_vitalsrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summaryjob',
+            name='date_from',
+            field=django_jalali.db.models.jDateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='summaryjob',
+            name='date_to',
+            field=django_jalali.db.models.jDateField(blank=True, null=True),
+        ),
+    ]
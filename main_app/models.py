@@ -1,4 +1,7 @@
+import uuid
+
 from django.db import models
+from django.db.models.functions import Collate
 from django.contrib.auth.models import User
 from django.utils import timezone
 import django_jalali.db.models as jmodels
@@ -12,6 +15,18 @@ class Patient(models.Model):
     medications = models.TextField(default='')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Dashboards filter on emergency and list newest first. Django emits a bare
+            # boolean predicate, which SQLite can only match against a partial index.
+            models.Index(fields=['created_at'], condition=models.Q(emergency=True), name='patient_emergency_created_idx'),
+            # Keyset pagination walks (created_at, id); id is the rowid, implicit in every SQLite index
+            models.Index(fields=['created_at'], name='patient_created_idx'),
+            # istartswith compiles to LIKE 'x%', which SQLite turns into a range scan on NOCASE indexes
+            models.Index(Collate('first_name', 'nocase'), name='patient_first_name_ci_idx'),
+            models.Index(Collate('last_name', 'nocase'), name='patient_last_name_ci_idx'),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 class VitalSigns(models.Model):
@@ -23,9 +38,125 @@ class VitalSigns(models.Model):
     blood_sugar = models.IntegerField()
     body_temperature = models.FloatField()
 
+    class Meta:
+        constraints = [
+            # One reading per patient per day; the backing unique index on
+            # (patient, date) also serves every "filter(patient) order_by(-date)" query.
+            models.UniqueConstraint(fields=['patient', 'date'], name='vitalsigns_patient_date_uniq'),
+        ]
+
     def __str__(self):
         return f"Vital Signs for {self.patient} on {self.date}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored (patient, date), so signals can refresh what an edit moved the reading away from
+        loaded = dict(zip(field_names, values))
+        instance._loaded_key = (loaded.get('patient_id'), loaded.get('date'))
+        return instance
+
+class LatestVitals(models.Model):
+    """
+    One row per patient pointing at its most recent VitalSigns row.
+    Kept in sync by main_app.signals; rebuild with `manage.py backfill_latest_vitals`.
+    """
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, primary_key=True, related_name='latest_vitals')
+    vital_signs = models.ForeignKey(VitalSigns, on_delete=models.CASCADE, related_name='+')
+    date = jmodels.jDateField()
+
+    def __str__(self):
+        return f"Latest vital signs for {self.patient} on {self.date}"
+
+class VitalsRollup(models.Model):
+    """
+    Min/max/mean and reading count of each vital per patient per day and per ISO week
+    (period_start is the Monday). Kept current by main_app.signals through
+    services.rollups; rebuild with `manage.py rebuild_vitals_rollups`.
+    """
+    DAY = 'day'
+    WEEK = 'week'
+    PERIOD_CHOICES = [
+        (DAY, 'روزانه'),
+        (WEEK, 'هفتگی'),
+    ]
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='rollups')
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    period_start = jmodels.jDateField()
+    count = models.IntegerField()
+    blood_pressure_systolic_min = models.FloatField()
+    blood_pressure_systolic_max = models.FloatField()
+    blood_pressure_systolic_mean = models.FloatField()
+    blood_pressure_diastolic_min = models.FloatField()
+    blood_pressure_diastolic_max = models.FloatField()
+    blood_pressure_diastolic_mean = models.FloatField()
+    heart_rate_min = models.FloatField()
+    heart_rate_max = models.FloatField()
+    heart_rate_mean = models.FloatField()
+    blood_sugar_min = models.FloatField()
+    blood_sugar_max = models.FloatField()
+    blood_sugar_mean = models.FloatField()
+    body_temperature_min = models.FloatField()
+    body_temperature_max = models.FloatField()
+    body_temperature_mean = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Also serves every "one patient, one period, date range" read
+            models.UniqueConstraint(fields=['patient', 'period', 'period_start'], name='rollup_patient_period_start_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_period_display()} rollup for {self.patient} from {self.period_start}"
+
+class Alert(models.Model):
+    """
+    A clinical alert fired by services.alert_rules on a patient's latest reading.
+    Written by services.alerts.sync_alerts whenever vitals change; dismissing one is permanent.
+    """
+    ACTIVE = 'active'
+    DISMISSED = 'dismissed'
+    # The rule stopped firing, or a newer reading superseded this one
+    RESOLVED = 'resolved'
+    STATUS_CHOICES = [
+        (ACTIVE, 'فعال'),
+        (DISMISSED, 'بررسی شده'),
+        (RESOLVED, 'برطرف شده'),
+    ]
+    SEVERITY_CHOICES = [
+        ('warning', 'هشدار'),
+        ('high', 'شدید'),
+        ('critical', 'بحرانی'),
+    ]
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='alerts')
+    vital_signs = models.ForeignKey(VitalSigns, on_delete=models.CASCADE, related_name='alerts')
+    date = jmodels.jDateField()
+    code = models.CharField(max_length=30)
+    severity = models.CharField(max_length=10, choices=SEVERITY_CHOICES)
+    label = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=ACTIVE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    dismissed_at = models.DateTimeField(null=True, blank=True)
+    dismissed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['vital_signs', 'code'], name='alert_vitals_code_uniq'),
+        ]
+        indexes = [
+            # Dashboard: all active alerts; sync: one patient's active alerts
+            models.Index(fields=['status', 'patient'], name='alert_status_patient_idx'),
+        ]
+
+    @property
+    def message(self):
+        return f'بیمار {self.patient}: {self.label}'
+
+    def __str__(self):
+        return f"{self.label} for {self.patient} on {self.date} ({self.status})"
+
 class ClinicalInfo(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
     date = jmodels.jDateField()
@@ -56,3 +187,73 @@ class Doctor(models.Model):
         return self.user.username
     
 
+
+class AISummaryCache(models.Model):
+    """
+    Persisted AI summaries keyed by a hash of the exact prompt and model list.
+    Expired by AI_SUMMARY_CACHE_TTL and trimmed least-recently-used first.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='+')
+    model = models.CharField(max_length=100)
+    summary = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"AI summary for {self.patient} ({self.created_at})"
+
+class SummaryJob(models.Model):
+    """
+    Queued AI summary request, processed by `manage.py run_summary_worker`.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'در صف'),
+        (RUNNING, 'در حال اجرا'),
+        (DONE, 'انجام شد'),
+        (FAILED, 'ناموفق'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='+')
+    # Optional ?from=&to= range of the readings the summary covers
+    date_from = jmodels.jDateField(null=True, blank=True)
+    date_to = jmodels.jDateField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    summary = models.TextField(blank=True, default='')
+    error = models.TextField(blank=True, default='')
+    source = models.CharField(max_length=10, blank=True, default='')
+    attempts = models.IntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest queued job; the endpoint looks up a patient's open job
+            models.Index(fields=['status', 'created_at'], name='summaryjob_status_created_idx'),
+            models.Index(fields=['patient', 'status'], name='summaryjob_patient_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Summary job {self.id} for {self.patient} ({self.status})"
+
+
+class IngestToken(models.Model):
+    """
+    API token of a bedside monitor or ward gateway for the vitals ingestion endpoint.
+    Only the SHA-256 of the key is stored; `manage.py create_ingest_token` prints the key once.
+    """
+    name = models.CharField(max_length=100)
+    key_hash = models.CharField(max_length=64, unique=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
@@ -12,6 +12,9 @@ Usage (Django):
     from .services.ai_summary import generate_patient_summary
     summary_text, error_message = generate_patient_summary(patient, vital_signs_iterable)
 
+    # یا همراه با منبع خلاصه ("ai" یا "fallback"):
+    summary_text, error_message, source = generate_patient_summary_with_source(patient, vital_signs_iterable)
+
 Notes:
 - خروجی صرفاً برای کمک به تیم درمان است و جایگزین تصمیم پزشک نیست.
 """
@@ -21,15 +24,28 @@ from __future__ import annotations
 from typing import Iterable, Optional, Tuple, List
 import logging
 import time
-import os
-from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+from concurrent.futures import wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+
+from .alert_rules import alert_records, readings_frame
+from .g4f_provider import Client, get_provider_manager
+from .profiling import profiled
 
 logger = logging.getLogger("ai_summary")
 
+# ددلاین‌ها مشابه اسکریپت خبری
+PER_ATTEMPT_TIMEOUT = 50       # هر تلاش g4f حداکثر 8s
+OVERALL_DEADLINE   = 30     # سقف کل عملیات 15s
+MODEL_CANDIDATES   = ["gpt-5"]  # اگر 4o در g4f شما نباشد، نادیده گرفته می‌شود
+# timeout سطح اتصال هر درخواست g4f؛ thread اجراکننده حداکثر این‌قدر اشغال می‌ماند
+REQUEST_TIMEOUT    = min(PER_ATTEMPT_TIMEOUT, OVERALL_DEADLINE)
+
+# منبع خلاصه برگشتی
+SOURCE_AI = "ai"
+SOURCE_FALLBACK = "fallback"
+SOURCE_CACHE = "cache"
+
 # --- g4f optional import ---
 try:
-    from g4f.client import Client
-    from g4f.cookies import set_cookies_dir, read_cookie_files
     from g4f.Provider import OpenaiChat
     # در صورت نیاز می‌توانید Provider خاص هم ایمپورت کنید:
     # from g4f.Provider import OpenaiChat
@@ -66,6 +82,22 @@ def _format_vital_signs(vital_signs: Iterable) -> str:
             break
     return "\n".join(rows) if rows else "داده‌ای برای علائم حیاتی ثبت نشده است."
 
+def _format_weekly_trends(rollups) -> str:
+    """
+    روند هفتگی (میانگین و بازه هر شاخص) از ردیف‌های VitalsRollup، جدیدترین اول.
+    """
+    rows: List[str] = []
+    for r in rollups:
+        rows.append(
+            f"- هفته از {_safe(r.period_start)} ({r.count} خوانش) | فشار خون: "
+            f"{r.blood_pressure_systolic_mean:.0f}/{r.blood_pressure_diastolic_mean:.0f} "
+            f"(بازه {r.blood_pressure_systolic_min:.0f}–{r.blood_pressure_systolic_max:.0f}) | "
+            f"ضربان قلب: {r.heart_rate_mean:.0f} ({r.heart_rate_min:.0f}–{r.heart_rate_max:.0f}) | "
+            f"قند خون: {r.blood_sugar_mean:.0f} ({r.blood_sugar_min:.0f}–{r.blood_sugar_max:.0f}) | "
+            f"دمای بدن: {r.body_temperature_mean:.1f} ({r.body_temperature_min:.1f}–{r.body_temperature_max:.1f})"
+        )
+    return "\n".join(rows)
+
 def _build_user_prompt(patient, vital_signs: Iterable) -> str:
     """
     ساخت پرامپت فارسی برای تولید خلاصه بالینی ایمن و عملیاتی.
@@ -78,6 +110,9 @@ def _build_user_prompt(patient, vital_signs: Iterable) -> str:
     emergency = getattr(patient, "emergency", False)
 
     vitals_text = _format_vital_signs(vital_signs)
+    # روند بلندمدت از جدول rollup (rollups.attach_weekly_trends)، بدون کوئری در این تابع
+    trends_text = _format_weekly_trends(getattr(patient, "weekly_rollups", None) or [])
+    trends_section = f"\n\nروند هفتگی علائم حیاتی (میانگین و بازه):\n{trends_text}" if trends_text else ""
 
     return f"""
 اطلاعات پایه بیمار:
@@ -88,7 +123,7 @@ def _build_user_prompt(patient, vital_signs: Iterable) -> str:
 - داروهای فعلی/تجویزی: {meds or "ذکر نشده"}
 
 خلاصه علائم حیاتی اخیر:
-{vitals_text}
+{vitals_text}{trends_section}
 
 دستورالعمل:
 - لطفاً یک خلاصه بالینی کوتاه و ساختاریافته (تقریباً ۱۲۰ تا ۱۸۰ کلمه) به زبان فارسی ارائه کن.
@@ -108,6 +143,32 @@ def _system_prompt() -> str:
         " در صورت کمبود داده، آن را مطرح کرده و پیشنهاد جمع‌آوری داده بیشتر بدهید."
     )
 
+def build_messages(patient, vital_signs: Iterable) -> List[dict]:
+    """
+    پیام‌های ارسالی به مدل (system + user). کلید کش خلاصه‌ها هم از همین پیام‌ها ساخته می‌شود.
+    """
+    return [
+        {"role": "system", "content": _system_prompt()},
+        {"role": "user",  "content": _build_user_prompt(patient, vital_signs)},
+    ]
+
+def response_text(resp) -> Optional[str]:
+    """متن پاسخ g4f (choices[0].message.content) یا None."""
+    if getattr(resp, "choices", None):
+        msg = getattr(resp.choices[0], "message", None)
+        if msg and getattr(msg, "content", None):
+            return (msg.content or "").strip() or None
+    return None
+
+def delta_text(chunk) -> Optional[str]:
+    """متن یک chunk در حالت stream=True (choices[0].delta.content) یا None."""
+    if getattr(chunk, "choices", None):
+        delta = getattr(chunk.choices[0], "delta", None)
+        content = getattr(delta, "content", None) if delta else None
+        if isinstance(content, str) and content:
+            return content
+    return None
+
 # ----------------------------
 # Local fallback summary (rule-based)
 # ----------------------------
@@ -136,38 +197,13 @@ def _local_fallback_summary(patient, vital_signs: Iterable) -> str:
     sugar = getattr(latest, "blood_sugar", None) if latest else None
     temp = getattr(latest, "body_temperature", None) if latest else None
 
+    # همان جدول قوانین هشدار داشبورد پزشک (services/alert_rules.py)
     flags = []
-    try:
-        if sys_bp is not None and dia_bp is not None:
-            if sys_bp >= 130 or dia_bp >= 85:
-                flags.append("احتمال فشار خون بالا")
-            elif sys_bp >= 120 or dia_bp >= 80:
-                flags.append("فشار خون در محدوده مرزی")
-        if temp is not None:
-            if temp >= 38:
-                flags.append("احتمال تب")
-            elif temp < 35:
-                flags.append("احتمال افت دما")
-        if hr is not None:
-            if hr > 100:
-                flags.append("احتمال تاکی‌کاردی")
-            elif hr < 60:
-                flags.append("احتمال برادی‌کاردی")
-        if sugar is not None:
-            try:
-                age_int = int(age) if str(age).isdigit() else None
-            except Exception:
-                age_int = None
-            if age_int is not None:
-                if age_int <= 30 and sugar > 100:
-                    flags.append("قند خون بالاتر از محدوده توصیه‌شده برای سن")
-                elif 30 < age_int <= 40 and sugar > 108:
-                    flags.append("قند خون بالاتر از محدوده توصیه‌شده برای سن")
-                elif age_int > 40 and sugar > 160:
-                    flags.append("قند خون بالاتر از محدوده توصیه‌شده برای سن")
-    except Exception:
-        pass
-
+    if latest is not None:
+        try:
+            flags = [a.label for a in alert_records(readings_frame([latest], patient))]
+        except Exception:
+            logger.exception("❌ ارزیابی قوانین هشدار ناموفق بود")
     flags_text = "، ".join(flags) if flags else "در داده‌های موجود نکته هشداردهنده واضح مشاهده نشد."
 
     vitals_text = (
@@ -198,78 +234,66 @@ def generate_patient_summary(patient, vital_signs: Iterable) -> Tuple[Optional[s
     - ریس موازی بین مدل‌ها (اولین پاسخ معتبر انتخاب می‌شود)
     - اگر در ددلاین پاسخی نیاید، فال‌بک محلی
     """
-    # ددلاین‌ها مشابه اسکریپت خبری
-    PER_ATTEMPT_TIMEOUT = 50       # هر تلاش g4f حداکثر 8s
-    OVERALL_DEADLINE   = 30     # سقف کل عملیات 15s
-    MODEL_CANDIDATES   = ["gpt-5"]  # اگر 4o در g4f شما نباشد، نادیده گرفته می‌شود
+    summary, error, _ = generate_patient_summary_with_source(patient, vital_signs)
+    return (summary, error)
 
+@profiled("ai")
+def generate_patient_summary_with_source(patient, vital_signs: Iterable) -> Tuple[Optional[str], Optional[str], str]:
+    """
+    مانند generate_patient_summary، به‌علاوه منبع خلاصه: SOURCE_AI یا SOURCE_FALLBACK.
+    """
     logger.info("🔍 شروع تولید خلاصه | بیمار: %s %s",
                 getattr(patient, "first_name", ""), getattr(patient, "last_name", ""))
     t_all = time.monotonic()
 
     if Client is None:
         logger.warning("⚠️ g4f Client در دسترس نیست → فال‌بک محلی")
-        return (_local_fallback_summary(patient, vital_signs), None)
+        return (_local_fallback_summary(patient, vital_signs), None, SOURCE_FALLBACK)
 
     try:
-        # آماده‌سازی کوکی‌ها (الگوی اسکریپت خبری)
-        cookies_dir = os.path.join(os.getcwd(), "har_and_cookies")
-        try:
-            set_cookies_dir(cookies_dir)
-            read_cookie_files()
-            logger.debug("🍪 cookies آماده شد: %s", cookies_dir)
-        except Exception as e:
-            logger.warning("🍪 آماده‌سازی کوکی‌ها ناموفق: %s", e)
+        # کوکی‌ها یک‌بار در سطح پروسه بارگذاری می‌شوند و فقط با تغییر فایل‌ها دوباره خوانده می‌شوند
+        manager = get_provider_manager()
+        manager.ensure_cookies()
 
         # ساخت پیام‌ها
-        messages = [
-            {"role": "system", "content": _system_prompt()},
-            {"role": "user",  "content": _build_user_prompt(patient, vital_signs)},
-        ]
+        messages = build_messages(patient, vital_signs)
         logger.debug("📨 prompt آماده شد: %s", messages[-1]["content"][:200])
 
-        def _call_g4f_once(model: str):
-            # Client تازه برای هر فراخوانی (برخی providerها thread-safe نیستند)
-            c = Client()
+        def _call_g4f_once(c, model: str):
+            # c: Client اختصاصی thread اجراکننده (برخی providerها thread-safe نیستند)
             return c.chat.completions.create(
                 model=model,
                 messages=messages,
                 temperature=0.2,
                 max_tokens=600,
                 provider=OpenaiChat,
-                # اگر نسخه g4f شما پشتیبانی می‌کند، باز کنید:
-                # timeout=PER_ATTEMPT_TIMEOUT,
-                # request_timeout=PER_ATTEMPT_TIMEOUT,
+                timeout=REQUEST_TIMEOUT,
             )
 
         content: Optional[str] = None
 
         # 1) ریس موازی بین مدل‌ها (اولین پاسخ برنده)
         logger.info("🏁 ریس موازی بین مدل‌ها: %s", ", ".join(MODEL_CANDIDATES))
-        with ThreadPoolExecutor(max_workers=len(MODEL_CANDIDATES)) as pool:
-            futures = [pool.submit(_call_g4f_once, m) for m in MODEL_CANDIDATES]
-            done, pending = wait(
-                futures,
-                timeout=min(PER_ATTEMPT_TIMEOUT, OVERALL_DEADLINE),
-                return_when=FIRST_COMPLETED
-            )
-            if not done:
-                logger.warning("⏲️ timeout در ریسِ موازی (>%ss)", min(PER_ATTEMPT_TIMEOUT, OVERALL_DEADLINE))
-            else:
-                for f in done:
-                    try:
-                        resp = f.result(timeout=0.2)
-                        if getattr(resp, "choices", None):
-                            ch = resp.choices[0]
-                            msg = getattr(ch, "message", None)
-                            if msg and getattr(msg, "content", None):
-                                content = (msg.content or "").strip()
-                                logger.info("✅ پاسخ از ریس موازی دریافت شد")
-                                for p in pending:
-                                    p.cancel()
-                                break
-                    except Exception as e:
-                        logger.exception("❌ خطا در future: %s", e)
+        # executor مشترک پروسه؛ بدون with تا خروج منتظر futureهای بازنده نماند
+        futures = [manager.submit(_call_g4f_once, m) for m in MODEL_CANDIDATES]
+        done, pending = wait(
+            futures,
+            timeout=min(PER_ATTEMPT_TIMEOUT, OVERALL_DEADLINE),
+            return_when=FIRST_COMPLETED
+        )
+        if not done:
+            logger.warning("⏲️ timeout در ریسِ موازی (>%ss)", min(PER_ATTEMPT_TIMEOUT, OVERALL_DEADLINE))
+        else:
+            for f in done:
+                try:
+                    content = response_text(f.result(timeout=0.2))
+                    if content:
+                        logger.info("✅ پاسخ از ریس موازی دریافت شد")
+                        for p in pending:
+                            p.cancel()
+                        break
+                except Exception as e:
+                    logger.exception("❌ خطا در future: %s", e)
 
         # 2) اگر هنوز پاسخی نداریم و زمان باقی است: یک تلاش ترتیبی کوتاه
         elapsed = time.monotonic() - t_all
@@ -279,30 +303,26 @@ def generate_patient_summary(patient, vital_signs: Iterable) -> Tuple[Optional[s
                 if remaining <= 0:
                     break
                 logger.info("🧠 تلاش ترتیبی با %s (باقیمانده: %.1fs)", m, remaining)
-                with ThreadPoolExecutor(max_workers=1) as pool:
-                    fut = pool.submit(_call_g4f_once, m)
-                    try:
-                        resp = fut.result(timeout=min(PER_ATTEMPT_TIMEOUT, max(1.0, remaining)))
-                        if getattr(resp, "choices", None):
-                            ch = resp.choices[0]
-                            msg = getattr(ch, "message", None)
-                            if msg and getattr(msg, "content", None):
-                                content = (msg.content or "").strip()
-                                logger.info("✅ پاسخ از %s دریافت شد", m)
-                                break
-                    except FutureTimeout:
-                        logger.error("⏱️ timeout در مدل %s", m)
-                    except Exception as e:
-                        logger.exception("❌ خطا در مدل %s: %s", m, e)
+                fut = manager.submit(_call_g4f_once, m)
+                try:
+                    content = response_text(fut.result(timeout=min(PER_ATTEMPT_TIMEOUT, max(1.0, remaining))))
+                    if content:
+                        logger.info("✅ پاسخ از %s دریافت شد", m)
+                        break
+                except FutureTimeout:
+                    fut.cancel()
+                    logger.error("⏱️ timeout در مدل %s", m)
+                except Exception as e:
+                    logger.exception("❌ خطا در مدل %s: %s", m, e)
 
         if content:
             logger.debug("🧾 خلاصه نهایی (نمونه 300کاراکتر): %s", content[:300])
             logger.info("⏱️ تمام شد در %.2fs", time.monotonic() - t_all)
-            return (content, None)
+            return (content, None, SOURCE_AI)
 
         logger.warning("⚠️ پاسخی از AI نیامد در %.2fs → فال‌بک محلی", time.monotonic() - t_all)
-        return (_local_fallback_summary(patient, vital_signs), None)
+        return (_local_fallback_summary(patient, vital_signs), None, SOURCE_FALLBACK)
 
     except Exception as e:
         logger.exception("💥 خطای کلی AI summary: %s", e)
-        return (_local_fallback_summary(patient, vital_signs), None)
+        return (_local_fallback_summary(patient, vital_signs), None, SOURCE_FALLBACK)
@@ -0,0 +1,127 @@
+# main_app/services/ai_summary_async.py
+"""
+نسخه async تولید خلاصه AI برای اجرا زیر ASGI.
+
+- هر تلاش g4f یک asyncio task روی AsyncClient است (بدون thread)
+- با timeout یا برنده شدن یک مدل، taskهای دیگر واقعاً cancel می‌شوند
+  (در مسیر sync، future در حال اجرا قابل لغو نیست و thread تا پایان درخواست مشغول می‌ماند)
+- ددلاین‌ها، مدل‌ها، پاسخ و فال‌بک همان مقادیر ai_summary هستند
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Iterable, Optional, Tuple
+
+from .ai_summary import (
+    MODEL_CANDIDATES,
+    OVERALL_DEADLINE,
+    PER_ATTEMPT_TIMEOUT,
+    REQUEST_TIMEOUT,
+    SOURCE_AI,
+    SOURCE_FALLBACK,
+    OpenaiChat,
+    _local_fallback_summary,
+    build_messages,
+    response_text,
+)
+from .g4f_provider import AsyncClient, get_provider_manager
+from .profiling import timed
+
+logger = logging.getLogger("ai_summary")
+
+
+async def _race(call, models) -> Optional[str]:
+    """اولین پاسخ معتبر بین مدل‌ها؛ در خروج (برنده، خطا یا cancel) همه taskها لغو می‌شوند."""
+    tasks = [asyncio.create_task(call(m)) for m in models]
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                try:
+                    content = response_text(t.result())
+                except Exception as e:
+                    logger.error("❌ خطا در task: %s", e)
+                    continue
+                if content:
+                    return content
+        return None
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def agenerate_patient_summary_with_source(patient, vital_signs: Iterable) -> Tuple[Optional[str], Optional[str], str]:
+    """
+    مانند ai_summary.generate_patient_summary_with_source، برای viewهای async.
+    vital_signs باید از قبل بارگذاری شده باشد (list)، چون اینجا کوئری sync مجاز نیست.
+    """
+    vital_signs = list(vital_signs)
+    logger.info("🔍 شروع تولید خلاصه (async) | بیمار: %s %s",
+                getattr(patient, "first_name", ""), getattr(patient, "last_name", ""))
+    loop = asyncio.get_running_loop()
+    t_all = loop.time()
+
+    if AsyncClient is None:
+        logger.warning("⚠️ g4f AsyncClient در دسترس نیست → فال‌بک محلی")
+        return (_local_fallback_summary(patient, vital_signs), None, SOURCE_FALLBACK)
+
+    with timed("ai"):
+        try:
+            manager = get_provider_manager()
+            manager.ensure_cookies()
+            client = manager.async_client(loop)
+            messages = build_messages(patient, vital_signs)
+
+            async def _call(model: str):
+                return await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0.2,
+                    max_tokens=600,
+                    provider=OpenaiChat,
+                    timeout=REQUEST_TIMEOUT,
+                )
+
+            content: Optional[str] = None
+
+            # 1) ریس موازی بین مدل‌ها؛ wait_for در timeout خود ریس و همه taskهایش را لغو می‌کند
+            logger.info("🏁 ریس موازی (async) بین مدل‌ها: %s", ", ".join(MODEL_CANDIDATES))
+            race_timeout = min(PER_ATTEMPT_TIMEOUT, OVERALL_DEADLINE)
+            try:
+                content = await asyncio.wait_for(_race(_call, MODEL_CANDIDATES), timeout=race_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("⏲️ timeout در ریسِ موازی (>%ss)", race_timeout)
+
+            # 2) تلاش ترتیبی تا پایان ددلاین کلی
+            if not content:
+                for m in MODEL_CANDIDATES:
+                    remaining = OVERALL_DEADLINE - (loop.time() - t_all)
+                    if remaining <= 0:
+                        break
+                    logger.info("🧠 تلاش ترتیبی با %s (باقیمانده: %.1fs)", m, remaining)
+                    try:
+                        content = response_text(await asyncio.wait_for(
+                            _call(m), timeout=min(PER_ATTEMPT_TIMEOUT, max(1.0, remaining))
+                        ))
+                        if content:
+                            logger.info("✅ پاسخ از %s دریافت شد", m)
+                            break
+                    except asyncio.TimeoutError:
+                        logger.error("⏱️ timeout در مدل %s", m)
+                    except Exception as e:
+                        logger.exception("❌ خطا در مدل %s: %s", m, e)
+
+            if content:
+                logger.info("⏱️ تمام شد در %.2fs", loop.time() - t_all)
+                return (content, None, SOURCE_AI)
+
+            logger.warning("⚠️ پاسخی از AI نیامد در %.2fs → فال‌بک محلی", loop.time() - t_all)
+            return (_local_fallback_summary(patient, vital_signs), None, SOURCE_FALLBACK)
+
+        except Exception as e:
+            logger.exception("💥 خطای کلی AI summary (async): %s", e)
+            return (_local_fallback_summary(patient, vital_signs), None, SOURCE_FALLBACK)
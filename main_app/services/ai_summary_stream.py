@@ -0,0 +1,120 @@
+# main_app/services/ai_summary_stream.py
+"""
+Server-Sent Events stream of the AI summary for the patient detail pages.
+
+Events (data is JSON):
+- token: {"text": ...} the next piece of the model's answer
+- done:  {"summary", "error", "source"} the complete text; when the model misses
+  OVERALL_DEADLINE or fails, this is the rule-based fallback and replaces any partial text
+
+A cached summary is sent as a single `done` event. Models are tried in MODEL_CANDIDATES
+order until one starts answering; the g4f AsyncClient stream is read on the event loop,
+and closing the response (deadline or client disconnect) stops the provider stream.
+
+ASGI only: under WSGI a stream would hold a web worker for up to OVERALL_DEADLINE, so the
+view answers 204 there and the page uses the queued-job endpoint instead.
+"""
+
+import asyncio
+import json
+import logging
+
+from .ai_summary import (
+    MODEL_CANDIDATES,
+    OVERALL_DEADLINE,
+    REQUEST_TIMEOUT,
+    SOURCE_AI,
+    SOURCE_CACHE,
+    SOURCE_FALLBACK,
+    OpenaiChat,
+    _local_fallback_summary,
+    build_messages,
+    delta_text,
+)
+from .g4f_provider import AsyncClient, get_provider_manager
+from .summary_cache import aget_cached_summary, astore_summary
+
+logger = logging.getLogger("ai_summary")
+
+# Sent before the first token so proxies flush headers and the page can show progress
+OPENING = ': stream\n\n'
+
+
+def sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+def _done(summary, source, error=None):
+    return sse('done', {'summary': summary, 'error': error, 'source': source})
+
+
+def _request_kwargs(messages):
+    # timeout bounds the provider's connection, so a hung provider frees its thread
+    return {'messages': messages, 'temperature': 0.2, 'max_tokens': 600, 'provider': OpenaiChat, 'stream': True,
+            'timeout': REQUEST_TIMEOUT}
+
+
+async def summary_stream(patient, vital_signs):
+    """SSE strings for the summary of `patient`, as the async iterator ASGI streams unbuffered."""
+    vital_signs = list(vital_signs)
+    cached = await aget_cached_summary(patient, vital_signs)
+    if cached is not None:
+        yield _done(cached, SOURCE_CACHE)
+        return
+    async for event in _astream(patient, vital_signs):
+        yield event
+
+
+def _fallback(patient, vital_signs, parts, elapsed):
+    logger.warning("⚠️ استریم AI کامل نشد (%d بخش در %.2fs) → فال‌بک محلی", len(parts), elapsed)
+    return _done(_local_fallback_summary(patient, vital_signs), SOURCE_FALLBACK)
+
+
+async def _astream(patient, vital_signs):
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    yield OPENING
+    if AsyncClient is None:
+        yield _fallback(patient, vital_signs, [], 0.0)
+        return
+
+    manager = get_provider_manager()
+    manager.ensure_cookies()
+    client = manager.async_client(loop)
+    messages = build_messages(patient, vital_signs)
+
+    parts, completed = [], False
+    for model in MODEL_CANDIDATES:
+        stream = client.chat.completions.create(model=model, **_request_kwargs(messages))
+        try:
+            while True:
+                remaining = OVERALL_DEADLINE - (loop.time() - t0)
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                # wait_for cancels the pending read, which closes the provider request
+                chunk = await asyncio.wait_for(anext(stream), timeout=remaining)
+                text = delta_text(chunk)
+                if text:
+                    parts.append(text)
+                    yield sse('token', {'text': text})
+        except StopAsyncIteration:
+            completed = bool(parts)
+        except asyncio.TimeoutError:
+            logger.error("⏱️ ددلاین استریم AI (%ss) گذشت", OVERALL_DEADLINE)
+        except Exception as e:
+            logger.error("❌ خطا در استریم مدل %s: %s", model, e)
+            if not parts:
+                continue
+        finally:
+            aclose = getattr(stream, 'aclose', None)
+            if aclose is not None:
+                await aclose()
+        break
+
+    summary = ''.join(parts).strip()
+    if completed and summary:
+        logger.info("✅ استریم AI در %.2fs کامل شد", loop.time() - t0)
+        await astore_summary(patient, vital_signs, summary)
+        yield _done(summary, SOURCE_AI)
+    else:
+        yield _fallback(patient, vital_signs, parts, loop.time() - t0)
@@ -0,0 +1,199 @@
+# main_app/services/alert_rules.py
+"""
+Declarative clinical alert rules evaluated over whole columns at once.
+
+- RULES is the single threshold table (BP, temperature, heart rate, age-banded blood sugar)
+- evaluate_masks: one boolean NumPy mask per rule for any number of readings
+- alerts_frame / alert_records: the hits as a DataFrame or as Alert records
+- latest_vitals_alerts: alerts for every patient's most recent reading (persisted by services.alerts)
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from ..models import LatestVitals
+
+WARNING = 'warning'
+HIGH = 'high'
+CRITICAL = 'critical'
+
+FIELDS = [
+    'blood_pressure_systolic', 'blood_pressure_diastolic',
+    'heart_rate', 'blood_sugar', 'body_temperature',
+]
+
+_OPS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+}
+
+
+@dataclass(frozen=True)
+class Rule:
+    code: str
+    label: str
+    severity: str
+    # Fires when ANY (field, op, value) condition holds
+    conditions: tuple
+    # Optional age band (low, high]: None means unbounded on that side
+    age_range: tuple = (None, None)
+    # Codes of rules that, when firing on the same reading, hide this one
+    suppressed_by: tuple = ()
+
+
+# BP: the old dashboard check alerted on >120/80; every such reading still alerts, now as
+# bp_elevated (warning) below 130/85 and bp_high from there (the fallback summary's tiers).
+# Heart-rate rules come from the fallback summary and are new on the dashboard.
+RULES = (
+    Rule('bp_high', 'فشار خون بیش از حد مجاز', HIGH,
+         (('blood_pressure_systolic', '>=', 130), ('blood_pressure_diastolic', '>=', 85))),
+    Rule('bp_elevated', 'فشار خون در محدوده مرزی', WARNING,
+         (('blood_pressure_systolic', '>', 120), ('blood_pressure_diastolic', '>', 80)),
+         suppressed_by=('bp_high',)),
+    Rule('fever', 'دمای بدن بیش از حد مجاز (تب)', WARNING, (('body_temperature', '>', 38),)),
+    Rule('seizure_risk', 'خطر تشنج', CRITICAL, (('body_temperature', '>', 40),)),
+    Rule('hypothermia', 'خطر افت دما', HIGH, (('body_temperature', '<', 35),)),
+    Rule('tachycardia', 'احتمال تاکی‌کاردی', WARNING, (('heart_rate', '>', 100),)),
+    Rule('bradycardia', 'احتمال برادی‌کاردی', WARNING, (('heart_rate', '<', 60),)),
+    Rule('sugar_high', 'قند خون در حالت غیر طبیعی', WARNING, (('blood_sugar', '>', 100),), age_range=(None, 30)),
+    Rule('sugar_high', 'قند خون در حالت غیر طبیعی', WARNING, (('blood_sugar', '>', 108),), age_range=(30, 40)),
+    Rule('sugar_high', 'قند خون در حالت غیر طبیعی', WARNING, (('blood_sugar', '>', 160),), age_range=(40, None)),
+)
+
+RULE_LABELS = {rule.code: rule.label for rule in RULES}
+RULE_SEVERITIES = {rule.code: rule.severity for rule in RULES}
+
+
+@dataclass(frozen=True)
+class Alert:
+    patient_id: int
+    vital_signs_id: int
+    date: object
+    code: str
+    severity: str
+    label: str
+    patient_name: str = ''
+
+    @property
+    def key(self):
+        """Stable identifier of this alert, used by the dashboard's dismiss form."""
+        return f'{self.vital_signs_id}:{self.code}'
+
+    @property
+    def message(self):
+        return f'بیمار {self.patient_name}: {self.label}' if self.patient_name else self.label
+
+
+def _column(columns, name, n):
+    values = columns.get(name)
+    if values is None:
+        return np.full(n, np.nan)
+    # Missing readings become NaN, for which every comparison is False
+    return pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+
+
+def evaluate_masks(columns, rules=RULES):
+    """
+    columns: mapping (dict or DataFrame) of FIELDS plus 'age' to equal-length arrays.
+    Returns {rule code: boolean mask}; rules sharing a code (age bands) are OR-ed.
+    """
+    n = len(next(iter(columns.values()))) if isinstance(columns, dict) else len(columns)
+    arrays = {name: _column(columns, name, n) for name in FIELDS + ['age']}
+
+    masks = {}
+    for rule in rules:
+        mask = np.zeros(n, dtype=bool)
+        for field, op, value in rule.conditions:
+            mask |= _OPS[op](arrays[field], value)
+        low, high = rule.age_range
+        if low is not None:
+            mask &= arrays['age'] > low
+        if high is not None:
+            mask &= arrays['age'] <= high
+        masks[rule.code] = masks[rule.code] | mask if rule.code in masks else mask
+
+    for rule in rules:
+        # A suppressor left out of `rules` hides nothing
+        for other in rule.suppressed_by:
+            if other in masks:
+                masks[rule.code] &= ~masks[other]
+    return masks
+
+
+def alerts_frame(frame, rules=RULES):
+    """
+    One row per (reading, fired rule): the input's non-vital columns plus code, severity and label.
+    Rows keep the input order; within a reading, alerts follow the rule table order.
+    """
+    masks = evaluate_masks(frame, rules)
+    identity = frame.drop(columns=[c for c in FIELDS + ['age'] if c in frame.columns])
+    codes = list(masks)
+    rows = [np.flatnonzero(mask) for mask in masks.values()]
+    row_index = np.concatenate(rows) if rows else np.empty(0, dtype=np.intp)
+    code_index = np.repeat(np.arange(len(codes)), [len(r) for r in rows])
+    order = np.lexsort((code_index, row_index))
+
+    # Index small per-rule lookup arrays instead of mapping every hit through a dict
+    code_index = code_index[order]
+    hits = identity.iloc[row_index[order]].reset_index(drop=True)
+    for column, values in (
+        ('code', codes),
+        ('severity', [RULE_SEVERITIES[c] for c in codes]),
+        ('label', [RULE_LABELS[c] for c in codes]),
+    ):
+        hits[column] = np.array(values, dtype=object)[code_index] if codes else []
+    return hits
+
+
+def alert_records(frame, rules=RULES):
+    """Alert records for a frame with patient_id, vital_signs_id, date[, patient_name], FIELDS and age."""
+    hits = alerts_frame(frame, rules)
+    names = hits['patient_name'] if 'patient_name' in hits.columns else [''] * len(hits)
+    return [
+        Alert(patient_id, vital_signs_id, date, code, severity, label, name)
+        for patient_id, vital_signs_id, date, code, severity, label, name in zip(
+            hits['patient_id'], hits['vital_signs_id'], hits['date'],
+            hits['code'], hits['severity'], hits['label'], names,
+        )
+    ]
+
+
+def readings_frame(vital_signs, patient):
+    """Frame for VitalSigns objects of a single, already loaded patient (no per-row patient access)."""
+    vital_signs = list(vital_signs)
+    frame = pd.DataFrame({
+        'patient_id': [patient.pk] * len(vital_signs),
+        'vital_signs_id': [vs.pk for vs in vital_signs],
+        'date': [vs.date for vs in vital_signs],
+        'patient_name': [str(patient)] * len(vital_signs),
+    })
+    for field in FIELDS:
+        frame[field] = [getattr(vs, field, None) for vs in vital_signs]
+    frame['age'] = getattr(patient, 'age', None)
+    return frame
+
+
+def latest_readings_frame(patient_ids=None):
+    """Frame of the latest reading of every patient (or of `patient_ids`), in one query."""
+    rows = LatestVitals.objects.order_by('patient_id')
+    if patient_ids is not None:
+        rows = rows.filter(patient_id__in=patient_ids)
+    rows = rows.values_list(
+        'patient_id', 'vital_signs_id', 'date', 'patient__first_name', 'patient__last_name', 'patient__age',
+        *[f'vital_signs__{field}' for field in FIELDS],
+    )
+    frame = pd.DataFrame.from_records(
+        list(rows),
+        columns=['patient_id', 'vital_signs_id', 'date', 'first_name', 'last_name', 'age'] + FIELDS,
+    )
+    frame['patient_name'] = frame['first_name'] + ' ' + frame['last_name']
+    return frame.drop(columns=['first_name', 'last_name'])
+
+
+def latest_vitals_alerts():
+    """Alerts for every patient's latest reading, read in one query without model instances."""
+    return alert_records(latest_readings_frame())
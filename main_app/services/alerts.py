@@ -0,0 +1,103 @@
+# main_app/services/alerts.py
+"""
+Persistent Alert rows for the doctor dashboard.
+
+- sync_alerts: after vitals (or a patient's age) change, make each patient's alerts match
+  the rules fired by their latest reading: new hits are created active, hits that stopped
+  firing or belong to an older reading are resolved, dismissed hits stay dismissed
+- active_alerts: what the dashboard shows, one query on the (status, patient) index
+- dismiss_alerts: persist a doctor's dismissal
+
+New, reopened, resolved and dismissed alerts are published to the live feed.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Alert, Patient
+from . import live_feed
+from .alert_rules import alerts_frame, latest_readings_frame
+from .fragment_cache import ALERTS, bump_fragments
+
+# Patients per batch; keeps the IN (...) lists well under SQLite's variable limit
+BATCH_SIZE = 500
+
+
+def sync_alerts(patient_ids, batch_size=BATCH_SIZE):
+    """Bring the alerts of `patient_ids` up to date with their LatestVitals row."""
+    patient_ids = sorted(set(patient_ids))
+    for start in range(0, len(patient_ids), batch_size):
+        _sync_batch(patient_ids[start:start + batch_size])
+
+
+def _sync_batch(patient_ids):
+    hits = alerts_frame(latest_readings_frame(patient_ids))
+    fired = {
+        (int(vital_signs_id), code): (int(patient_id), date, severity, label, name)
+        for patient_id, vital_signs_id, date, code, severity, label, name in zip(
+            hits['patient_id'], hits['vital_signs_id'], hits['date'],
+            hits['code'], hits['severity'], hits['label'], hits['patient_name'],
+        )
+    }
+    vital_signs_ids = {vital_signs_id for vital_signs_id, _ in fired}
+
+    with transaction.atomic():
+        active = Alert.objects.filter(status=Alert.ACTIVE, patient_id__in=patient_ids).values_list(
+            'pk', 'vital_signs_id', 'code',
+        )
+        resolved = [pk for pk, vital_signs_id, code in active if (vital_signs_id, code) not in fired]
+        existing = {
+            (vital_signs_id, code): (pk, status)
+            for pk, vital_signs_id, code, status in Alert.objects.filter(
+                vital_signs_id__in=vital_signs_ids,
+            ).values_list('pk', 'vital_signs_id', 'code', 'status')
+        }
+        # A reading edited back into range and out again fires the same alert again
+        reopened = {key: pk for key, (pk, status) in existing.items() if key in fired and status == Alert.RESOLVED}
+
+        if resolved:
+            Alert.objects.filter(pk__in=resolved).update(status=Alert.RESOLVED)
+            live_feed.publish(live_feed.ALERT_CLEARED, {'ids': resolved})
+        if reopened:
+            Alert.objects.filter(pk__in=reopened.values()).update(status=Alert.ACTIVE)
+        created = Alert.objects.bulk_create([
+            Alert(
+                patient_id=patient_id, vital_signs_id=vital_signs_id, date=date,
+                code=code, severity=severity, label=label,
+            )
+            for (vital_signs_id, code), (patient_id, date, severity, label, _) in fired.items()
+            if (vital_signs_id, code) not in existing
+        ])
+
+        raised = [*reopened.items(), *(((a.vital_signs_id, a.code), a.pk) for a in created)]
+        for key, pk in raised:
+            patient_id, _, severity, label, name = fired[key]
+            live_feed.publish(live_feed.ALERT, live_feed.alert_event(pk, patient_id, name, key[1], severity, label))
+
+
+def active_alerts():
+    return Alert.objects.filter(status=Alert.ACTIVE).select_related('patient').order_by('patient_id', 'pk')
+
+
+def feed_snapshot():
+    """What the dashboard's live feed keeps current, read from the database (live_feed resync)."""
+    return {
+        'alerts': [
+            live_feed.alert_event(alert.pk, alert.patient_id, alert.patient, alert.code, alert.severity, alert.label)
+            for alert in active_alerts()
+        ],
+        'emergency': [live_feed.emergency_event(patient) for patient in Patient.objects.filter(emergency=True)],
+    }
+
+
+def dismiss_alerts(queryset, user):
+    """Dismiss the active alerts in `queryset`. Returns how many were dismissed."""
+    ids = list(queryset.filter(status=Alert.ACTIVE).values_list('pk', flat=True))
+    if not ids:
+        return 0
+    count = Alert.objects.filter(pk__in=ids, status=Alert.ACTIVE).update(
+        status=Alert.DISMISSED, dismissed_at=timezone.now(), dismissed_by=user,
+    )
+    live_feed.publish(live_feed.ALERT_CLEARED, {'ids': ids})
+    bump_fragments(ALERTS)
+    return count
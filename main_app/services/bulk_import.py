@@ -0,0 +1,230 @@
+# main_app/services/bulk_import.py
+"""
+Offline import of large historical CSV/xlsx vitals dumps (`manage.py import_vitals`).
+
+- the file is split into chunks: CSV into newline-aligned byte ranges (so workers read
+  their own slice), xlsx into batches of rows streamed by openpyxl in read-only mode
+- a process pool parses and validates the chunks (check_vitals_frame; no DB access)
+- the calling process is the single writer: it takes the validated chunks in file order,
+  rejects rows of unknown patients and commits each chunk with upsert_vitals
+- after every committed chunk a JSON checkpoint records how many chunks are done, so a
+  rerun with resume=True continues from there (re-running a chunk is harmless: upserts)
+
+CSV chunking assumes no quoted field spans lines, which holds for vitals exports.
+
+xlsx is not parsed in parallel: a sheet is one compressed XML stream that openpyxl can
+only read from the start, so the calling process streams the rows and the workers only
+build and validate the frames. Reading the XML dominates, so large workbooks import at
+about single-process speed; convert them to CSV for the parallel path.
+"""
+
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+from django.db import connection
+
+from .vitals_import import REQUIRED_COLUMNS, ImportResult, check_vitals_frame, flag_unknown_patients, upsert_vitals
+
+CHUNK_ROWS = 50000
+# Rows sampled to estimate the bytes per CSV row
+SAMPLE_ROWS = 1000
+# Messages kept in the result; the rejected count covers every row
+MAX_ERRORS = 1000
+
+
+class CheckpointMismatch(ValueError):
+    pass
+
+
+@dataclass
+class Checkpoint:
+    path: str
+    size: int
+    mtime: float
+    chunking: int
+    done_chunks: int = 0
+    rows: int = 0
+    inserted: int = 0
+    updated: int = 0
+    rejected: int = 0
+
+    @classmethod
+    def load(cls, checkpoint_path):
+        with open(checkpoint_path, encoding='utf-8') as fh:
+            return cls(**json.load(fh))
+
+    def save(self, checkpoint_path):
+        tmp = f'{checkpoint_path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fh:
+            json.dump(asdict(self), fh)
+        os.replace(tmp, checkpoint_path)
+
+
+@dataclass
+class ChunkResult:
+    index: int
+    rows: int
+    clean: pd.DataFrame
+    # (row number in the file, message) of rejected rows
+    problems: list = field(default_factory=list)
+
+
+def is_csv(path):
+    return path.lower().endswith(('.csv', '.txt'))
+
+
+def csv_chunk_bytes(path, chunk_rows):
+    """Bytes per chunk that give about `chunk_rows` rows, from the first SAMPLE_ROWS lines."""
+    with open(path, 'rb') as fh:
+        fh.readline()
+        start = fh.tell()
+        lines = sum(1 for _ in zip(range(SAMPLE_ROWS), fh))
+        per_row = (fh.tell() - start) / max(lines, 1)
+    return max(int(per_row * chunk_rows), 1)
+
+
+def csv_tasks(path, chunk_bytes):
+    """(path, header, start, end) byte ranges that end on a newline."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as fh:
+        header = fh.readline()
+        start = fh.tell()
+        while start < size:
+            fh.seek(min(start + chunk_bytes, size))
+            fh.readline()
+            end = min(fh.tell(), size)
+            yield ('csv', path, header, start, end)
+            start = end
+
+
+def xlsx_tasks(path, chunk_rows):
+    """('rows', columns, rows) batches of the first sheet, streamed in read-only mode."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        columns = [str(c).strip() if c is not None else '' for c in next(rows, ())]
+        batch = []
+        for row in rows:
+            if any(value is not None for value in row):
+                batch.append(row)
+            if len(batch) == chunk_rows:
+                yield ('rows', columns, batch)
+                batch = []
+        if batch:
+            yield ('rows', columns, batch)
+    finally:
+        workbook.close()
+
+
+def _read_task(task):
+    if task[0] == 'csv':
+        _, path, header, start, end = task
+        with open(path, 'rb') as fh:
+            fh.seek(start)
+            data = fh.read(end - start)
+        return pd.read_csv(io.BytesIO(header + data), dtype=str, skip_blank_lines=True)
+    _, columns, rows = task
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+
+def parse_chunk(index, task, patient_column):
+    """Worker: read and validate one chunk. Rows are numbered from 1 within the chunk."""
+    df = _read_task(task)
+    df.columns = [str(c).strip() for c in df.columns]
+    missing = [c for c in REQUIRED_COLUMNS + ([patient_column] if patient_column else []) if c not in df.columns]
+    if missing:
+        raise ValueError(f"ستون‌های {', '.join(missing)} در فایل یافت نشد.")
+    clean, problems = check_vitals_frame(df, patient_column)
+    bad = (problems != '').to_numpy()
+    rejected = [(int(r), msg.strip()) for r, msg in zip(clean['row'][bad], problems[bad])]
+    return ChunkResult(index, len(df), clean[~bad].reset_index(drop=True), rejected)
+
+
+def _ordered(executor, tasks, patient_column, ahead):
+    """Results of parse_chunk in task order, with at most `ahead` chunks in flight."""
+    pending = {}
+    next_index = 0
+    for index, task in tasks:
+        pending[index] = executor.submit(parse_chunk, index, task, patient_column)
+        while len(pending) >= ahead:
+            yield pending.pop(next_index).result()
+            next_index += 1
+    while pending:
+        yield pending.pop(next_index).result()
+        next_index += 1
+
+
+def import_file(path, patient=None, patient_column=None, workers=None, chunk_rows=CHUNK_ROWS,
+                checkpoint_path=None, resume=False, progress=None):
+    """
+    Import a CSV/xlsx file of readings, for `patient` or per-row `patient_column`.
+    Returns (ImportResult of this run, Checkpoint). `progress(checkpoint, rows_per_s, fraction)`
+    is called after every committed chunk; the first MAX_ERRORS messages go to result.errors.
+    """
+    stat = os.stat(path)
+    chunking = csv_chunk_bytes(path, chunk_rows) if is_csv(path) else chunk_rows
+    checkpoint = Checkpoint(os.path.abspath(path), stat.st_size, stat.st_mtime, chunking)
+    if resume and checkpoint_path and os.path.exists(checkpoint_path):
+        saved = Checkpoint.load(checkpoint_path)
+        if (saved.path, saved.size, saved.mtime) != (checkpoint.path, checkpoint.size, checkpoint.mtime):
+            raise CheckpointMismatch('فایل checkpoint مربوط به این فایل (یا این نسخه از آن) نیست.')
+        checkpoint = saved
+
+    tasks = csv_tasks(path, checkpoint.chunking) if is_csv(path) else xlsx_tasks(path, checkpoint.chunking)
+    tasks = ((i, task) for i, task in enumerate(tasks) if i >= checkpoint.done_chunks)
+    workers = workers or os.cpu_count() or 1
+    result = ImportResult()
+    t0 = time.perf_counter()
+    run_rows = 0
+
+    # Forked workers should not inherit an open connection (one inside a transaction stays;
+    # the workers never use it)
+    if not connection.in_atomic_block:
+        connection.close()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('fork')) as executor:
+        for chunk in _ordered(executor, tasks, patient_column, ahead=workers * 2):
+            first_row = checkpoint.rows
+            clean = chunk.clean
+            rejected = [(first_row + r, msg) for r, msg in chunk.problems]
+            if patient_column and not clean.empty:
+                problems = flag_unknown_patients(clean, pd.Series([''] * len(clean), dtype=object))
+                unknown = (problems != '').to_numpy()
+                rejected += [(first_row + int(r), msg.strip()) for r, msg in zip(clean['row'][unknown], problems[unknown])]
+                clean = clean[~unknown].reset_index(drop=True)
+
+            written = upsert_vitals(clean, patient=patient)
+            result.inserted += written.inserted
+            result.updated += written.updated
+            result.rejected += len(rejected)
+            result.errors.extend(
+                f"خطا در ردیف {r}: {msg}" for r, msg in sorted(rejected)[:MAX_ERRORS - len(result.errors)]
+            )
+
+            checkpoint.done_chunks = chunk.index + 1
+            checkpoint.rows += chunk.rows
+            checkpoint.inserted += written.inserted
+            checkpoint.updated += written.updated
+            checkpoint.rejected += len(rejected)
+            if checkpoint_path:
+                checkpoint.save(checkpoint_path)
+
+            run_rows += chunk.rows
+            if progress is not None:
+                fraction = _fraction(checkpoint) if is_csv(path) else None
+                progress(checkpoint, run_rows / max(time.perf_counter() - t0, 1e-9), fraction)
+    return result, checkpoint
+
+
+def _fraction(checkpoint):
+    # Chunks are near-equal byte ranges
+    total = max(int(np.ceil(checkpoint.size / checkpoint.chunking)), 1)
+    return min(checkpoint.done_chunks / total, 1.0)
@@ -0,0 +1,144 @@
+# main_app/services/chart_data.py
+"""
+Downsampled chart series for the patient detail pages.
+
+- the requested date range comes from the patient's columnar series
+  (services/vitals_series.py; no model instances, at most one indexed query)
+- each vital series is reduced to its share of `max_points` with
+  Largest-Triangle-Three-Buckets (default) or per-bucket min/max
+- the kept indices of all series are merged, so every dataset shares one label
+  axis and every plotted value is a real reading
+- payload size is bounded by `max_points` however long the history is
+- ranges holding more than `max_points` readings are served from the weekly
+  VitalsRollup rows instead of the raw rows (resolution `auto`): the weekly mean as the
+  series plus each week's min/max as an `envelope`, so a spike stays visible. The tier is
+  chosen from the reading count (the cached series' length, else one COUNT), so a long
+  range never loads its raw rows
+"""
+
+import numpy as np
+from django.conf import settings
+
+from .jalali import format_jalali
+from .rollups import weekly_series
+from .vitals_series import get_series, get_series_cache, vitals_between
+
+DEFAULT_MAX_POINTS = 1000
+METHODS = ('lttb', 'minmax')
+RESOLUTIONS = ('auto', 'raw', 'week')
+
+# Chart key -> VitalSigns field (the keys are the template/JSON names)
+SERIES = {
+    'systolic_bp': 'blood_pressure_systolic',
+    'diastolic_bp': 'blood_pressure_diastolic',
+    'heart_rates': 'heart_rate',
+    'blood_sugars': 'blood_sugar',
+    'body_temperatures': 'body_temperature',
+}
+
+
+def max_points():
+    return getattr(settings, 'CHART_MAX_POINTS', DEFAULT_MAX_POINTS)
+
+
+def lttb_indices(x, y, threshold):
+    """Indices of the `threshold` points LTTB keeps from (x, y); x must be increasing."""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    every = (n - 2) / (threshold - 2)
+    # Bucket i covers [edges[i], edges[i + 1]); first and last points are always kept
+    edges = np.minimum((np.arange(threshold - 1) * every).astype(np.int64) + 1, n - 1)
+    edges[-1] = n - 1
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        if next_end <= next_start:
+            next_end = min(next_start + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+
+def minmax_indices(y, threshold):
+    """Indices of the minimum and maximum of each of threshold // 2 equal-count buckets."""
+    n = len(y)
+    if threshold >= n or threshold < 2:
+        return np.arange(n)
+
+    buckets = threshold // 2
+    bucket = (np.arange(n) * buckets) // n
+    order = np.lexsort((np.asarray(y), bucket))
+    starts = np.searchsorted(bucket[order], np.arange(buckets))
+    ends = np.append(starts[1:], n) - 1
+    return np.unique(np.concatenate([order[starts], order[ends]]))
+
+
+def downsample_indices(x, columns, max_points, method='lttb'):
+    """Union of each column's kept indices, each column getting an equal share of max_points."""
+    if method not in METHODS:
+        raise ValueError(f'unknown downsampling method: {method}')
+    n = len(x)
+    if n <= max_points:
+        return np.arange(n)
+
+    share = max(max_points // max(len(columns), 1), 3)
+    kept = [
+        lttb_indices(x, y, share) if method == 'lttb' else minmax_indices(y, share)
+        for y in columns
+    ]
+    return np.unique(np.concatenate(kept))
+
+
+def _count(patient, start, end):
+    """Readings of the patient in [start, end], without loading them."""
+    series = get_series_cache().peek(patient.pk)
+    if series is not None:
+        return len(series.between(start, end))
+    return vitals_between(patient, start, end).count()
+
+
+def vitals_chart_data(patient, start=None, end=None, points=None, method='lttb', resolution='auto'):
+    """
+    Chart payload for one patient: Jalali `dates` labels plus one list per SERIES key,
+    downsampled to at most `points` labels, `total` readings in the range, the
+    `resolution` used (`raw` readings or `week` rollup means) and, for `week`, the
+    `envelope` {key: {'min': [...], 'max': [...]}} of each week (empty for `raw`).
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f'unknown resolution: {resolution}')
+    points = points or max_points()
+    total = _count(patient, start, end)
+    if resolution == 'auto':
+        resolution = 'week' if total > points else 'raw'
+    envelope = {}
+    if resolution == 'week':
+        dates, stats = weekly_series(patient, list(SERIES.values()), start, end)
+        columns = stats['mean']
+    else:
+        series = get_series(patient, start, end)
+        dates = series.dates
+        columns = [series.values[field] for field in SERIES.values()]
+    keep = downsample_indices(dates.astype(np.int64), columns, points, method)
+
+    data = {'dates': format_jalali(dates[keep]), 'total': total, 'resolution': resolution, 'envelope': envelope}
+    for i, (key, values) in enumerate(zip(SERIES, columns)):
+        # Weekly stats are floats for every vital; raw columns keep their int/float dtype
+        kept = values[keep]
+        data[key] = (kept.round(1) if resolution == 'week' else kept).tolist()
+        if resolution == 'week':
+            envelope[key] = {stat: stats[stat][i][keep].round(1).tolist() for stat in ('min', 'max')}
+    return data
@@ -0,0 +1,69 @@
+# main_app/services/fragment_cache.py
+"""
+Versioned keys for the cached template fragments of the dashboards and lists.
+
+- each scope (PATIENTS, ALERTS, STAFF) has a version token stored in the cache
+- a fragment's key holds the tokens of the scopes it shows, so bumping a scope
+  (signals.py, on post_save/post_delete) makes every fragment that shows it miss;
+  the old entries are never read again and expire after FRAGMENT_CACHE_TIMEOUT
+- tokens are random rather than counters, so an evicted token can never bring
+  back fragments rendered under an earlier one
+
+Views pass lazy querysets/objects, so a cache hit skips the queries as well as the
+render. The backend is settings.CACHES (CACHE_BACKEND); with several worker processes
+use the file or Redis backend so a bump reaches all of them.
+"""
+
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+
+PATIENTS = 'patients'
+ALERTS = 'alerts'
+STAFF = 'staff'
+
+DEFAULT_TIMEOUT = 300
+
+
+def _cache():
+    return caches[getattr(settings, 'FRAGMENT_CACHE_ALIAS', 'default')]
+
+
+def _version_key(scope):
+    return f'fragment_version:{scope}'
+
+
+def fragment_version(scope):
+    cache = _cache()
+    token = cache.get(_version_key(scope))
+    if token is None:
+        # Concurrent first readers agree on whichever token add() stored
+        cache.add(_version_key(scope), uuid.uuid4().hex, None)
+        token = cache.get(_version_key(scope))
+    return token
+
+
+def bump_fragments(*scopes):
+    """
+    Give `scopes` new tokens now and again on commit, so a fragment rendered from
+    pre-commit rows by another request cannot outlive the write.
+    """
+    def bump():
+        _cache().set_many({_version_key(scope): uuid.uuid4().hex for scope in scopes}, None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def cached_fragment(name, scopes, vary_on, render):
+    """The cached rendering of fragment `name`, or render() stored under the current versions."""
+    cache = _cache()
+    key = make_template_fragment_key(name, [*(fragment_version(scope) for scope in scopes), *vary_on])
+    value = cache.get(key)
+    if value is None:
+        value = render()
+        cache.set(key, value, getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+    return value
@@ -0,0 +1,158 @@
+# main_app/services/g4f_provider.py
+"""
+Process-wide g4f provider manager.
+
+- cookies/HAR files are loaded once and reloaded only when the directory's
+  files change (checked by stat at most every COOKIE_CHECK_INTERVAL seconds)
+- one g4f Client per thread (some providers are not thread-safe)
+- one long-lived executor for the model race instead of a pool per request; when every
+  worker has been busy with one call for over STUCK_AFTER seconds the pool is retired
+  (its threads finish once their calls hit the request timeout) and a fresh one is used
+- one AsyncClient per event loop for the async summary path (no threads at all)
+
+Usage:
+    from .g4f_provider import get_provider_manager
+    manager = get_provider_manager()
+    future = manager.submit(lambda client: client.chat.completions.create(...))
+"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+logger = logging.getLogger("ai_summary")
+
+# --- g4f optional import ---
+try:
+    from g4f.client import AsyncClient, Client
+    from g4f.cookies import set_cookies_dir, read_cookie_files
+except Exception:  # pragma: no cover
+    Client = AsyncClient = None  # type: ignore
+
+COOKIE_CHECK_INTERVAL = 5.0
+DEFAULT_MAX_WORKERS = 4
+# Longer than any request timeout passed to g4f (ai_summary.REQUEST_TIMEOUT)
+STUCK_AFTER = 60.0
+_COOKIE_SUFFIXES = ('.har', '.json', '.env')
+
+
+def cookies_signature(cookies_dir):
+    """(name, mtime_ns, size) of every file read_cookie_files would load, or None if missing."""
+    try:
+        entries = sorted(
+            (e.name, e.stat().st_mtime_ns, e.stat().st_size)
+            for e in os.scandir(cookies_dir)
+            if e.is_file() and e.name.endswith(_COOKIE_SUFFIXES)
+        )
+    except FileNotFoundError:
+        return None
+    return tuple(entries)
+
+
+class ProviderManager:
+    def __init__(self, cookies_dir, max_workers=DEFAULT_MAX_WORKERS, stuck_after=STUCK_AFTER):
+        self.cookies_dir = cookies_dir
+        self.max_workers = max_workers
+        self.stuck_after = stuck_after
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._signature = object()  # never equal to a real signature → first call loads
+        self._checked_at = float("-inf")
+        self._executor = None
+        # start time of each running call of the current executor
+        self._busy = {}
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @property
+    def available(self):
+        return Client is not None
+
+    def ensure_cookies(self):
+        """Load cookies if never loaded or if the files changed since the last load."""
+        now = time.monotonic()
+        if now - self._checked_at < COOKIE_CHECK_INTERVAL:
+            return
+        with self._lock:
+            if now - self._checked_at < COOKIE_CHECK_INTERVAL:
+                return
+            self._checked_at = now
+            signature = cookies_signature(self.cookies_dir)
+            if signature == self._signature:
+                return
+            try:
+                set_cookies_dir(self.cookies_dir)
+                read_cookie_files()
+                logger.debug("🍪 cookies بارگذاری شد: %s", self.cookies_dir)
+            except Exception as e:
+                logger.warning("🍪 آماده‌سازی کوکی‌ها ناموفق: %s", e)
+            self._signature = signature
+
+    def client(self):
+        """The calling thread's Client, created on first use."""
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client()
+        return client
+
+    def async_client(self, loop):
+        """The AsyncClient bound to `loop`, created on first use."""
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = AsyncClient()
+        return client
+
+    def _stuck(self, now):
+        started = list(self._busy.values())
+        return len(started) >= self.max_workers and now - min(started) > self.stuck_after
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(client, *args, **kwargs) on the shared executor with that worker thread's client."""
+        with self._lock:
+            if self._executor is not None and self._stuck(time.monotonic()):
+                logger.warning("🧵 همه %s worker g4f بیش از %ss گیر کرده‌اند → executor تازه", self.max_workers, self.stuck_after)
+                self._retire()
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='g4f')
+            executor, busy = self._executor, self._busy
+
+        def call():
+            token = object()
+            busy[token] = time.monotonic()
+            try:
+                return fn(self.client(), *args, **kwargs)
+            finally:
+                del busy[token]
+        return executor.submit(call)
+
+    def _retire(self):
+        # Queued calls are cancelled (their callers fall back); running ones are left to time out
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._busy = {}
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._retire()
+        self._async_clients = weakref.WeakKeyDictionary()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_provider_manager():
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = ProviderManager(
+                    getattr(settings, 'G4F_COOKIES_DIR', os.path.join(os.getcwd(), "har_and_cookies")),
+                    max_workers=getattr(settings, 'AI_SUMMARY_MAX_WORKERS', DEFAULT_MAX_WORKERS),
+                )
+    return _manager
@@ -0,0 +1,132 @@
+# main_app/services/jalali.py
+"""
+Vectorized Jalali <-> Gregorian helpers for bulk paths (imports, charts, exports).
+
+Uses the same day-count arithmetic as jalali_core/jdatetime, so results match
+what jDateField stores, but works on whole NumPy arrays instead of one
+jdatetime.date at a time. parse_date_range turns the `?from=&to=` query parameters
+of the vitals endpoints into jdatetime bounds once per request.
+"""
+
+from urllib.parse import urlencode
+
+import jdatetime
+import numpy as np
+import pandas as pd
+
+# Cumulative days before each Jalali month (index 0 = Farvardin)
+_J_MONTH_OFFSETS = np.array([0, 31, 62, 93, 124, 155, 186, 216, 246, 276, 306, 336])
+_EPOCH = np.datetime64('1600-01-01', 'D')
+
+_DATE_RE = r'^\s*(\d{4})[-/](\d{1,2})[-/](\d{1,2})'
+
+
+def _jalali_day_number(jy, jm, jd):
+    """Days since 1600-01-01 (Gregorian) for Jalali y/m/d arrays (m, d already in range)."""
+    y = jy - 979
+    return 365 * y + (y // 33) * 8 + (y % 33 + 3) // 4 + jd - 1 + 79 + _J_MONTH_OFFSETS[jm - 1]
+
+
+def jalali_to_datetime64(jy, jm, jd):
+    """
+    Convert Jalali year/month/day integer arrays to datetime64[D].
+    Invalid dates (bad month/day, 30 Esfand in a non-leap year) become NaT.
+    """
+    jy = np.asarray(jy, dtype=np.int64)
+    jm = np.asarray(jm, dtype=np.int64)
+    jd = np.asarray(jd, dtype=np.int64)
+
+    month_ok = (jm >= 1) & (jm <= 12)
+    safe_m = np.where(month_ok, jm, 1)
+    month_len = np.where(safe_m <= 6, 31, 30)
+    valid = month_ok & (jd >= 1) & (jd <= month_len)
+
+    days = _jalali_day_number(jy, safe_m, jd)
+    # 30 Esfand only exists in leap years: otherwise it collides with 1 Farvardin of next year
+    esfand_30 = (safe_m == 12) & (jd == 30)
+    next_new_year = _jalali_day_number(jy + 1, np.ones_like(jy), np.ones_like(jy))
+    valid &= ~(esfand_30 & (days == next_new_year))
+
+    out = _EPOCH + days.astype('timedelta64[D]')
+    return np.where(valid, out, np.datetime64('NaT'))
+
+
+def parse_dates(values):
+    """
+    Parse a Series of dates the way jDateField does, vectorized:
+    - datetime/date cells (e.g. Excel date cells) are Gregorian
+    - 'YYYY-MM-DD' / 'YYYY/MM/DD' strings are Jalali, unless the year is > 1500 (Gregorian)
+    Returns a datetime64[D] ndarray (Gregorian) with NaT where parsing failed.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.normalize().to_numpy(dtype='datetime64[D]')
+
+    out = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[D]')
+
+    is_datetime = values.map(lambda v: hasattr(v, 'year') and hasattr(v, 'month') and not isinstance(v, str))
+    if is_datetime.any():
+        out[is_datetime.to_numpy()] = pd.to_datetime(values[is_datetime]).to_numpy(dtype='datetime64[D]')
+
+    parts = values[~is_datetime].astype(str).str.extract(_DATE_RE)
+    parsed = parts.notna().all(axis=1)
+    if parsed.any():
+        ymd = parts[parsed].astype(np.int64)
+        y, m, d = (ymd[c].to_numpy() for c in (0, 1, 2))
+        gregorian = y > 1500
+        result = jalali_to_datetime64(y, m, d)
+        if gregorian.any():
+            result[gregorian] = pd.to_datetime(
+                pd.DataFrame({'year': y[gregorian], 'month': m[gregorian], 'day': d[gregorian]}),
+                errors='coerce',
+            ).to_numpy(dtype='datetime64[D]')
+        idx = np.flatnonzero(~is_datetime.to_numpy())[parsed.to_numpy()]
+        out[idx] = result
+    return out
+
+
+def datetime64_to_jalali(dates):
+    """Gregorian datetime64[D] array -> (year, month, day) Jalali int64 arrays."""
+    j_day_no = (np.asarray(dates, dtype='datetime64[D]') - _EPOCH).astype(np.int64) - 79
+
+    j_np, j_day_no = np.divmod(j_day_no, 12053)
+    jy = 979 + 33 * j_np + 4 * (j_day_no // 1461)
+    j_day_no = j_day_no % 1461
+
+    past_leap = j_day_no >= 366
+    shifted = j_day_no - 1
+    jy = np.where(past_leap, jy + shifted // 365, jy)
+    j_day_no = np.where(past_leap, shifted % 365, j_day_no)
+
+    jm = np.searchsorted(_J_MONTH_OFFSETS, j_day_no, side='right')
+    jd = j_day_no - _J_MONTH_OFFSETS[jm - 1] + 1
+    return jy, jm, jd
+
+
+def format_jalali(dates):
+    """Gregorian datetime64[D] array -> list of Jalali 'YYYY-MM-DD' strings."""
+    jy, jm, jd = datetime64_to_jalali(dates)
+    return [f"{y:04d}-{m:02d}-{d:02d}" for y, m, d in zip(jy.tolist(), jm.tolist(), jd.tolist())]
+
+
+def parse_date_range(params):
+    """
+    (start, end) jdatetime.date bounds from Jalali `from` / `to` query parameters
+    (YYYY-MM-DD); missing bounds are None. Raises ValueError for unparseable dates.
+    """
+    bounds = []
+    for name in ('from', 'to'):
+        value = (params.get(name) or '').strip()
+        if not value:
+            bounds.append(None)
+            continue
+        parsed = parse_dates([value])[0]
+        if np.isnat(parsed):
+            raise ValueError(f'تاریخ نامعتبر: {value}')
+        bounds.append(jdatetime.date.fromgregorian(date=parsed.astype(object)))
+    return tuple(bounds)
+
+
+def date_range_params(start, end):
+    """'from=...&to=...' for the bounds that are set ('' when neither is), to carry a range into links."""
+    return urlencode({name: str(bound) for name, bound in (('from', start), ('to', end)) if bound is not None})
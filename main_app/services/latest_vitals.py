@@ -0,0 +1,78 @@
+# main_app/services/latest_vitals.py
+"""
+Maintenance of the LatestVitals projection (one row per patient).
+
+- refresh_latest_vitals: re-point a single patient's row after a write (one indexed query)
+- refresh_latest_vitals_bulk: the same for the patients of a bulk write, a batch at a time
+- rebuild_latest_vitals: rebuild the whole table in a single pass (used by the backfill command)
+"""
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from ..models import LatestVitals, Patient, VitalSigns
+
+
+def refresh_latest_vitals(patient_id):
+    """
+    Point the patient's LatestVitals row at their newest VitalSigns row
+    (ties on date are broken by id), or drop it if no readings remain.
+    """
+    latest = (
+        VitalSigns.objects.filter(patient_id=patient_id)
+        .order_by('-date', '-id')
+        .values_list('id', 'date')
+        .first()
+    )
+    if latest is None:
+        LatestVitals.objects.filter(patient_id=patient_id).delete()
+        return None
+
+    vs_id, date = latest
+    row, _ = LatestVitals.objects.update_or_create(
+        patient_id=patient_id,
+        defaults={'vital_signs_id': vs_id, 'date': date},
+    )
+    return row
+
+
+def _latest_rows(patients):
+    """(patient_id, vital_signs_id, date) of the newest reading of each patient that has one."""
+    newest = VitalSigns.objects.filter(patient=OuterRef('pk')).order_by('-date', '-id')
+    return (
+        patients.annotate(
+            latest_id=Subquery(newest.values('id')[:1]),
+            latest_date=Subquery(newest.values('date')[:1]),
+        )
+        .exclude(latest_id=None)
+        .values_list('id', 'latest_id', 'latest_date')
+    )
+
+
+def refresh_latest_vitals_bulk(patient_ids, batch_size=500):
+    """refresh_latest_vitals for many patients: one query, one delete and one insert per batch."""
+    patient_ids = sorted(set(patient_ids))
+    for i in range(0, len(patient_ids), batch_size):
+        batch = patient_ids[i:i + batch_size]
+        rows = list(_latest_rows(Patient.objects.filter(pk__in=batch)))
+        with transaction.atomic():
+            LatestVitals.objects.filter(patient_id__in=batch).delete()
+            LatestVitals.objects.bulk_create([
+                LatestVitals(patient_id=patient_id, vital_signs_id=vs_id, date=date) for patient_id, vs_id, date in rows
+            ])
+
+
+def rebuild_latest_vitals(batch_size=1000):
+    """
+    Rebuild the projection for every patient. Returns the number of rows written.
+    """
+    rows = _latest_rows(Patient.objects.all())
+
+    with transaction.atomic():
+        LatestVitals.objects.all().delete()
+        objs = [
+            LatestVitals(patient_id=patient_id, vital_signs_id=vs_id, date=date)
+            for patient_id, vs_id, date in rows.iterator(chunk_size=batch_size)
+        ]
+        LatestVitals.objects.bulk_create(objs, batch_size=batch_size)
+    return len(objs)
@@ -0,0 +1,188 @@
+# main_app/services/live_feed.py
+"""
+In-process publish/subscribe behind the doctor dashboard's live feed.
+
+- publish(kind, data): called by the save paths; the event is sent once the surrounding
+  transaction commits (never for rolled-back writes)
+- events get increasing ids and the last LIVE_FEED_BUFFER_SIZE are kept, so a client that
+  reconnects with Last-Event-ID or ?after= gets exactly what it missed
+- waiting subscribers are asyncio tasks woken with call_soon_threadsafe: no polling, and
+  no thread per connection under ASGI
+- a client whose id is no longer in the buffer (or is from before a restart) gets `resync`,
+  carrying `snapshot()` (alerts.feed_snapshot: the state re-read from the database)
+
+Only subscribers in the publishing process see an event, so the broker is a latency
+optimisation, not the source of truth: under WSGI (several worker processes, and a worker
+thread per waiting request) the poll view skips it and answers every short poll with a
+snapshot. Serve the SSE/long-poll feed from a single ASGI process.
+"""
+
+import asyncio
+import json
+import threading
+from collections import deque
+from dataclasses import asdict, dataclass
+
+from django.conf import settings
+from django.db import transaction
+
+DEFAULT_BUFFER_SIZE = 500
+# Comment line sent when nothing happened, so proxies keep the connection open
+KEEPALIVE_INTERVAL = 15
+# Streams are closed after this long; EventSource reconnects with Last-Event-ID
+STREAM_MAX_AGE = 300
+LONG_POLL_TIMEOUT = 25
+# Seconds between the short polls of WSGI deployments
+SHORT_POLL_INTERVAL = 5
+RETRY_MS = 3000
+
+ALERT = 'alert'
+ALERT_CLEARED = 'alert_cleared'
+EMERGENCY = 'emergency'
+RESYNC = 'resync'
+
+
+@dataclass(frozen=True)
+class FeedEvent:
+    id: int
+    kind: str
+    data: dict
+
+    def as_dict(self):
+        return asdict(self)
+
+    def sse(self):
+        return f'id: {self.id}\nevent: {self.kind}\ndata: {json.dumps(self.data, ensure_ascii=False)}\n\n'
+
+
+class Broker:
+    def __init__(self, size=DEFAULT_BUFFER_SIZE):
+        self._events = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._waiters = set()
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, kind, data):
+        with self._lock:
+            self._last_id += 1
+            event = FeedEvent(self._last_id, kind, data)
+            self._events.append(event)
+            waiters = list(self._waiters)
+        for loop, flag in waiters:
+            try:
+                loop.call_soon_threadsafe(flag.set)
+            except RuntimeError:
+                # The subscriber's loop is closed; its wait() is gone too
+                pass
+        return event
+
+    def events_after(self, after):
+        """(events newer than `after`, resync) where resync means some were dropped."""
+        with self._lock:
+            if after > self._last_id:
+                return [], True
+            oldest = self._events[0].id if self._events else self._last_id + 1
+            if after < oldest - 1:
+                return [], True
+            return [e for e in self._events if e.id > after], False
+
+    async def wait(self, after, timeout):
+        """events_after(after), waiting up to `timeout` seconds for something to arrive."""
+        events, resync = self.events_after(after)
+        if events or resync:
+            return events, resync
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            # Re-check once registered, or an event published in between would be missed
+            events, resync = self.events_after(after)
+            if events or resync:
+                return events, resync
+            try:
+                await asyncio.wait_for(waiter[1].wait(), timeout)
+            except asyncio.TimeoutError:
+                return [], False
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+        return self.events_after(after)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = Broker(getattr(settings, 'LIVE_FEED_BUFFER_SIZE', DEFAULT_BUFFER_SIZE))
+    return _broker
+
+
+def publish(kind, data):
+    transaction.on_commit(lambda: get_broker().publish(kind, data))
+
+
+def parse_after(request):
+    """The client's last seen id (Last-Event-ID wins over ?after=); None for "from now on"."""
+    value = request.headers.get('Last-Event-ID') or request.GET.get('after') or ''
+    return int(value) if value.isdigit() else None
+
+
+async def stream(after=None, snapshot=None):
+    """
+    SSE strings for the feed, from `after` on, until STREAM_MAX_AGE. A resync event
+    carries `await snapshot()` when given.
+    """
+    broker = get_broker()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + STREAM_MAX_AGE
+    after = broker.last_id if after is None else after
+    yield f'retry: {RETRY_MS}\n\n'
+    while loop.time() < deadline:
+        events, resync = await broker.wait(after, min(KEEPALIVE_INTERVAL, deadline - loop.time()))
+        if resync:
+            after = broker.last_id
+            yield FeedEvent(after, RESYNC, await snapshot() if snapshot else {}).sse()
+        elif not events:
+            yield ': keepalive\n\n'
+        for event in events:
+            after = event.id
+            yield event.sse()
+
+
+async def long_poll(after=None, snapshot=None, timeout=LONG_POLL_TIMEOUT):
+    """
+    One long-poll response body: the events after `after`, waiting up to `timeout`;
+    on resync it carries `await snapshot()` when given.
+    """
+    broker = get_broker()
+    after = broker.last_id if after is None else after
+    events, resync = await broker.wait(after, timeout)
+    body = {
+        'events': [event.as_dict() for event in events],
+        'last_id': events[-1].id if events else (broker.last_id if resync else after),
+        'resync': resync,
+        'poll_after': 0,
+    }
+    if resync and snapshot is not None:
+        body['snapshot'] = await snapshot()
+    return body
+
+
+def alert_event(alert_id, patient_id, patient_name, code, severity, label):
+    return {
+        'id': alert_id, 'patient_id': patient_id, 'code': code, 'severity': severity,
+        'message': f'بیمار {patient_name}: {label}',
+    }
+
+
+def emergency_event(patient):
+    return {'patient_id': patient.pk, 'name': str(patient), 'emergency': patient.emergency}
@@ -0,0 +1,120 @@
+# main_app/services/profiling.py
+"""
+Per-request timing state shared by ProfilingMiddleware and the code it measures.
+
+- RequestProfile accumulates query count/SQL time, template render time and AI time
+- timed(kind) adds the duration of a block to the active profile (a no-op outside
+  a profiled request, e.g. in run_summary_worker)
+- the last PROFILING_BUFFER_SIZE finished requests are kept in a ring buffer
+"""
+
+import contextvars
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+from django.conf import settings
+
+DEFAULT_BUFFER_SIZE = 500
+
+_current = contextvars.ContextVar('request_profile', default=None)
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+@dataclass
+class RequestProfile:
+    method: str = ''
+    path: str = ''
+    status: int = 0
+    started_at: float = field(default_factory=time.time)
+    total_ms: float = 0.0
+    queries: int = 0
+    sql_ms: float = 0.0
+    template_ms: float = 0.0
+    ai_ms: float = 0.0
+
+    def server_timing(self):
+        return ', '.join([
+            f'sql;dur={self.sql_ms:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_ms:.1f}',
+            f'ai;dur={self.ai_ms:.1f}',
+            f'total;dur={self.total_ms:.1f}',
+        ])
+
+    def as_dict(self):
+        return {k: round(v, 2) if isinstance(v, float) else v for k, v in asdict(self).items()}
+
+
+def current_profile():
+    return _current.get()
+
+
+def activate(profile):
+    """Make `profile` the active one; returns a token for deactivate()."""
+    return _current.set(profile)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+@contextmanager
+def timed(kind):
+    """Add the block's wall time to `<kind>_ms` of the active profile, if any."""
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        attr = f'{kind}_ms'
+        setattr(profile, attr, getattr(profile, attr) + (time.perf_counter() - t0) * 1000)
+
+
+def profiled(kind):
+    """Decorator form of timed()."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def sql_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrapper hook counting queries and SQL time for the active profile."""
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    t0 = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.sql_ms += (time.perf_counter() - t0) * 1000
+        profile.queries += 1
+
+
+def recent_requests():
+    """The ring buffer (a deque of RequestProfile), created on first use."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = deque(maxlen=getattr(settings, 'PROFILING_BUFFER_SIZE', DEFAULT_BUFFER_SIZE))
+    return _buffer
+
+
+def record(profile):
+    # deque.append is atomic, so concurrent requests need no lock
+    recent_requests().append(profile)
+
+
+def slowest_requests(limit=20):
+    return sorted(list(recent_requests()), key=lambda p: p.total_ms, reverse=True)[:limit]
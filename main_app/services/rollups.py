@@ -0,0 +1,179 @@
+# main_app/services/rollups.py
+"""
+Daily and ISO-weekly vitals rollups (VitalsRollup) for long-range charts and prompts.
+
+- refresh_rollups: recompute the buckets touched by a write from the raw rows, either
+  one week (single save/delete) or the dates of a bulk write, in one delete + one
+  executemany'd INSERT per batch of patients
+- rebuild_rollups: the same for every patient (the rebuild command)
+- weekly_series / attach_weekly_trends: what the chart and the AI prompt read for long ranges
+
+Aggregation is vectorized with pandas over (patient, day) and (patient, Monday) keys.
+A reading whose date is edited refreshes both its old and its new week (signals.py).
+"""
+
+from datetime import timedelta
+
+import jdatetime
+import numpy as np
+import pandas as pd
+from django.db import connection, transaction
+from django.db.models import DateField, ExpressionWrapper, F
+
+from ..models import Patient, VitalSigns, VitalsRollup
+from .alert_rules import FIELDS as VITAL_COLUMNS
+
+STATS = ('min', 'max', 'mean')
+# Patients per batch for bulk refreshes and the rebuild
+BATCH_SIZE = 200
+TREND_WEEKS = 12
+
+
+def _gregorian(value):
+    """datetime.date for a jdatetime/datetime date."""
+    return value.togregorian() if isinstance(value, jdatetime.date) else value
+
+
+def week_start(day):
+    """Monday of the ISO week of a Gregorian date."""
+    return day - timedelta(days=day.weekday())
+
+
+def _readings_frame(patient_ids, start=None, end=None):
+    queryset = VitalSigns.objects.filter(patient_id__in=patient_ids)
+    if start is not None:
+        queryset = queryset.filter(date__gte=jdatetime.date.fromgregorian(date=start))
+    if end is not None:
+        queryset = queryset.filter(date__lte=jdatetime.date.fromgregorian(date=end))
+    rows = (
+        queryset.annotate(gregorian_date=ExpressionWrapper(F('date'), output_field=DateField()))
+        .values_list('patient_id', 'gregorian_date', *VITAL_COLUMNS)
+    )
+    frame = pd.DataFrame.from_records(list(rows), columns=['patient_id', 'date'] + VITAL_COLUMNS)
+    frame['date'] = frame['date'].to_numpy(dtype='datetime64[D]')
+    return frame
+
+
+def rollup_frame(readings):
+    """
+    Rollup rows (patient_id, period, period_start, count, <vital>_<stat>...) for a frame of
+    readings with patient_id, datetime64 date and VITAL_COLUMNS.
+    """
+    if readings.empty:
+        return pd.DataFrame()
+    days = readings['date'].to_numpy(dtype='datetime64[D]')
+    # 1970-01-01 was a Thursday: (days + 3) % 7 is the ISO weekday, Monday = 0
+    ordinal = days.astype(np.int64)
+    mondays = (ordinal - (ordinal + 3) % 7).astype('datetime64[D]')
+
+    frames = []
+    for period, starts in ((VitalsRollup.DAY, days), (VitalsRollup.WEEK, mondays)):
+        grouped = readings[VITAL_COLUMNS].astype(float).groupby([readings['patient_id'], starts])
+        stats = grouped.agg(list(STATS))
+        stats.columns = [f'{field}_{stat}' for field, stat in stats.columns]
+        stats['count'] = grouped.size()
+        stats = stats.reset_index(names=['patient_id', 'period_start'])
+        stats['period'] = period
+        frames.append(stats)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _insert_rollups(frame, batch_size=1000):
+    """
+    INSERT the rows of a rollup_frame, executemany'd in chunks. Raw SQL because model
+    instances cost more than the aggregation itself on bulk writes.
+    """
+    if frame.empty:
+        return 0
+    qn = connection.ops.quote_name
+    fields = ['patient', 'period', 'period_start', 'count'] + [f'{f}_{stat}' for f in VITAL_COLUMNS for stat in STATS]
+    columns = [VitalsRollup._meta.get_field(name).column for name in fields]
+    sql = (
+        f"INSERT INTO {qn(VitalsRollup._meta.db_table)} ({', '.join(qn(c) for c in columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))})"
+    )
+    params = list(zip(
+        frame['patient_id'].astype(int).tolist(),
+        frame['period'].tolist(),
+        # jDateField stores the Gregorian date
+        np.datetime_as_string(frame['period_start'].to_numpy(dtype='datetime64[D]'), unit='D').tolist(),
+        frame['count'].astype(int).tolist(),
+        *(frame[name].astype(float).tolist() for name in fields[4:]),
+    ))
+    with connection.cursor() as cursor:
+        for i in range(0, len(params), batch_size):
+            cursor.executemany(sql, params[i:i + batch_size])
+    return len(params)
+
+
+def refresh_rollups(patient_ids, start=None, end=None, batch_size=BATCH_SIZE):
+    """
+    Recompute the rollups of `patient_ids` for the weeks overlapping [start, end]
+    (whole history when both are None). Returns the number of rollup rows written.
+    """
+    patient_ids = sorted(set(patient_ids))
+    if start is not None or end is not None:
+        start = week_start(_gregorian(start or end))
+        end = week_start(_gregorian(end or start)) + timedelta(days=6)
+
+    written = 0
+    for i in range(0, len(patient_ids), batch_size):
+        batch = patient_ids[i:i + batch_size]
+        frame = rollup_frame(_readings_frame(batch, start, end))
+        with transaction.atomic():
+            stale = VitalsRollup.objects.filter(patient_id__in=batch)
+            if start is not None:
+                stale = stale.filter(
+                    period_start__gte=jdatetime.date.fromgregorian(date=start),
+                    period_start__lte=jdatetime.date.fromgregorian(date=end),
+                )
+            stale.delete()
+            written += _insert_rollups(frame)
+    return written
+
+
+def rebuild_rollups(batch_size=BATCH_SIZE):
+    """Recompute every patient's rollups. Returns the number of rollup rows written."""
+    with transaction.atomic():
+        VitalsRollup.objects.all().delete()
+        patient_ids = list(Patient.objects.order_by('pk').values_list('pk', flat=True))
+        return refresh_rollups(patient_ids, batch_size=batch_size)
+
+
+def _weekly(patient, start=None, end=None):
+    queryset = VitalsRollup.objects.filter(patient=patient, period=VitalsRollup.WEEK)
+    if start is not None:
+        queryset = queryset.filter(period_start__gte=jdatetime.date.fromgregorian(date=week_start(_gregorian(start))))
+    if end is not None:
+        queryset = queryset.filter(period_start__lte=end)
+    return queryset
+
+
+def weekly_series(patient, fields, start=None, end=None, stats=STATS):
+    """
+    (Monday dates as datetime64[D], {stat: [array per field]}) of the weeks overlapping
+    [start, end], oldest first, in one indexed query.
+    """
+    names = [f'{field}_{stat}' for stat in stats for field in fields]
+    rows = list(
+        _weekly(patient, start, end).order_by('period_start')
+        .annotate(gregorian_start=ExpressionWrapper(F('period_start'), output_field=DateField()))
+        .values_list('gregorian_start', *names)
+    )
+    dates = np.array([row[0] for row in rows], dtype='datetime64[D]')
+    columns = [np.array([row[i] for row in rows], dtype=float) for i in range(1, len(names) + 1)]
+    return dates, {stat: columns[i * len(fields):(i + 1) * len(fields)] for i, stat in enumerate(stats)}
+
+
+def attach_weekly_trends(patient, weeks=TREND_WEEKS, end=None):
+    """
+    Set patient.weekly_rollups to the last `weeks` weekly rollups up to `end`, newest
+    first, for the AI prompt builder (which does no queries of its own). Returns the patient.
+    """
+    patient.weekly_rollups = list(_weekly(patient, end=end).order_by('-period_start')[:weeks])
+    return patient
+
+
+async def aattach_weekly_trends(patient, weeks=TREND_WEEKS, end=None):
+    patient.weekly_rollups = [row async for row in _weekly(patient, end=end).order_by('-period_start')[:weeks]]
+    return patient
@@ -0,0 +1,191 @@
+# main_app/services/summary_cache.py
+"""
+Persistent cache in front of ai_summary.generate_patient_summary_with_source.
+
+- key: sha256 of the exact messages built for the model plus the model list,
+  so any change in the prompt inputs (vitals, medications, reason, ...) is a miss
+- TTL: settings.AI_SUMMARY_CACHE_TTL seconds (default one day)
+- LRU: at most settings.AI_SUMMARY_CACHE_MAX_ENTRIES rows, least recently used evicted first
+- only real AI answers are stored here; the rule-based fallback is cheap and should be
+  retried, except that a job no worker picked up (summary_jobs.settle_unclaimed) keeps its
+  fallback in the Django cache for AI_SUMMARY_FALLBACK_TTL seconds, under the same key
+- a*-prefixed twins use the async ORM for the ASGI summary endpoint
+"""
+
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from ..models import AISummaryCache
+from .ai_summary import (
+    MODEL_CANDIDATES,
+    SOURCE_AI,
+    SOURCE_CACHE,
+    build_messages,
+    generate_patient_summary_with_source,
+)
+from .ai_summary_async import agenerate_patient_summary_with_source
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_FALLBACK_TTL = 5 * 60
+# Don't rewrite last_used_at on every hit; minute resolution is plenty for LRU
+TOUCH_INTERVAL = timedelta(minutes=1)
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'AI_SUMMARY_CACHE_TTL', DEFAULT_TTL))
+
+
+def _max_entries():
+    return getattr(settings, 'AI_SUMMARY_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+
+
+def _model_name():
+    return ",".join(MODEL_CANDIDATES)
+
+
+def summary_cache_key(patient, vital_signs):
+    payload = json.dumps([_model_name(), build_messages(patient, vital_signs)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_cached_summary(patient, vital_signs):
+    """Return the cached summary text for this exact prompt, or None."""
+    key = summary_cache_key(patient, vital_signs)
+    now = timezone.now()
+    hit = (
+        AISummaryCache.objects.filter(key=key, created_at__gte=now - _ttl())
+        .only('id', 'summary', 'last_used_at')
+        .first()
+    )
+    if hit is None:
+        return None
+    if now - hit.last_used_at > TOUCH_INTERVAL:
+        AISummaryCache.objects.filter(pk=hit.pk).update(last_used_at=now)
+    return hit.summary
+
+
+async def aget_cached_summary(patient, vital_signs):
+    key = summary_cache_key(patient, vital_signs)
+    now = timezone.now()
+    hit = await (
+        AISummaryCache.objects.filter(key=key, created_at__gte=now - _ttl())
+        .only('id', 'summary', 'last_used_at')
+        .afirst()
+    )
+    if hit is None:
+        return None
+    if now - hit.last_used_at > TOUCH_INTERVAL:
+        await AISummaryCache.objects.filter(pk=hit.pk).aupdate(last_used_at=now)
+    return hit.summary
+
+
+def _fallback_key(key):
+    return f'ai_summary_fallback:{key}'
+
+
+def get_cached_fallback(patient, vital_signs):
+    """The fallback stored by store_fallback for this exact prompt, or None."""
+    return cache.get(_fallback_key(summary_cache_key(patient, vital_signs)))
+
+
+def store_fallback(patient, vital_signs, summary):
+    cache.set(
+        _fallback_key(summary_cache_key(patient, vital_signs)), summary,
+        getattr(settings, 'AI_SUMMARY_FALLBACK_TTL', DEFAULT_FALLBACK_TTL),
+    )
+
+
+def _summary_defaults(patient, summary, now):
+    return {
+        'patient': patient,
+        'model': _model_name(),
+        'summary': summary,
+        'created_at': now,
+        'last_used_at': now,
+    }
+
+
+def store_summary(patient, vital_signs, summary):
+    key = summary_cache_key(patient, vital_signs)
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            AISummaryCache.objects.update_or_create(key=key, defaults=_summary_defaults(patient, summary, now))
+    except IntegrityError:
+        # Another worker stored the same prompt concurrently
+        pass
+    evict_summaries()
+
+
+async def astore_summary(patient, vital_signs, summary):
+    key = summary_cache_key(patient, vital_signs)
+    try:
+        # aupdate_or_create runs update_or_create (and its transaction) in a worker thread
+        await AISummaryCache.objects.aupdate_or_create(key=key, defaults=_summary_defaults(patient, summary, timezone.now()))
+    except IntegrityError:
+        pass
+    await aevict_summaries()
+
+
+def evict_summaries():
+    """Drop expired rows, then the least recently used rows above the size limit."""
+    AISummaryCache.objects.filter(created_at__lt=timezone.now() - _ttl()).delete()
+    stale = AISummaryCache.objects.order_by('-last_used_at').values_list('pk', flat=True)[_max_entries():]
+    stale_ids = list(stale)
+    if stale_ids:
+        AISummaryCache.objects.filter(pk__in=stale_ids).delete()
+
+
+async def aevict_summaries():
+    await AISummaryCache.objects.filter(created_at__lt=timezone.now() - _ttl()).adelete()
+    stale = AISummaryCache.objects.order_by('-last_used_at').values_list('pk', flat=True)[_max_entries():]
+    stale_ids = [pk async for pk in stale]
+    if stale_ids:
+        await AISummaryCache.objects.filter(pk__in=stale_ids).adelete()
+
+
+def invalidate_patient_summaries(patient_id):
+    AISummaryCache.objects.filter(patient_id=patient_id).delete()
+
+
+def invalidate_summaries(patient_ids, batch_size=500):
+    """invalidate_patient_summaries for the patients of a bulk write."""
+    patient_ids = sorted(set(patient_ids))
+    for i in range(0, len(patient_ids), batch_size):
+        AISummaryCache.objects.filter(patient_id__in=patient_ids[i:i + batch_size]).delete()
+
+
+def get_patient_summary(patient, vital_signs):
+    """
+    Cached summary lookup with generation on miss.
+    Returns (summary, error, source) with source in {"cache", "ai", "fallback"}.
+    """
+    vital_signs = list(vital_signs)
+    cached = get_cached_summary(patient, vital_signs)
+    if cached is not None:
+        return (cached, None, SOURCE_CACHE)
+
+    summary, error, source = generate_patient_summary_with_source(patient, vital_signs)
+    if source == SOURCE_AI and summary:
+        store_summary(patient, vital_signs, summary)
+    return (summary, error, source)
+
+
+async def aget_patient_summary(patient, vital_signs):
+    """get_patient_summary for async views; vital_signs must already be loaded."""
+    vital_signs = list(vital_signs)
+    cached = await aget_cached_summary(patient, vital_signs)
+    if cached is not None:
+        return (cached, None, SOURCE_CACHE)
+
+    summary, error, source = await agenerate_patient_summary_with_source(patient, vital_signs)
+    if source == SOURCE_AI and summary:
+        await astore_summary(patient, vital_signs, summary)
+    return (summary, error, source)
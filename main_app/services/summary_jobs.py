@@ -0,0 +1,168 @@
+# main_app/services/summary_jobs.py
+"""
+Local DB-backed job queue for AI summaries (no external broker).
+
+- enqueue_summary: called by the web endpoint; reuses a patient's open job
+- claim_next_job: atomic queued -> running transition for a worker
+- run_job: builds the summary through the persistent cache and stores the result
+- settle_unclaimed: finishes a job no worker claimed within the grace period with the
+  local fallback, so pages never wait on a queue nobody serves
+- job_payload: JSON body shared by the enqueue and status endpoints
+
+Workers are started with `python manage.py run_summary_worker`.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import SummaryJob
+from .ai_summary import SOURCE_FALLBACK, _local_fallback_summary
+from .rollups import attach_weekly_trends
+from .summary_cache import get_patient_summary, store_fallback
+from .vitals_series import get_series
+
+logger = logging.getLogger("ai_summary")
+
+# Rows passed to the prompt builder, same as the synchronous endpoint used
+SUMMARY_VITALS_LIMIT = 50
+# A running job whose worker died is handed out again after this long
+DEFAULT_STALE_AFTER = 120
+# A queued job nobody claimed after this long is answered with the local fallback
+DEFAULT_CLAIM_GRACE = 10
+MAX_ATTEMPTS = 3
+# Finished jobs are kept this long so pollers can read the result
+FINISHED_JOB_RETENTION = timedelta(days=1)
+
+OPEN_STATUSES = (SummaryJob.QUEUED, SummaryJob.RUNNING)
+
+
+def _stale_after():
+    return timedelta(seconds=getattr(settings, 'AI_SUMMARY_JOB_STALE_AFTER', DEFAULT_STALE_AFTER))
+
+
+def _claim_grace():
+    return timedelta(seconds=getattr(settings, 'AI_SUMMARY_JOB_CLAIM_GRACE', DEFAULT_CLAIM_GRACE))
+
+
+def summary_vitals(patient, start=None, end=None):
+    """The newest readings within [start, end] for the prompt builder, newest first."""
+    return get_series(patient, start, end).newest(SUMMARY_VITALS_LIMIT)
+
+
+def enqueue_summary(patient, start=None, end=None):
+    """Return the patient's open job for the same date range, or queue a new one."""
+    with transaction.atomic():
+        job = (
+            SummaryJob.objects.filter(patient=patient, status__in=OPEN_STATUSES, date_from=start, date_to=end)
+            .order_by('-created_at')
+            .first()
+        )
+        if job is None:
+            job = SummaryJob.objects.create(patient=patient, date_from=start, date_to=end)
+            logger.info("📥 job خلاصه در صف قرار گرفت: %s", job.pk)
+    return job
+
+
+def claim_next_job(worker_id):
+    """
+    Move the oldest claimable job to RUNNING for this worker and return it (or None).
+    Claimable: queued, or running for longer than the stale timeout (crashed worker).
+    The conditional UPDATE makes the claim safe with several worker processes.
+    """
+    now = timezone.now()
+    SummaryJob.objects.filter(
+        status=SummaryJob.RUNNING, started_at__lt=now - _stale_after(), attempts__gte=MAX_ATTEMPTS,
+    ).update(status=SummaryJob.FAILED, error='پردازشگر پاسخ نداد.', finished_at=now)
+
+    while True:
+        candidate = (
+            SummaryJob.objects.filter(status=SummaryJob.QUEUED)
+            .order_by('created_at')
+            .values_list('pk', 'status', 'started_at')
+            .first()
+        )
+        if candidate is None:
+            candidate = (
+                SummaryJob.objects.filter(status=SummaryJob.RUNNING, started_at__lt=now - _stale_after())
+                .order_by('started_at')
+                .values_list('pk', 'status', 'started_at')
+                .first()
+            )
+        if candidate is None:
+            return None
+
+        pk, status, started_at = candidate
+        claimed = SummaryJob.objects.filter(pk=pk, status=status, started_at=started_at).update(
+            status=SummaryJob.RUNNING, started_at=now, worker=worker_id, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return SummaryJob.objects.select_related('patient').get(pk=pk)
+        # Another worker won the race; try the next one
+
+
+def run_job(job):
+    """Generate (or read from cache) the summary for a claimed job and store the outcome."""
+    try:
+        patient = attach_weekly_trends(job.patient, end=job.date_to)
+        vital_signs = summary_vitals(patient, job.date_from, job.date_to)
+        summary, error, source = get_patient_summary(patient, vital_signs)
+    except Exception as e:
+        logger.exception("❌ job خلاصه %s ناموفق: %s", job.pk, e)
+        status = SummaryJob.FAILED if job.attempts >= MAX_ATTEMPTS else SummaryJob.QUEUED
+        SummaryJob.objects.filter(pk=job.pk).update(status=status, error=str(e), finished_at=timezone.now())
+        return
+
+    SummaryJob.objects.filter(pk=job.pk).update(
+        status=SummaryJob.DONE,
+        summary=summary or '',
+        error=error or '',
+        source=source,
+        finished_at=timezone.now(),
+    )
+    logger.info("✅ job خلاصه %s انجام شد (%s)", job.pk, source)
+
+
+def settle_unclaimed(job):
+    """
+    Finish `job` with the local fallback (cached for AI_SUMMARY_FALLBACK_TTL) if it is
+    still queued after the claim grace period, i.e. no run_summary_worker is serving the
+    queue. Returns the job as it now stands.
+    """
+    if job.status != SummaryJob.QUEUED or timezone.now() - job.created_at < _claim_grace():
+        return job
+    patient = attach_weekly_trends(job.patient, end=job.date_to)
+    vital_signs = summary_vitals(patient, job.date_from, job.date_to)
+    summary = _local_fallback_summary(patient, vital_signs)
+    # Conditional like claim_next_job: a worker that claimed the job meanwhile keeps it
+    settled = SummaryJob.objects.filter(pk=job.pk, status=SummaryJob.QUEUED).update(
+        status=SummaryJob.DONE, summary=summary, error='', source=SOURCE_FALLBACK, finished_at=timezone.now(),
+    )
+    if settled:
+        store_fallback(patient, vital_signs, summary)
+        logger.warning("⌛ job خلاصه %s توسط هیچ پردازشگری برداشته نشد → فال‌بک محلی", job.pk)
+    job.refresh_from_db()
+    return job
+
+
+def purge_finished_jobs():
+    cutoff = timezone.now() - FINISHED_JOB_RETENTION
+    SummaryJob.objects.filter(status__in=(SummaryJob.DONE, SummaryJob.FAILED), created_at__lt=cutoff).delete()
+
+
+def job_payload(job):
+    payload = {
+        'job_id': str(job.pk),
+        'status': job.status,
+        'status_url': reverse('ai_summary_job_status', args=[job.pk]),
+    }
+    if job.status == SummaryJob.DONE:
+        payload.update(summary=job.summary, error=job.error or None, source=job.source)
+    elif job.status == SummaryJob.FAILED:
+        payload.update(summary=None, error=job.error or 'تولید خلاصه ناموفق بود.')
+    return payload
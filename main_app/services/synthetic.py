@@ -0,0 +1,83 @@
+# main_app/services/synthetic.py
+"""
+Synthetic patients and vital signs for load testing and benchmarks.
+
+- patients get Persian names, an age, a reason and ~10% are emergencies
+- each patient gets one reading per day for the last M days (Jalali dates once stored),
+  drawn around a per-patient baseline that drifts with age, with occasional fever spikes
+- vitals are written through vitals_import.upsert_vitals, so LatestVitals and the
+  other projections are maintained exactly as for a real import
+"""
+
+import numpy as np
+import pandas as pd
+from django.utils import timezone
+
+from ..models import Patient
+from .fragment_cache import PATIENTS, bump_fragments
+from .vitals_import import upsert_vitals
+
+FIRST_NAMES = ['علی', 'محمد', 'زهرا', 'فاطمه', 'حسین', 'مریم', 'رضا', 'سارا', 'مهدی', 'نرگس', 'امیر', 'لیلا']
+LAST_NAMES = ['احمدی', 'محمدی', 'حسینی', 'رضایی', 'کریمی', 'موسوی', 'جعفری', 'صادقی', 'رحیمی', 'کاظمی']
+REASONS = ['فشار خون بالا', 'دیابت نوع ۲', 'تب و عفونت', 'درد قفسه سینه', 'پیگیری پس از جراحی', 'تنگی نفس']
+MEDICATIONS = ['', 'متفورمین', 'لوزارتان', 'آسپرین', 'آتورواستاتین', 'انسولین']
+
+PATIENT_BATCH = 500
+
+
+def synthetic_patients(count, rng):
+    """Unsaved Patient instances."""
+    return [
+        Patient(
+            first_name=FIRST_NAMES[rng.integers(len(FIRST_NAMES))],
+            last_name=f'{LAST_NAMES[rng.integers(len(LAST_NAMES))]} {i + 1}',
+            age=int(rng.integers(18, 91)),
+            reason=REASONS[rng.integers(len(REASONS))],
+            medications=MEDICATIONS[rng.integers(len(MEDICATIONS))],
+            emergency=bool(rng.random() < 0.1),
+        )
+        for i in range(count)
+    ]
+
+
+def synthetic_vitals(patient_ids, ages, per_patient, rng, end=None):
+    """
+    Validated-frame-shaped vitals (row, patient_id, date, VITAL_COLUMNS) with one
+    reading per patient per day, ending at `end` (today by default).
+    """
+    n_patients = len(patient_ids)
+    rows = n_patients * per_patient
+    end = np.datetime64(end or timezone.localdate(), 'D')
+    ages = np.repeat(np.asarray(ages, dtype=float), per_patient)
+
+    def around(baseline, spread, noise):
+        per_patient_base = np.repeat(rng.normal(baseline, spread, n_patients), per_patient)
+        return per_patient_base + rng.normal(0, noise, rows)
+
+    fever = rng.random(rows) < 0.03
+    temperature = around(36.8, 0.2, 0.3) + np.where(fever, rng.uniform(1.2, 3.0, rows), 0)
+    return pd.DataFrame({
+        'row': np.arange(rows) + 2,
+        'patient_id': np.repeat(np.asarray(patient_ids), per_patient),
+        'date': end - np.tile(np.arange(per_patient)[::-1], n_patients).astype('timedelta64[D]'),
+        'blood_pressure_systolic': np.clip(around(105, 8, 7) + ages * 0.4, 80, 220).round().astype(int),
+        'blood_pressure_diastolic': np.clip(around(68, 6, 5) + ages * 0.15, 45, 130).round().astype(int),
+        'heart_rate': np.clip(around(76, 8, 6), 40, 180).round().astype(int),
+        'blood_sugar': np.clip(around(85, 12, 10) + ages * 0.6, 60, 450).round().astype(int),
+        'body_temperature': np.clip(temperature, 34.0, 42.0).round(1),
+    })
+
+
+def seed_synthetic(patients, vitals_per_patient, seed=0, batch_size=PATIENT_BATCH):
+    """Create `patients` patients with `vitals_per_patient` daily readings each. Returns counts."""
+    rng = np.random.default_rng(seed)
+    created = readings = 0
+    for start in range(0, patients, batch_size):
+        batch = Patient.objects.bulk_create(synthetic_patients(min(batch_size, patients - start), rng))
+        created += len(batch)
+        # bulk_create skips post_save
+        bump_fragments(PATIENTS)
+        if vitals_per_patient:
+            frame = synthetic_vitals([p.pk for p in batch], [p.age for p in batch], vitals_per_patient, rng)
+            readings += upsert_vitals(frame).inserted
+    return {'patients': created, 'vital_signs': readings}
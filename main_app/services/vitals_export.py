@@ -0,0 +1,192 @@
+# main_app/services/vitals_export.py
+"""
+Streaming export of a patient's vital signs.
+
+Rows are read with `.values_list(...).iterator(chunk_size=...)` and written chunk by
+chunk, so memory does not grow with history size. When the patient's columnar series
+is already resident in the series cache (services/vitals_series.py, which only keeps
+series under its size bound) the chunks are sliced from it instead; an export never
+loads or evicts a cache entry.
+- csv:     encoded and yielded as it is produced (first byte after the first chunk)
+- xlsx:    xlsxwriter in constant_memory mode into a temp file, then streamed from disk
+- parquet: one row group per chunk through pyarrow (optional dependency)
+"""
+
+import csv
+import io
+import os
+import tempfile
+from itertools import islice
+
+import numpy as np
+from django.db.models import DateField, ExpressionWrapper, F
+
+from .jalali import format_jalali
+from .vitals_series import get_series_cache, vitals_between
+
+# --- pyarrow optional import ---
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:  # pragma: no cover
+    pa = None  # type: ignore
+
+CHUNK_SIZE = 2000
+FILE_BLOCK_SIZE = 64 * 1024
+
+COLUMNS = [
+    'id', 'date', 'blood_pressure_systolic', 'blood_pressure_diastolic',
+    'heart_rate', 'blood_sugar', 'body_temperature',
+]
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class ExportFormatError(ValueError):
+    pass
+
+
+def _iter_chunks(queryset, chunk_size=CHUNK_SIZE):
+    """Yield lists of row tuples with Jalali 'YYYY-MM-DD' dates (same format upload_excel reads)."""
+    # Read the stored Gregorian date as a plain DateField and convert a whole chunk at once,
+    # instead of building a jdatetime.date per row
+    rows = (
+        queryset.order_by('date', 'id')
+        .annotate(gregorian_date=ExpressionWrapper(F('date'), output_field=DateField()))
+        .values_list('id', 'gregorian_date', *COLUMNS[2:])
+        .iterator(chunk_size=chunk_size)
+    )
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        dates = format_jalali(np.array([row[1] for row in chunk], dtype='datetime64[D]'))
+        yield [(row[0], date) + row[2:] for row, date in zip(chunk, dates)]
+
+
+def _iter_series_chunks(series, chunk_size=CHUNK_SIZE):
+    """_iter_chunks over a resident VitalsSeries: the same rows, with no query."""
+    for lo in range(0, len(series), chunk_size):
+        hi = lo + chunk_size
+        columns = [series.values[field][lo:hi].tolist() for field in COLUMNS[2:]]
+        yield list(zip(series.ids[lo:hi].tolist(), format_jalali(series.dates[lo:hi]), *columns))
+
+
+class _Echo:
+    """csv.writer target that hands back what was written instead of buffering it."""
+
+    def write(self, value):
+        return value
+
+
+def _stream_csv(chunks):
+    writer = csv.writer(_Echo())
+    # BOM so Excel opens the UTF-8 file with the right encoding
+    yield ('\ufeff' + writer.writerow(COLUMNS)).encode('utf-8')
+    for chunk in chunks:
+        yield ''.join(writer.writerow(row) for row in chunk).encode('utf-8')
+
+
+def _stream_file(path):
+    try:
+        with open(path, 'rb') as fh:
+            while True:
+                block = fh.read(FILE_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+    finally:
+        os.remove(path)
+
+
+def _stream_xlsx(chunks):
+    import xlsxwriter
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+        sheet = workbook.add_worksheet('Vital Signs')
+        sheet.write_row(0, 0, COLUMNS)
+        r = 1
+        for chunk in chunks:
+            for row in chunk:
+                sheet.write_row(r, 0, row)
+                r += 1
+        workbook.close()
+    except Exception:
+        os.remove(path)
+        raise
+    yield from _stream_file(path)
+
+
+class _DrainableSink(io.RawIOBase):
+    """Write-only file object for pyarrow whose contents can be drained after each row group."""
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._parts.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _stream_parquet(chunks):
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('date', pa.string()),
+        ('blood_pressure_systolic', pa.int32()),
+        ('blood_pressure_diastolic', pa.int32()),
+        ('heart_rate', pa.int32()),
+        ('blood_sugar', pa.int32()),
+        ('body_temperature', pa.float64()),
+    ])
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for chunk in chunks:
+        columns = list(zip(*chunk))
+        arrays = [pa.array(c, type=f.type) for c, f in zip(columns, schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+def stream_vital_signs(patient, fmt='xlsx', start=None, end=None):
+    """
+    Return (byte iterator, content_type, file extension) for the requested format,
+    covering the readings dated within [start, end] (jdatetime dates, None = open).
+    Raises ExportFormatError for unknown formats or a missing optional dependency.
+    """
+    if fmt not in FORMATS:
+        raise ExportFormatError(f"فرمت خروجی نامعتبر است: {fmt}")
+    if fmt == 'parquet' and pa is None:
+        raise ExportFormatError("برای خروجی Parquet نصب pyarrow لازم است.")
+
+    series = get_series_cache().peek(getattr(patient, 'pk', patient))
+    if series is not None:
+        chunks = _iter_series_chunks(series.between(start, end))
+    else:
+        chunks = _iter_chunks(vitals_between(patient, start, end))
+    stream = {'csv': _stream_csv, 'xlsx': _stream_xlsx, 'parquet': _stream_parquet}[fmt](chunks)
+    content_type, extension = FORMATS[fmt]
+    return stream, content_type, extension
@@ -0,0 +1,214 @@
+# main_app/services/vitals_import.py
+"""
+Set-based import of vital signs from a DataFrame (Excel upload and other bulk paths).
+
+- check_vitals_frame: vectorized validation of types and ranges, one message string per row
+- validate_vitals_frame: the same plus column checks, split into clean rows and error messages
+- upsert_vitals: resolves existing (patient, date) pairs with one range query per patient batch
+  and writes chunked native INSERT ... ON CONFLICT upserts inside a single transaction
+- import_vitals_frame: validate + upsert, returning inserted/updated/rejected counts
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from django.db import connection, transaction
+
+from ..models import Patient, VitalSigns
+from ..signals import vital_signs_bulk_saved
+from .jalali import parse_dates
+
+INT_COLUMNS = ['blood_pressure_systolic', 'blood_pressure_diastolic', 'heart_rate', 'blood_sugar']
+VITAL_COLUMNS = INT_COLUMNS + ['body_temperature']
+REQUIRED_COLUMNS = ['date'] + VITAL_COLUMNS
+
+# Physiologically plausible bounds; anything outside is treated as a data-entry error
+VALUE_RANGES = {
+    'blood_pressure_systolic': (40, 300),
+    'blood_pressure_diastolic': (20, 200),
+    'heart_rate': (20, 300),
+    'blood_sugar': (10, 1500),
+    'body_temperature': (25.0, 45.0),
+}
+
+BATCH_SIZE = 1000
+
+
+@dataclass
+class ImportResult:
+    inserted: int = 0
+    updated: int = 0
+    rejected: int = 0
+    errors: list = field(default_factory=list)
+    # `row` numbers of the rows that replaced an existing (patient, date) reading
+    updated_rows: list = field(default_factory=list)
+
+    def merge(self, other):
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.rejected += other.rejected
+        self.errors.extend(other.errors)
+        self.updated_rows.extend(other.updated_rows)
+        return self
+
+
+def _flag(problems, mask, message):
+    mask = np.asarray(mask, dtype=bool)
+    problems[mask] = problems[mask] + message + ' '
+
+
+def check_vitals_frame(df, patient_column=None):
+    """
+    Validate every row of a DataFrame that has the required columns, in vectorized form.
+
+    Returns (clean, problems): clean has one row per input row with columns
+    [row, (patient_id), date (datetime64[D], Gregorian), *VITAL_COLUMNS] (row = DataFrame
+    index + 1), and problems holds each row's Persian messages ('' for a valid row).
+    """
+    rows = np.arange(len(df)) + 1
+    problems = pd.Series([''] * len(df), dtype=object)
+    clean = pd.DataFrame({'row': rows})
+
+    if patient_column:
+        pid = pd.to_numeric(df[patient_column].reset_index(drop=True), errors='coerce')
+        _flag(problems, pid.isna() | (pid % 1 != 0), f"شناسه بیمار نامعتبر در ستون '{patient_column}'.")
+        clean['patient_id'] = pid.fillna(0).astype(np.int64)
+
+    dates = parse_dates(df['date'].reset_index(drop=True))
+    _flag(problems, np.isnat(dates), "تاریخ نامعتبر (قالب YYYY-MM-DD).")
+    clean['date'] = dates
+
+    for col in VITAL_COLUMNS:
+        values = pd.to_numeric(df[col].reset_index(drop=True), errors='coerce')
+        lo, hi = VALUE_RANGES[col]
+        _flag(problems, values.isna(), f"مقدار '{col}' عددی نیست.")
+        _flag(problems, values.notna() & ((values < lo) | (values > hi)), f"مقدار '{col}' خارج از محدوده {lo} تا {hi}.")
+        if col in INT_COLUMNS:
+            _flag(problems, values.notna() & (values % 1 != 0), f"مقدار '{col}' باید عدد صحیح باشد.")
+            values = values.fillna(0).round().astype(np.int64)
+        clean[col] = values
+
+    # Later rows win over earlier rows for the same (patient, date), like the old row-by-row path
+    key = ['patient_id', 'date'] if patient_column else ['date']
+    ok = (problems == '').to_numpy()
+    dup = np.zeros(len(df), dtype=bool)
+    dup[ok] = clean[ok].duplicated(subset=key, keep='last').to_numpy()
+    _flag(problems, dup, "تاریخ تکراری در فایل؛ ردیف بعدی جایگزین شد.")
+    return clean, problems
+
+
+def flag_unknown_patients(clean, problems):
+    """Flag the otherwise valid rows whose patient_id has no Patient (one query per 500 ids)."""
+    valid = (problems == '').to_numpy()
+    patient_ids = sorted(set(clean['patient_id'][valid].tolist()))
+    known = []
+    for i in range(0, len(patient_ids), 500):
+        known.extend(Patient.objects.filter(pk__in=patient_ids[i:i + 500]).values_list('pk', flat=True))
+    unknown = valid & ~clean['patient_id'].isin(known).to_numpy()
+    _flag(problems, unknown, "بیمار با این شناسه یافت نشد.")
+    return problems
+
+
+def validate_vitals_frame(df, patient_column=None, check_patients=False):
+    """
+    Validate a raw DataFrame in vectorized form (no DB access unless `check_patients`,
+    which also rejects rows of unknown patients).
+
+    Returns (clean, errors, rejected) where clean holds the valid rows of check_vitals_frame,
+    errors is a list of Persian row-level messages and rejected is the number of input rows dropped.
+    """
+    required = REQUIRED_COLUMNS + ([patient_column] if patient_column else [])
+    missing = [c for c in required if c not in df.columns]
+    if missing:
+        errors = [f"ستون '{c}' در فایل یافت نشد." for c in missing]
+        return _empty_frame(patient_column), errors, len(df)
+
+    clean, problems = check_vitals_frame(df, patient_column)
+    if patient_column and check_patients:
+        flag_unknown_patients(clean, problems)
+    bad = (problems != '').to_numpy()
+    errors = [f"خطا در ردیف {r}: {msg.strip()}" for r, msg in zip(clean['row'][bad], problems[bad])]
+    return clean[~bad].reset_index(drop=True), errors, int(bad.sum())
+
+
+def _empty_frame(patient_column):
+    cols = ['row'] + (['patient_id'] if patient_column else []) + ['date'] + VITAL_COLUMNS
+    return pd.DataFrame(columns=cols)
+
+
+def upsert_vitals(clean, patient=None, batch_size=BATCH_SIZE):
+    """
+    Write validated rows with chunked native upserts on (patient, date) in one transaction.
+    Either pass `patient` or include a patient_id column. Returns an ImportResult (no errors).
+    """
+    result = ImportResult()
+    if clean.empty:
+        return result
+    if patient is not None:
+        clean = clean.assign(patient_id=patient.pk)
+
+    with transaction.atomic():
+        existing = _existing_pairs(clean)
+        keys = pd.MultiIndex.from_arrays([clean['patient_id'], clean['date']])
+        is_update = keys.isin(existing)
+        result.updated = int(is_update.sum())
+        result.inserted = len(clean) - result.updated
+        result.updated_rows = clean['row'][is_update].tolist()
+
+        _native_upsert(clean, batch_size)
+        # Raw upserts bypass post_save; let projections (LatestVitals, ...) catch up on the
+        # written patients and dates
+        vital_signs_bulk_saved.send(
+            sender=VitalSigns,
+            patient_ids=sorted(set(clean['patient_id'].tolist())),
+            start=clean['date'].min().date(),
+            end=clean['date'].max().date(),
+        )
+    return result
+
+
+def _native_upsert(clean, batch_size):
+    """INSERT ... ON CONFLICT (patient, date) DO UPDATE, executemany'd in chunks."""
+    qn = connection.ops.quote_name
+    columns = [VitalSigns._meta.get_field(name).column for name in ['patient', 'date'] + VITAL_COLUMNS]
+    sql = (
+        f"INSERT INTO {qn(VitalSigns._meta.db_table)} ({', '.join(qn(c) for c in columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({qn(columns[0])}, {qn(columns[1])}) DO UPDATE SET "
+        + ', '.join(f"{qn(c)} = excluded.{qn(c)}" for c in columns[2:])
+    )
+    params = list(zip(
+        clean['patient_id'].tolist(),
+        np.datetime_as_string(clean['date'].to_numpy(dtype='datetime64[D]'), unit='D').tolist(),
+        *(clean[c].tolist() for c in VITAL_COLUMNS),
+    ))
+    with connection.cursor() as cursor:
+        for i in range(0, len(params), batch_size):
+            cursor.executemany(sql, params[i:i + batch_size])
+
+
+def _existing_pairs(clean):
+    """One range query per patient batch: (patient_id, date) pairs already in the table."""
+    lo = clean['date'].min().date()
+    hi = clean['date'].max().date()
+    patient_ids = sorted(set(clean['patient_id'].tolist()))
+    pairs = []
+    for i in range(0, len(patient_ids), 500):
+        qs = VitalSigns.objects.filter(
+            patient_id__in=patient_ids[i:i + 500], date__range=(lo, hi)
+        ).values_list('patient_id', 'date')
+        pairs.extend((pid, np.datetime64(d.togregorian(), 'D')) for pid, d in qs.iterator(chunk_size=5000))
+    if not pairs:
+        return pd.MultiIndex.from_arrays([[], np.array([], dtype='datetime64[D]')])
+    pids, dates = zip(*pairs)
+    return pd.MultiIndex.from_arrays([np.array(pids), np.array(dates, dtype='datetime64[D]')])
+
+
+def import_vitals_frame(df, patient=None, patient_column=None, batch_size=BATCH_SIZE):
+    """Validate and upsert a DataFrame of readings. Rejected rows are reported, valid rows are written."""
+    clean, errors, rejected = validate_vitals_frame(df, patient_column=patient_column, check_patients=True)
+    result = upsert_vitals(clean, patient=patient, batch_size=batch_size)
+    result.rejected = rejected
+    result.errors = errors
+    return result
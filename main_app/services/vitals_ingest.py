@@ -0,0 +1,97 @@
+# main_app/services/vitals_ingest.py
+"""
+JSON batch ingestion of vital signs pushed by bedside monitors and ward gateways.
+
+- authenticate: resolve `Authorization: Bearer <key>` to an active IngestToken with one
+  lookup on the unique SHA-256 of the key
+- parse_readings: the request body, either a list of readings or {"readings": [...]},
+  at most INGEST_MAX_BATCH of them
+- ingest_readings: validate the whole batch in one vectorized pass (check_vitals_frame,
+  plus one query for unknown patients) and write the valid readings with upsert_vitals,
+  i.e. one transaction of chunked native upserts on (patient, date)
+
+Each reading is {"patient_id", "date", <vital>...} with a Jalali or Gregorian date string.
+The response reports every reading by its index in the batch: inserted, updated or rejected
+with its errors. Readings of one batch for the same (patient, date) keep the last one.
+"""
+
+import hashlib
+import json
+import secrets
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import IngestToken
+from .vitals_import import REQUIRED_COLUMNS, check_vitals_frame, flag_unknown_patients, upsert_vitals
+
+DEFAULT_MAX_BATCH = 10000
+PATIENT_COLUMN = 'patient_id'
+
+
+class IngestError(ValueError):
+    pass
+
+
+def _hash(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def create_token(name):
+    """A new IngestToken and its key; only the hash is stored, so the key cannot be shown again."""
+    key = secrets.token_urlsafe(32)
+    return IngestToken.objects.create(name=name, key_hash=_hash(key)), key
+
+
+def authenticate(request):
+    """The active IngestToken named by the request's bearer key, or None."""
+    scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+    key = key.strip()
+    if scheme.lower() != 'bearer' or not key:
+        return None
+    token = IngestToken.objects.filter(key_hash=_hash(key), is_active=True).first()
+    if token is not None:
+        IngestToken.objects.filter(pk=token.pk).update(last_used_at=timezone.now())
+    return token
+
+
+def parse_readings(body):
+    """The list of readings in a request body. Raises IngestError for a malformed batch."""
+    try:
+        payload = json.loads(body)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise IngestError('بدنه درخواست JSON معتبر نیست.') from e
+    readings = payload.get('readings') if isinstance(payload, dict) else payload
+    if not isinstance(readings, list) or not readings:
+        raise IngestError("فیلد 'readings' باید فهرستی ناخالی از خوانش‌ها باشد.")
+    max_batch = getattr(settings, 'INGEST_MAX_BATCH', DEFAULT_MAX_BATCH)
+    if len(readings) > max_batch:
+        raise IngestError(f'حداکثر {max_batch} خوانش در هر درخواست مجاز است.')
+    if not all(isinstance(reading, dict) for reading in readings):
+        raise IngestError('هر خوانش باید یک شیء JSON باشد.')
+    return readings
+
+
+def ingest_readings(readings):
+    """Validate and upsert a batch of reading dicts. Returns the JSON-able per-item report."""
+    # Missing keys become NaN and are reported per reading; unknown keys are ignored
+    df = pd.DataFrame.from_records(readings, columns=[PATIENT_COLUMN, *REQUIRED_COLUMNS])
+    clean, problems = check_vitals_frame(df, PATIENT_COLUMN)
+    flag_unknown_patients(clean, problems)
+
+    bad = (problems != '').to_numpy()
+    result = upsert_vitals(clean[~bad].reset_index(drop=True))
+    status = np.where(bad, 'rejected', 'inserted').astype(object)
+    status[np.asarray(result.updated_rows, dtype=np.int64) - 1] = 'updated'
+
+    items = [{'index': i, 'status': s} for i, s in enumerate(status.tolist())]
+    for i, message in zip(np.flatnonzero(bad).tolist(), problems[bad]):
+        items[i]['errors'] = message.strip()
+    return {
+        'inserted': result.inserted,
+        'updated': result.updated,
+        'rejected': int(bad.sum()),
+        'results': items,
+    }
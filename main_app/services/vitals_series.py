@@ -0,0 +1,245 @@
+# main_app/services/vitals_series.py
+"""
+In-process cache of each patient's vital signs as compact columns.
+
+- a VitalsSeries holds the ids, the dates as int32 day numbers (days since
+  1970-01-01, ascending) and one NumPy array per vital: about 36 bytes a reading,
+  instead of a model instance, a jdatetime.date and six Python numbers
+- it is loaded with one values_list query (no model instances)
+- the cache is an LRU bounded by the total bytes of its arrays
+  (`VITALS_SERIES_CACHE_BYTES`); a series larger than the bound is served but not kept
+- every entry records the patient's version token (a random token in the Django cache,
+  like fragment_cache.py); signals.py gives the patient a new token on every write, so
+  with the file or Redis cache backend a write in any process (web workers, import_vitals,
+  the ingest API) makes the other processes reload on their next read. Entries also
+  expire after `VITALS_SERIES_CACHE_TTL` seconds, the bound with the per-process locmem backend
+- the cache changes only once the transaction commits: a loaded series is stored, and a
+  write's new version token is published, from transaction.on_commit (at once in autocommit),
+  so rows that may be rolled back never reach the cache
+- a date-range read slices a cached entry, or else loads just that range through the
+  (patient, date) index without caching it
+
+The chart, the export and the AI prompt builder read from it.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from dataclasses import dataclass, field
+
+import jdatetime
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from django.db import transaction
+from django.db.models import DateField, ExpressionWrapper, F
+
+from ..models import VitalSigns
+from .alert_rules import FIELDS
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 300
+
+_DTYPES = {field: np.float64 if field == 'body_temperature' else np.int32 for field in FIELDS}
+
+# What the prompt builder and the local fallback read: the attributes of a VitalSigns row
+Reading = namedtuple('Reading', ['pk', 'date', *FIELDS])
+
+
+def _day_number(value):
+    """int day number (days since 1970-01-01) of a jdatetime/datetime date."""
+    if isinstance(value, jdatetime.date):
+        value = value.togregorian()
+    return int(np.datetime64(value, 'D').astype(np.int64))
+
+
+@dataclass(frozen=True)
+class VitalsSeries:
+    ids: np.ndarray
+    days: np.ndarray
+    values: dict
+    loaded_at: float = field(default_factory=time.monotonic)
+    version: str = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes + self.days.nbytes + sum(v.nbytes for v in self.values.values())
+
+    @property
+    def dates(self):
+        """Gregorian datetime64[D] array."""
+        return self.days.astype('datetime64[D]')
+
+    def between(self, start=None, end=None):
+        """The readings dated within [start, end] (jdatetime dates, None = open), as array views."""
+        lo = 0 if start is None else int(np.searchsorted(self.days, _day_number(start), side='left'))
+        hi = len(self) if end is None else int(np.searchsorted(self.days, _day_number(end), side='right'))
+        return VitalsSeries(
+            self.ids[lo:hi], self.days[lo:hi], {k: v[lo:hi] for k, v in self.values.items()},
+            self.loaded_at, self.version,
+        )
+
+    def newest(self, limit):
+        """The last `limit` readings as Reading tuples, newest first."""
+        lo = max(len(self) - limit, 0)
+        columns = [self.values[f][lo:][::-1].tolist() for f in FIELDS]
+        dates = [jdatetime.date.fromgregorian(date=d) for d in self.dates[lo:][::-1].astype(object)]
+        return [Reading(*row) for row in zip(self.ids[lo:][::-1].tolist(), dates, *columns)]
+
+
+def vitals_between(patient, start=None, end=None):
+    """VitalSigns of a patient (instance or id) dated within [start, end] (None = open)."""
+    queryset = VitalSigns.objects.filter(patient_id=getattr(patient, 'pk', patient))
+    if start is not None:
+        queryset = queryset.filter(date__gte=start)
+    if end is not None:
+        queryset = queryset.filter(date__lte=end)
+    return queryset
+
+
+def _version_key(patient_id):
+    return f'vitals_series_version:{patient_id}'
+
+
+def series_version(patient_id):
+    token = shared_cache.get(_version_key(patient_id))
+    if token is None:
+        # Concurrent first readers agree on whichever token add() stored
+        shared_cache.add(_version_key(patient_id), uuid.uuid4().hex, None)
+        token = shared_cache.get(_version_key(patient_id))
+    return token
+
+
+def load_series(patient_id, start=None, end=None, version=None):
+    rows = list(
+        vitals_between(patient_id, start, end)
+        .order_by('date', 'id')
+        .annotate(gregorian_date=ExpressionWrapper(F('date'), output_field=DateField()))
+        .values_list('id', 'gregorian_date', *FIELDS)
+    )
+    columns = list(zip(*rows)) or [()] * (len(FIELDS) + 2)
+    return VitalsSeries(
+        ids=np.array(columns[0], dtype=np.int64),
+        days=np.array(columns[1], dtype='datetime64[D]').astype(np.int32),
+        values={f: np.array(c, dtype=_DTYPES[f]) for f, c in zip(FIELDS, columns[2:])},
+        version=version,
+    )
+
+
+class SeriesCache:
+    """Thread-safe LRU of VitalsSeries by patient id, bounded by total array bytes."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.nbytes = 0
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _fresh(self, patient_id, version):
+        # Caller holds the lock
+        series = self._entries.get(patient_id)
+        if series is not None and series.version == version and time.monotonic() - series.loaded_at < self.ttl:
+            self._entries.move_to_end(patient_id)
+            self.hits += 1
+            return series
+        return None
+
+    def peek(self, patient_id):
+        """The cached series, or None; never loads."""
+        version = series_version(patient_id)
+        with self._lock:
+            return self._fresh(patient_id, version)
+
+    def get(self, patient_id):
+        # Read before loading: a write during the load changes it, so the entry is never current
+        version = series_version(patient_id)
+        with self._lock:
+            series = self._fresh(patient_id, version)
+            if series is not None:
+                return series
+            self.misses += 1
+
+        series = load_series(patient_id, version=version)
+        # Inside a transaction the rows may still be rolled back
+        transaction.on_commit(lambda: self._store(patient_id, series))
+        return series
+
+    def _store(self, patient_id, series):
+        with self._lock:
+            if series.nbytes <= self.max_bytes:
+                self._discard(patient_id)
+                self._entries[patient_id] = series
+                self.nbytes += series.nbytes
+                while self.nbytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.nbytes -= evicted.nbytes
+
+    def _discard(self, patient_id):
+        series = self._entries.pop(patient_id, None)
+        if series is not None:
+            self.nbytes -= series.nbytes
+
+    def invalidate(self, patient_id):
+        with self._lock:
+            self._discard(patient_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_series_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SeriesCache(
+                    getattr(settings, 'VITALS_SERIES_CACHE_BYTES', DEFAULT_MAX_BYTES),
+                    getattr(settings, 'VITALS_SERIES_CACHE_TTL', DEFAULT_TTL),
+                )
+    return _cache
+
+
+def get_series(patient, start=None, end=None):
+    """
+    The VitalsSeries of a patient (instance or id) within [start, end]: a slice of the
+    cached history, or one query (the whole history is cached, a range is not).
+    """
+    cache = get_series_cache()
+    patient_id = getattr(patient, 'pk', patient)
+    if start is None and end is None:
+        return cache.get(patient_id)
+    series = cache.peek(patient_id)
+    if series is None:
+        return load_series(patient_id, start, end)
+    return series.between(start, end)
+
+
+def invalidate_series(*patient_ids):
+    """
+    Drop the patients' entries in this process now (later reads in the same transaction
+    reload, and are not stored before the commit), and give them new version tokens for
+    every process when the transaction commits.
+    """
+    cache = get_series_cache()
+    for patient_id in patient_ids:
+        cache.invalidate(patient_id)
+
+    def bump():
+        shared_cache.set_many({_version_key(patient_id): uuid.uuid4().hex for patient_id in patient_ids}, None)
+        # A series loaded by another thread before the commit carries the old token
+        for patient_id in patient_ids:
+            cache.invalidate(patient_id)
+
+    transaction.on_commit(bump)
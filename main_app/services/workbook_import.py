@@ -0,0 +1,220 @@
+# main_app/services/workbook_import.py
+"""
+Multi-patient workbook upload (upload_excel with no patient picked).
+
+- a sheet's rows belong to the patients in its `patient_id` column or, without that column,
+  to the patient whose id starts the sheet name ('12', '12 - علی احمدی')
+- sheets are read and validated in parallel on a process-wide pool (WORKBOOK_IMPORT_WORKERS);
+  each worker opens the workbook read-only once and reads its share of the sheets
+- the valid rows of every sheet are written by one upsert_vitals call, i.e. one transaction
+- import_workbook returns a per-patient summary for the result page
+
+Workers are spawned rather than forked (the web process has threads) and run django.setup().
+A pool broken by a crashed worker is replaced and the upload retried once.
+"""
+
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from multiprocessing import get_context
+
+import django
+import jdatetime
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from ..models import Patient
+from .vitals_import import REQUIRED_COLUMNS, check_vitals_frame, flag_unknown_patients, upsert_vitals
+
+PATIENT_COLUMN = 'patient_id'
+DEFAULT_WORKERS = 4
+# Error messages listed per patient on the result page
+MAX_PATIENT_ERRORS = 5
+
+_SHEET_PATIENT_RE = re.compile(r'\s*(\d+)')
+
+
+@dataclass
+class SheetResult:
+    name: str
+    # check_vitals_frame output for every row, with a `problem` column ('' when valid)
+    rows: pd.DataFrame = None
+    error: str = None
+
+
+@dataclass
+class PatientSummary:
+    patient_id: int
+    patient: Patient = None
+    sheets: list = field(default_factory=list)
+    inserted: int = 0
+    updated: int = 0
+    rejected: int = 0
+    first_date: jdatetime.date = None
+    last_date: jdatetime.date = None
+    errors: list = field(default_factory=list)
+
+
+@dataclass
+class WorkbookResult:
+    patients: list = field(default_factory=list)
+    # Whole-sheet problems (missing columns, no patient id in the name, ...)
+    sheet_errors: list = field(default_factory=list)
+    inserted: int = 0
+    updated: int = 0
+    rejected: int = 0
+
+
+def _open(path):
+    from openpyxl import load_workbook
+
+    return load_workbook(path, read_only=True, data_only=True)
+
+
+def sheet_names(path):
+    workbook = _open(path)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def _sheet_frame(worksheet):
+    rows = worksheet.iter_rows(values_only=True)
+    columns = [str(c).strip() if c is not None else '' for c in next(rows, ())]
+    return pd.DataFrame.from_records(
+        [row for row in rows if any(value is not None for value in row)], columns=columns
+    )
+
+
+def parse_sheet(name, df):
+    """Validate one sheet's DataFrame. No DB access."""
+    if df.empty:
+        return SheetResult(name, error=f"شیت '{name}' خالی است.")
+    if PATIENT_COLUMN not in df.columns:
+        match = _SHEET_PATIENT_RE.match(name)
+        if match is None:
+            return SheetResult(name, error=f"شیت '{name}': ستون '{PATIENT_COLUMN}' ندارد و نامش با شناسه بیمار شروع نمی‌شود.")
+        df[PATIENT_COLUMN] = int(match.group(1))
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        return SheetResult(name, error=f"شیت '{name}': ستون‌های {', '.join(missing)} یافت نشد.")
+
+    rows, problems = check_vitals_frame(df, PATIENT_COLUMN)
+    return SheetResult(name, rows.assign(sheet=name, problem=problems.to_numpy()))
+
+
+def parse_sheet_group(path, names):
+    """Worker: read and validate `names`, opening the workbook once (an open costs ~100 ms)."""
+    workbook = _open(path)
+    try:
+        return [parse_sheet(name, _sheet_frame(workbook[name])) for name in names]
+    finally:
+        workbook.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_sheet_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=getattr(settings, 'WORKBOOK_IMPORT_WORKERS', DEFAULT_WORKERS),
+                    mp_context=get_context('spawn'),
+                    initializer=django.setup,
+                )
+    return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        # Another request may already have replaced it
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_sheets(path):
+    """SheetResults in workbook order; the sheets are dealt round-robin into one group per worker."""
+    names = sheet_names(path)
+    workers = min(getattr(settings, 'WORKBOOK_IMPORT_WORKERS', DEFAULT_WORKERS), len(names))
+    if workers <= 1:
+        return parse_sheet_group(path, names)
+    groups = [names[i::workers] for i in range(workers)]
+    for attempt in range(2):
+        pool = get_sheet_pool()
+        try:
+            parsed = list(pool.map(parse_sheet_group, [path] * workers, groups))
+            break
+        except BrokenProcessPool:
+            # A worker died (crash, OOM kill): every later map on this pool would fail too
+            _discard_pool(pool)
+            if attempt:
+                raise
+    results = {sheet.name: sheet for group in parsed for sheet in group}
+    return [results[name] for name in names]
+
+
+def import_workbook(path):
+    """Import every sheet of a multi-patient workbook in one transaction. Returns a WorkbookResult."""
+    sheets = parse_sheets(path)
+    result = WorkbookResult(sheet_errors=[sheet.error for sheet in sheets if sheet.error])
+    frames = [sheet.rows for sheet in sheets if sheet.rows is not None]
+    if not frames:
+        return result
+
+    rows = pd.concat(frames, ignore_index=True).rename(columns={'row': 'sheet_row'})
+    rows['row'] = np.arange(len(rows)) + 1
+    problems = rows['problem'].copy()
+    # The same (patient, date) on two sheets: the later sheet wins, as within a sheet
+    valid = (problems == '').to_numpy()
+    dup = np.zeros(len(rows), dtype=bool)
+    dup[valid] = rows[valid].duplicated(subset=[PATIENT_COLUMN, 'date'], keep='last').to_numpy()
+    problems[dup] = problems[dup] + 'تاریخ تکراری در شیت دیگر؛ شیت بعدی جایگزین شد. '
+    flag_unknown_patients(rows, problems)
+    rows['problem'] = problems
+
+    valid = (problems == '').to_numpy()
+    written = upsert_vitals(rows[valid].reset_index(drop=True))
+    status = np.where(valid, 'inserted', 'rejected').astype(object)
+    status[np.asarray(written.updated_rows, dtype=np.int64) - 1] = 'updated'
+    rows['status'] = status
+
+    result.inserted, result.updated, result.rejected = written.inserted, written.updated, int((~valid).sum())
+    result.patients = _summaries(rows)
+    return result
+
+
+def _summaries(rows):
+    # Every id, not only those with written rows: a patient whose rows were all rejected still exists
+    patients = Patient.objects.in_bulk(rows[PATIENT_COLUMN].unique().tolist())
+    summaries = []
+    for patient_id, group in rows.groupby(PATIENT_COLUMN, sort=True):
+        counts = group['status'].value_counts()
+        summary = PatientSummary(
+            patient_id=int(patient_id),
+            patient=patients.get(int(patient_id)),
+            sheets=list(dict.fromkeys(group['sheet'])),
+            inserted=int(counts.get('inserted', 0)),
+            updated=int(counts.get('updated', 0)),
+            rejected=int(counts.get('rejected', 0)),
+        )
+        written = group.loc[group['status'] != 'rejected', 'date']
+        if not written.empty:
+            summary.first_date = jdatetime.date.fromgregorian(date=written.min().date())
+            summary.last_date = jdatetime.date.fromgregorian(date=written.max().date())
+        rejected = group[group['status'] == 'rejected'].head(MAX_PATIENT_ERRORS)
+        summary.errors = [
+            f"شیت '{sheet}'، ردیف {r}: {msg.strip()}"
+            for sheet, r, msg in zip(rejected['sheet'], rejected['sheet_row'], rejected['problem'])
+        ]
+        summaries.append(summary)
+    return summaries
@@ -0,0 +1,76 @@
+# main_app/signals.py
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver, Signal
+
+from .models import Doctor, Nurse, Patient, VitalSigns
+from .services import live_feed
+from .services.alerts import sync_alerts
+from .services.fragment_cache import ALERTS, PATIENTS, STAFF, bump_fragments
+from .services.latest_vitals import refresh_latest_vitals, refresh_latest_vitals_bulk
+from .services.rollups import refresh_rollups
+from .services.summary_cache import invalidate_patient_summaries, invalidate_summaries
+from .services.vitals_series import invalidate_series
+
+# Sent by bulk write paths (bulk_create/upserts skip post_save) with patient_ids=[...] and,
+# optionally, the start/end dates the write touched
+vital_signs_bulk_saved = Signal()
+
+
+@receiver(post_save, sender=VitalSigns)
+@receiver(post_delete, sender=VitalSigns)
+def vital_signs_changed(sender, instance, **kwargs):
+    # An edit that moves the reading also changes the (patient, date) it was loaded with
+    keys = {(instance.patient_id, instance.date)}
+    loaded = getattr(instance, '_loaded_key', None)
+    if loaded is not None and None not in loaded:
+        keys.add(loaded)
+    instance._loaded_key = (instance.patient_id, instance.date)
+
+    patient_ids = sorted({patient_id for patient_id, _ in keys})
+    invalidate_series(*patient_ids)
+    for patient_id in patient_ids:
+        # Keep the doctor dashboard's LatestVitals projection and alerts current
+        refresh_latest_vitals(patient_id)
+        invalidate_patient_summaries(patient_id)
+    sync_alerts(patient_ids)
+    # Only the readings' days and ISO weeks change
+    for patient_id, date in keys:
+        refresh_rollups([patient_id], date, date)
+    bump_fragments(ALERTS)
+
+
+@receiver(vital_signs_bulk_saved, sender=VitalSigns)
+def vital_signs_bulk_changed(sender, patient_ids, start=None, end=None, **kwargs):
+    invalidate_series(*patient_ids)
+    invalidate_summaries(patient_ids)
+    refresh_latest_vitals_bulk(patient_ids)
+    sync_alerts(patient_ids)
+    refresh_rollups(patient_ids, start, end)
+    bump_fragments(ALERTS)
+
+
+@receiver(post_save, sender=Patient)
+def patient_changed(sender, instance, created, **kwargs):
+    # Names and the emergency flag show in the lists, the dashboards and the alerts
+    bump_fragments(PATIENTS, ALERTS)
+    # medications/reason are part of the AI prompt; age selects the blood sugar band
+    if not created:
+        invalidate_patient_summaries(instance.pk)
+        sync_alerts([instance.pk])
+    # The dashboard reconciles its emergency list with the flag, so unchanged flags are harmless
+    if instance.emergency or not created:
+        live_feed.publish(live_feed.EMERGENCY, live_feed.emergency_event(instance))
+
+
+@receiver(post_delete, sender=Patient)
+def patient_deleted(sender, instance, **kwargs):
+    bump_fragments(PATIENTS, ALERTS)
+
+
+@receiver(post_save, sender=Nurse)
+@receiver(post_delete, sender=Nurse)
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def staff_changed(sender, instance, **kwargs):
+    bump_fragments(STAFF)
@@ -0,0 +1,30 @@
+# main_app/template_backends.py
+
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from .services import profiling
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        # Backend templates are the outermost render call ({% include %} renders engine templates
+        # directly), so nested templates are not counted twice
+        with profiling.timed('template'):
+            return super().render(context, request)
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """
+    DjangoTemplates whose templates add their render time to the active request profile
+    (ProfilingMiddleware); outside a profiled request the timing is a no-op.
+    """
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return ProfiledTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
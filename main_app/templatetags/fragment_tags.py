@@ -0,0 +1,44 @@
+# main_app/templatetags/fragment_tags.py
+
+from django import template
+
+from main_app.services.fragment_cache import cached_fragment
+
+register = template.Library()
+
+
+class VersionedCacheNode(template.Node):
+    def __init__(self, nodelist, name, scopes, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.scopes = scopes
+        self.vary_on = vary_on
+
+    def render(self, context):
+        request = context.get('request')
+        # POST responses may show per-request state (e.g. a just-dismissed row)
+        if request is not None and request.method != 'GET':
+            return self.nodelist.render(context)
+        scopes = self.scopes.resolve(context).split(',')
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        return cached_fragment(self.name.resolve(context), scopes, vary_on, lambda: self.nodelist.render(context))
+
+
+@register.tag('versioned_cache')
+def versioned_cache(parser, token):
+    """
+    Cache a fragment until one of its scopes is bumped (services/fragment_cache.py):
+
+        {% versioned_cache "name" "scope[,scope...]" [vary_on ...] %} ... {% endversioned_cache %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a fragment name and its scopes")
+    nodelist = parser.parse(('endversioned_cache',))
+    parser.delete_first_token()
+    return VersionedCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
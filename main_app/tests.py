@@ -1,3 +1,1618 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qsl
 
-# Create your tests here.
+import jdatetime
+import numpy as np
+import pandas as pd
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import urls
+from .decorators import doctor_required
+from .models import AISummaryCache, Alert, Doctor, LatestVitals, Nurse, Patient, SummaryJob, VitalSigns, VitalsRollup
+from .services.ai_summary import REQUEST_TIMEOUT, SOURCE_AI, SOURCE_CACHE, SOURCE_FALLBACK, build_messages, generate_patient_summary_with_source
+from .services.ai_summary_async import agenerate_patient_summary_with_source
+from .services.alert_rules import RULES, evaluate_masks
+from .services import g4f_provider, live_feed, profiling, workbook_import
+from .services.chart_data import METHODS, downsample_indices, lttb_indices, minmax_indices, vitals_chart_data
+from .services.latest_vitals import rebuild_latest_vitals, refresh_latest_vitals_bulk
+from .services.patient_pages import PAGE_SIZE, InvalidCursor, encode_cursor, patient_page
+from .services.rollups import attach_weekly_trends, rebuild_rollups
+from .services.summary_cache import evict_summaries, get_cached_summary, get_patient_summary, store_summary
+from .services.summary_jobs import claim_next_job, enqueue_summary, run_job
+from .services.summary_jobs import summary_vitals
+from .services.synthetic import seed_synthetic
+from .services.vitals_export import stream_vital_signs
+from .services.vitals_ingest import create_token
+from .services.vitals_import import import_vitals_frame
+from .services.vitals_series import SeriesCache, get_series, get_series_cache, invalidate_series
+
+# "SCAN <table>" without an index means SQLite walks the whole table
+FULL_SCAN = re.compile(r'\bSCAN (\w+)(?: AS \w+)?$')
+
+
+def make_vitals(patient, days, start=jdatetime.date(1403, 1, 1)):
+    # bulk_create skips the signal that invalidates the patient's series
+    invalidate_series(patient.pk)
+    return VitalSigns.objects.bulk_create([
+        VitalSigns(
+            patient=patient,
+            date=start + jdatetime.timedelta(days=i),
+            blood_pressure_systolic=110 + i % 30,
+            blood_pressure_diastolic=70 + i % 20,
+            heart_rate=60 + i % 40,
+            blood_sugar=90 + i % 90,
+            body_temperature=36.5 + (i % 4) * 0.5,
+        )
+        for i in range(days)
+    ])
+
+
+class QueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on every filtered query issued by the hot views
+    and fails if SQLite has to fall back to a full table scan.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.nurse_user = User.objects.create_user('nurse', password='pw')
+        Nurse.objects.create(user=cls.nurse_user)
+        cls.doctor_user = User.objects.create_user('doctor', password='pw')
+        Doctor.objects.create(user=cls.doctor_user, specialization='cardiology')
+
+        cls.patient = None
+        for i in range(5):
+            patient = Patient.objects.create(first_name=f'p{i}', last_name='test', age=30 + i, emergency=i % 2 == 0)
+            make_vitals(patient, 20)
+            cls.patient = cls.patient or patient
+
+    def setUp(self):
+        # Plan the queries of a render, not of a cached fragment
+        cache.clear()
+
+    def plan(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertNoFullScans(self, user, url, status=200):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status, url)
+        if hasattr(response, 'streaming_content'):
+            b''.join(response.streaming_content)
+
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or ' WHERE ' not in sql:
+                continue
+            scans = [line for line in self.plan(sql) if FULL_SCAN.search(line)]
+            self.assertEqual(scans, [], f'{url} full scan in: {sql}')
+
+    def test_doctor_views(self):
+        for url in [
+            reverse('doctor_dashboard'),
+            reverse('patient_detail', args=[self.patient.pk]),
+            reverse('export_patient_data', args=[self.patient.pk]),
+            reverse('patient_chart_data', args=[self.patient.pk]) + '?from=1403-01-05&to=1403-01-15',
+            reverse('patient_chart_data', args=[self.patient.pk]) + '?resolution=week',
+            reverse('patient_detail', args=[self.patient.pk]) + '?from=1403-01-05&to=1403-01-15',
+            reverse('export_patient_data', args=[self.patient.pk]) + '?format=csv&from=1403-01-05',
+            reverse('patient_list'),
+            reverse('patient_list') + f'?emergency=1&cursor={encode_cursor(self.patient)}',
+        ]:
+            with self.subTest(url=url):
+                self.assertNoFullScans(self.doctor_user, url)
+
+    def test_nurse_views(self):
+        for url in [
+            reverse('nurse_dashboard'),
+            reverse('patient_detail_nr', args=[self.patient.pk]),
+            reverse('patient_detail_nr', args=[self.patient.pk]) + '?to=1403-01-10',
+            reverse('nurse_patient_list') + '?q=P&format=json',
+            reverse('nurse_patient_list') + f'?q=p&emergency=1&cursor={encode_cursor(self.patient)}',
+        ]:
+            with self.subTest(url=url):
+                self.assertNoFullScans(self.nurse_user, url)
+
+    @mock.patch('main_app.services.ai_summary.Client', None)
+    def test_ai_summary(self):
+        # Cache miss: the endpoint queues a job (202); the worker then runs it
+        self.assertNoFullScans(self.nurse_user, reverse('patient_ai_summary_nr', args=[self.patient.pk]), status=202)
+        job = claim_next_job('test')
+        with CaptureQueriesContext(connection) as ctx:
+            run_job(job)
+        for query in ctx.captured_queries:
+            if query['sql'].startswith('SELECT') and ' WHERE ' in query['sql']:
+                self.assertEqual([l for l in self.plan(query['sql']) if FULL_SCAN.search(l)], [], query['sql'])
+        self.assertNoFullScans(self.nurse_user, reverse('ai_summary_job_status', args=[job.pk]))
+
+
+class DuplicateVitalsMigrationTests(TransactionTestCase):
+    BEFORE = [('main_app', '0010_latestvitals')]
+    AFTER = [('main_app', '0011_vitals_patient_date_indexes')]
+
+    def setUp(self):
+        self.migration = importlib.import_module('main_app.migrations.0011_vitals_patient_date_indexes')
+        tmp = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(mock.patch.object(self.migration, 'BACKUP_PATH', Path(tmp) / 'dupes.csv'))
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        self.apps = executor.loader.project_state(targets).apps
+        return self.apps.get_model('main_app', 'VitalSigns')
+
+    def tearDown(self):
+        # Back to the latest schema, without the readings 0011 would move again
+        self.apps.get_model('main_app', 'VitalSigns').objects.all().delete()
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_same_day_readings_are_kept_and_restored(self):
+        VitalSigns = self.migrate(self.BEFORE)
+        patient = self.apps.get_model('main_app', 'Patient').objects.create(first_name='Test', last_name='Patient', age=50)
+        values = dict(blood_pressure_diastolic=70, heart_rate=70, blood_sugar=90, body_temperature=36.8)
+        day = jdatetime.date(1403, 1, 1)
+        readings = [
+            VitalSigns.objects.create(patient=patient, date=date, blood_pressure_systolic=systolic, **values).pk
+            for date, systolic in ((day, 110), (day, 150), (day, 130), (day + jdatetime.timedelta(days=1), 120))
+        ]
+
+        with self.assertLogs(self.migration.__name__, 'WARNING') as logs:
+            VitalSigns = self.migrate(self.AFTER)
+        # The newest row of the day stays, the others are moved to the backup file
+        self.assertEqual(sorted(VitalSigns.objects.values_list('pk', flat=True)), readings[2:])
+        with open(self.migration.BACKUP_PATH, encoding='utf-8') as f:
+            saved = list(csv.DictReader(f))
+        self.assertEqual([(int(r['id']), r['date'], r['blood_pressure_systolic']) for r in saved],
+                         [(readings[0], '2024-03-20', '110'), (readings[1], '2024-03-20', '150')])
+        self.assertIn('2 same-day duplicate', logs.output[0])
+
+        with self.assertLogs(self.migration.__name__, 'WARNING'):
+            VitalSigns = self.migrate(self.BEFORE)
+        self.assertEqual(
+            sorted(VitalSigns.objects.values_list('pk', 'date', 'blood_pressure_systolic')),
+            [(readings[0], day, 110), (readings[1], day, 150), (readings[2], day, 130),
+             (readings[3], day + jdatetime.timedelta(days=1), 120)],
+        )
+
+
+class LatestVitalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(first_name='Latest', last_name='Patient', age=50)
+        cls.other = Patient.objects.create(first_name='Other', last_name='Patient', age=60)
+        make_vitals(cls.patient, 5)
+        make_vitals(cls.other, 3)
+
+    def setUp(self):
+        # make_vitals bulk-creates, so start from the projection the backfill would build
+        rebuild_latest_vitals()
+
+    def assertMatchesNewest(self):
+        expected = {
+            patient_id: VitalSigns.objects.filter(patient_id=patient_id).order_by('-date', '-id').values_list('pk', 'date')[0]
+            for patient_id in VitalSigns.objects.values_list('patient_id', flat=True).distinct()
+        }
+        actual = {row.patient_id: (row.vital_signs_id, row.date) for row in LatestVitals.objects.all()}
+        self.assertEqual(actual, expected)
+
+    def reading(self, date, patient=None):
+        return VitalSigns(
+            patient=patient or self.patient, date=date, blood_pressure_systolic=120, blood_pressure_diastolic=80,
+            heart_rate=70, blood_sugar=100, body_temperature=36.8,
+        )
+
+    def test_insert(self):
+        newer = self.reading(jdatetime.date(1403, 2, 1))
+        newer.save()
+        self.assertEqual(LatestVitals.objects.get(patient=self.patient).vital_signs_id, newer.pk)
+        self.reading(jdatetime.date(1402, 1, 1)).save()
+        self.assertEqual(LatestVitals.objects.get(patient=self.patient).vital_signs_id, newer.pk)
+        self.assertMatchesNewest()
+
+    def test_update(self):
+        reading = VitalSigns.objects.get(patient=self.patient, date=jdatetime.date(1403, 1, 5))
+        reading.date = jdatetime.date(1402, 12, 1)
+        reading.save()
+        self.assertEqual(LatestVitals.objects.get(patient=self.patient).date, jdatetime.date(1403, 1, 4))
+        reading.date = jdatetime.date(1403, 3, 1)
+        reading.save()
+        self.assertEqual(LatestVitals.objects.get(patient=self.patient).vital_signs_id, reading.pk)
+        self.assertMatchesNewest()
+
+    def test_delete(self):
+        VitalSigns.objects.get(patient=self.patient, date=jdatetime.date(1403, 1, 5)).delete()
+        self.assertEqual(LatestVitals.objects.get(patient=self.patient).date, jdatetime.date(1403, 1, 4))
+        for reading in VitalSigns.objects.filter(patient=self.other):
+            reading.delete()
+        self.assertFalse(LatestVitals.objects.filter(patient=self.other).exists())
+        self.assertMatchesNewest()
+
+    def test_bulk_refresh(self):
+        make_vitals(self.patient, 3, start=jdatetime.date(1403, 2, 1))
+        make_vitals(self.other, 3, start=jdatetime.date(1403, 2, 1))
+        refresh_latest_vitals_bulk([self.patient.pk, self.other.pk], batch_size=1)
+        self.assertMatchesNewest()
+
+    def test_backfill_command(self):
+        third = Patient.objects.create(first_name='Third', last_name='Patient', age=70)
+        make_vitals(third, 2)
+        # A stale row left behind by a write that skipped the signals
+        LatestVitals.objects.filter(patient=self.patient).update(
+            vital_signs=VitalSigns.objects.get(patient=self.patient, date=jdatetime.date(1403, 1, 1)),
+            date=jdatetime.date(1403, 1, 1),
+        )
+        out = io.StringIO()
+        call_command('backfill_latest_vitals', batch_size=2, stdout=out)
+        self.assertIn('LatestVitals rebuilt for 3 patients.', out.getvalue())
+        self.assertMatchesNewest()
+
+
+class PatientPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor_user = User.objects.create_user('doctor', password='pw')
+        Doctor.objects.create(user=cls.doctor_user, specialization='cardiology')
+
+    def create(self, count, created_at=None, **fields):
+        patients = Patient.objects.bulk_create([
+            Patient(first_name=f'Page{i}', last_name='Patient', age=40, **fields) for i in range(count)
+        ])
+        if created_at is not None:
+            Patient.objects.filter(pk__in=[p.pk for p in patients]).update(created_at=created_at)
+        return patients
+
+    def walk(self, params=None, page_size=3, between_pages=None):
+        params, seen = dict(params or {}), []
+        while True:
+            page = patient_page(params, page_size=page_size)
+            seen += [p.pk for p in page.patients]
+            if not page.has_next:
+                return seen
+            if between_pages:
+                between_pages()
+            params['cursor'] = page.next_cursor
+
+    def test_equal_created_at_pages_by_id(self):
+        now = timezone.now()
+        ids = [p.pk for p in self.create(7, created_at=now) + self.create(2, created_at=now - timezone.timedelta(days=1))]
+        self.assertEqual(self.walk(), sorted(ids[:7], reverse=True) + sorted(ids[7:], reverse=True))
+
+    def test_inserts_between_pages_cause_no_duplicates_or_gaps(self):
+        ids = [p.pk for p in self.create(10, created_at=timezone.now() - timezone.timedelta(hours=1))]
+        # Newer rows sort before the cursor, so the walk neither repeats nor skips a row
+        seen = self.walk(between_pages=lambda: self.create(1))
+        self.assertEqual(seen, sorted(ids, reverse=True))
+
+    def test_filters(self):
+        emergency = self.create(4, emergency=True)
+        self.create(3)
+        Patient.objects.create(first_name='Other', last_name='Name', emergency=True)
+        self.assertEqual(self.walk({'q': 'page', 'emergency': '1'}), sorted((p.pk for p in emergency), reverse=True))
+
+    def test_json_pages_keep_filters(self):
+        self.create(PAGE_SIZE + 2, emergency=True)
+        self.create(2)
+        self.client.force_login(self.doctor_user)
+        body = self.client.get(reverse('patient_list') + '?q=page&emergency=1&format=json').json()
+        self.assertEqual(set(body), {'results', 'html', 'next_cursor', 'next_url'})
+        self.assertEqual(len(body['results']), PAGE_SIZE)
+        self.assertEqual(set(body['results'][0]), {'id', 'first_name', 'last_name', 'emergency'})
+        self.assertIn(reverse('patient_detail', args=[body['results'][0]['id']]), body['html'])
+
+        next_url = body['next_url']
+        self.assertTrue(next_url.startswith(reverse('patient_list') + '?'))
+        self.assertEqual(
+            dict(parse_qsl(next_url.split('?', 1)[1])),
+            {'q': 'page', 'emergency': '1', 'cursor': body['next_cursor'], 'format': 'json'},
+        )
+        rest = self.client.get(next_url).json()
+        self.assertEqual(len(rest['results']), 2)
+        self.assertTrue(all(row['emergency'] for row in rest['results']))
+        self.assertEqual((rest['next_cursor'], rest['next_url']), (None, None))
+
+    def test_bad_cursor_is_rejected(self):
+        self.client.force_login(self.doctor_user)
+        tampered = base64.urlsafe_b64encode(b'2024-01-01T00:00:00|abc').decode()
+        for cursor in ('not-a-cursor', '!!!', tampered):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('patient_list'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                with self.assertRaises(InvalidCursor):
+                    patient_page({'cursor': cursor})
+
+
+class AsyncSummaryTests(SimpleTestCase):
+    patient = Patient(first_name='Test', last_name='Patient', age=50)
+
+    def fake_manager(self, delays):
+        cancelled = []
+
+        async def create(model, **kwargs):
+            try:
+                await asyncio.sleep(delays[model])
+            except asyncio.CancelledError:
+                cancelled.append(model)
+                raise
+            message = mock.Mock(content=f'summary from {model}')
+            return mock.Mock(choices=[mock.Mock(message=message)])
+
+        client = mock.Mock()
+        client.chat.completions.create = create
+        manager = mock.Mock()
+        manager.async_client.return_value = client
+        return manager, cancelled
+
+    def generate(self, delays, deadline):
+        manager, cancelled = self.fake_manager(delays)
+        with mock.patch('main_app.services.ai_summary_async.get_provider_manager', return_value=manager), \
+                mock.patch('main_app.services.ai_summary_async.AsyncClient', object), \
+                mock.patch('main_app.services.ai_summary_async.MODEL_CANDIDATES', list(delays)), \
+                mock.patch('main_app.services.ai_summary_async.OVERALL_DEADLINE', deadline), \
+                mock.patch('main_app.services.ai_summary_async.PER_ATTEMPT_TIMEOUT', deadline):
+            return asyncio.run(agenerate_patient_summary_with_source(self.patient, [])), cancelled
+
+    def test_race_cancels_losers(self):
+        (summary, _, source), cancelled = self.generate({'slow': 60, 'fast': 0}, deadline=5)
+        self.assertEqual((summary, source), ('summary from fast', SOURCE_AI))
+        self.assertEqual(cancelled, ['slow'])
+
+    def test_deadline_cancels_and_falls_back(self):
+        (summary, _, source), cancelled = self.generate({'slow': 60}, deadline=0.05)
+        self.assertEqual(source, SOURCE_FALLBACK)
+        self.assertIn('Test', summary)
+        # The race attempt, plus the sequential retry if any deadline was left
+        self.assertIn(cancelled, (['slow'], ['slow', 'slow']))
+
+
+class ProviderManagerTests(SimpleTestCase):
+    def manager(self, **kwargs):
+        manager = g4f_provider.ProviderManager(tempfile.mkdtemp(), **kwargs)
+        self.addCleanup(manager.shutdown)
+        return manager
+
+    def test_worker_threads_keep_their_client(self):
+        manager = self.manager(max_workers=1)
+        with mock.patch('main_app.services.g4f_provider.Client', side_effect=lambda: object()):
+            first, second = (manager.submit(lambda client: client).result(timeout=5) for _ in range(2))
+        self.assertIs(first, second)
+
+    def test_request_timeout_is_passed_to_g4f(self):
+        client = mock.Mock()
+        client.chat.completions.create.side_effect = RuntimeError('offline')
+        manager = mock.Mock()
+        manager.submit.side_effect = lambda fn, *args: g4f_provider.ThreadPoolExecutor(1).submit(fn, client, *args)
+        with mock.patch('main_app.services.ai_summary.get_provider_manager', return_value=manager), \
+                mock.patch('main_app.services.ai_summary.Client', object), \
+                self.assertLogs('ai_summary', 'ERROR'):
+            _, _, source = generate_patient_summary_with_source(Patient(first_name='t', last_name='p', age=40), [])
+        self.assertEqual(source, SOURCE_FALLBACK)
+        self.assertEqual(client.chat.completions.create.call_args.kwargs['timeout'], REQUEST_TIMEOUT)
+
+    def test_stuck_pool_is_replaced(self):
+        manager = self.manager(max_workers=1, stuck_after=0.05)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with mock.patch('main_app.services.g4f_provider.Client', object):
+            hung = manager.submit(lambda client: release.wait(5))
+            time.sleep(0.1)
+            # The only worker is hung: the call gets a fresh pool instead of queueing behind it
+            self.assertEqual(manager.submit(lambda client: 'ok').result(timeout=1), 'ok')
+            release.set()
+            self.assertTrue(hung.result(timeout=5))
+
+    def test_busy_pool_is_reused_until_stuck(self):
+        manager = self.manager(max_workers=1, stuck_after=60)
+        release = threading.Event()
+        self.addCleanup(release.set)
+        with mock.patch('main_app.services.g4f_provider.Client', object):
+            manager.submit(lambda client: release.wait(5))
+            queued = manager.submit(lambda client: 'queued')
+            time.sleep(0.05)
+            self.assertFalse(queued.done())
+            release.set()
+            self.assertEqual(queued.result(timeout=5), 'queued')
+
+    def test_cookies_reload_only_when_files_change(self):
+        manager = self.manager()
+        with mock.patch('main_app.services.g4f_provider.set_cookies_dir', create=True), \
+                mock.patch('main_app.services.g4f_provider.read_cookie_files', create=True) as read:
+            manager.ensure_cookies()
+            manager._checked_at = float('-inf')
+            manager.ensure_cookies()
+            self.assertEqual(read.call_count, 1)
+            with open(os.path.join(manager.cookies_dir, 'auth.json'), 'w') as fh:
+                fh.write('{}')
+            manager._checked_at = float('-inf')
+            manager.ensure_cookies()
+            self.assertEqual(read.call_count, 2)
+
+
+@mock.patch('main_app.services.ai_summary.Client', None)
+class SummaryJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('nurse', password='pw')
+        Nurse.objects.create(user=cls.user)
+        cls.patient = Patient.objects.create(first_name='Job', last_name='Patient', age=50)
+        make_vitals(cls.patient, 3)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def summary(self):
+        return self.client.get(reverse('patient_ai_summary_nr', args=[self.patient.pk]))
+
+    def age_jobs(self, seconds=60):
+        SummaryJob.objects.update(created_at=timezone.now() - timezone.timedelta(seconds=seconds))
+
+    def test_pending_job_is_reused(self):
+        first, second = self.summary(), self.summary()
+        self.assertEqual((first.status_code, second.status_code), (202, 202))
+        self.assertEqual(first.json()['job_id'], second.json()['job_id'])
+        self.assertEqual(SummaryJob.objects.count(), 1)
+
+    def test_unclaimed_job_falls_back_and_is_cached(self):
+        # Run the requests' on_commit callbacks (storing the series cache) as a commit would
+        with self.captureOnCommitCallbacks(execute=True):
+            status_url = self.summary().json()['status_url']
+            self.age_jobs()
+            data = self.client.get(status_url).json()
+        self.assertEqual((data['status'], data['source']), (SummaryJob.DONE, SOURCE_FALLBACK))
+        self.assertIn('Job', data['summary'])
+
+        # The fallback is served from the cache; no new job is queued
+        with self.assertNumQueries(5):
+            response = self.summary()
+        self.assertEqual(response.json(), {'summary': data['summary'], 'error': None, 'source': SOURCE_FALLBACK})
+        self.assertEqual(SummaryJob.objects.count(), 1)
+
+    def test_claimed_job_is_left_to_its_worker(self):
+        status_url = self.summary().json()['status_url']
+        claim_next_job('test')
+        self.age_jobs()
+        self.assertEqual(self.client.get(status_url).status_code, 202)
+        self.assertEqual(SummaryJob.objects.get().status, SummaryJob.RUNNING)
+
+
+class SummaryStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('nurse', password='pw')
+        Nurse.objects.create(user=cls.user)
+        cls.patient = Patient.objects.create(first_name='Test', last_name='Patient', age=50)
+        make_vitals(cls.patient, 3)
+
+    def fake_manager(self, pieces, delay=0.0):
+        async def create(model, **kwargs):
+            for piece in pieces:
+                await asyncio.sleep(delay)
+                yield mock.Mock(choices=[mock.Mock(delta=mock.Mock(content=piece))])
+
+        client = mock.Mock()
+        client.chat.completions.create = create
+        manager = mock.Mock()
+        manager.async_client.return_value = client
+        return manager
+
+    async def events(self, manager=None):
+        await self.async_client.aforce_login(self.user)
+        with mock.patch('main_app.services.ai_summary_stream.get_provider_manager', return_value=manager), \
+                mock.patch('main_app.services.ai_summary_stream.AsyncClient', object if manager else None), \
+                mock.patch('main_app.services.ai_summary_stream.OVERALL_DEADLINE', 0.5):
+            response = await self.async_client.get(reverse('patient_ai_summary_stream', args=[self.patient.pk]))
+            self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        return [
+            (block.split('\n')[0][len('event: '):], json.loads(block.split('\n')[1][len('data: '):]))
+            for block in body.split('\n\n') if block.startswith('event: ')
+        ]
+
+    async def test_tokens_then_done_and_cached(self):
+        events = await self.events(self.fake_manager(['خلاصه ', 'بیمار']))
+        self.assertEqual([e for e, _ in events], ['token', 'token', 'done'])
+        self.assertEqual(events[-1][1]['summary'], 'خلاصه بیمار')
+        self.assertEqual(events[-1][1]['source'], SOURCE_AI)
+        # The complete answer was cached: the next stream is a single done event
+        self.assertEqual(await self.events(), [('done', {'summary': 'خلاصه بیمار', 'error': None, 'source': 'cache'})])
+
+    async def test_deadline_falls_back(self):
+        events = await self.events(self.fake_manager(['a', 'b', 'c'], delay=0.3))
+        self.assertEqual(events[0], ('token', {'text': 'a'}))
+        self.assertEqual(events[-1][0], 'done')
+        self.assertEqual(events[-1][1]['source'], SOURCE_FALLBACK)
+        self.assertIn('Test', events[-1][1]['summary'])
+
+    def test_wsgi_never_calls_the_provider_in_request(self):
+        self.client.force_login(self.user)
+        manager = mock.Mock(side_effect=AssertionError('provider called in a web request'))
+        with mock.patch('main_app.services.ai_summary.get_provider_manager', manager), \
+                mock.patch('main_app.services.ai_summary_async.get_provider_manager', manager), \
+                mock.patch('main_app.services.ai_summary_stream.get_provider_manager', manager):
+            page = self.client.get(reverse('patient_detail_nr', args=[self.patient.pk]))
+            self.assertContains(page, 'const streamEnabled = false;')
+            stream = self.client.get(reverse('patient_ai_summary_stream', args=[self.patient.pk]))
+            self.assertEqual(stream.status_code, 204)
+            # The page falls back to the job queue
+            self.assertEqual(self.client.get(reverse('patient_ai_summary_nr', args=[self.patient.pk])).status_code, 202)
+        manager.assert_not_called()
+
+
+class SummaryCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(first_name='Cache', last_name='Patient', age=50)
+        cls.other = Patient.objects.create(first_name='Other', last_name='Patient', age=60)
+        make_vitals(cls.patient, 3)
+        make_vitals(cls.other, 3)
+
+    def vitals(self, patient=None):
+        return list(VitalSigns.objects.filter(patient=patient or self.patient).order_by('date'))
+
+    def generate(self, source=SOURCE_AI):
+        with mock.patch(
+            'main_app.services.summary_cache.generate_patient_summary_with_source',
+            return_value=('generated', None, source),
+        ) as generate:
+            result = get_patient_summary(self.patient, self.vitals())
+        return result, generate.call_count
+
+    def test_miss_then_hit(self):
+        self.assertEqual(self.generate(), (('generated', None, SOURCE_AI), 1))
+        self.assertEqual(self.generate(), (('generated', None, SOURCE_CACHE), 0))
+        self.assertEqual(AISummaryCache.objects.count(), 1)
+
+    def test_fallback_is_not_stored(self):
+        self.generate(SOURCE_FALLBACK)
+        self.assertFalse(AISummaryCache.objects.exists())
+        self.assertEqual(self.generate()[1], 1)
+
+    def test_prompt_change_is_a_miss(self):
+        store_summary(self.patient, self.vitals(), 'old')
+        self.assertIsNone(get_cached_summary(self.patient, self.vitals()[:2]))
+        self.assertEqual(get_cached_summary(self.patient, self.vitals()), 'old')
+
+    @override_settings(AI_SUMMARY_CACHE_TTL=60)
+    def test_expired_entries_miss_and_are_evicted(self):
+        store_summary(self.patient, self.vitals(), 'old')
+        AISummaryCache.objects.update(created_at=timezone.now() - timezone.timedelta(seconds=61))
+        self.assertIsNone(get_cached_summary(self.patient, self.vitals()))
+        evict_summaries()
+        self.assertFalse(AISummaryCache.objects.exists())
+
+    @override_settings(AI_SUMMARY_CACHE_MAX_ENTRIES=2)
+    def test_least_recently_used_is_evicted(self):
+        vitals = self.vitals()
+        store_summary(self.patient, vitals[:1], 'one')
+        store_summary(self.patient, vitals[:2], 'two')
+        # A hit more than TOUCH_INTERVAL after the last use moves 'one' to the front
+        AISummaryCache.objects.update(last_used_at=timezone.now() - timezone.timedelta(hours=1))
+        self.assertEqual(get_cached_summary(self.patient, vitals[:1]), 'one')
+        store_summary(self.patient, vitals, 'three')
+        self.assertEqual(sorted(AISummaryCache.objects.values_list('summary', flat=True)), ['one', 'three'])
+
+    def test_vitals_change_invalidates_only_that_patient(self):
+        store_summary(self.patient, self.vitals(), 'mine')
+        store_summary(self.other, self.vitals(self.other), 'theirs')
+        reading = self.vitals()[0]
+        reading.heart_rate += 1
+        reading.save()
+        self.assertEqual(list(AISummaryCache.objects.values_list('summary', flat=True)), ['theirs'])
+
+        self.vitals(self.other)[0].delete()
+        self.assertFalse(AISummaryCache.objects.exists())
+
+    def test_patient_edit_invalidates(self):
+        store_summary(self.patient, self.vitals(), 'mine')
+        self.patient.medications = 'aspirin'
+        self.patient.save()
+        self.assertFalse(AISummaryCache.objects.exists())
+
+
+class AlertRuleTests(SimpleTestCase):
+    NORMAL = dict(blood_pressure_systolic=110, blood_pressure_diastolic=70, heart_rate=70,
+                  blood_sugar=90, body_temperature=36.8, age=50)
+
+    def fired(self, *readings):
+        """Codes fired per reading, all readings evaluated in one pass."""
+        rows = [{**self.NORMAL, **reading} for reading in readings]
+        masks = evaluate_masks({name: [row[name] for row in rows] for name in self.NORMAL})
+        return [{code for code, mask in masks.items() if mask[i]} for i in range(len(rows))]
+
+    def assertFires(self, cases):
+        readings, expected = zip(*cases)
+        for reading, codes, want in zip(readings, self.fired(*readings), expected):
+            with self.subTest(**reading):
+                self.assertEqual(codes, want)
+
+    def test_boundaries(self):
+        self.assertFires([
+            (dict(blood_pressure_systolic=120, blood_pressure_diastolic=80), set()),
+            (dict(blood_pressure_systolic=121), {'bp_elevated'}),
+            (dict(blood_pressure_diastolic=81), {'bp_elevated'}),
+            (dict(blood_pressure_systolic=129, blood_pressure_diastolic=84), {'bp_elevated'}),
+            (dict(blood_pressure_systolic=130), {'bp_high'}),
+            (dict(blood_pressure_diastolic=85), {'bp_high'}),
+            (dict(body_temperature=38), set()),
+            (dict(body_temperature=38.1), {'fever'}),
+            (dict(body_temperature=40), {'fever'}),
+            (dict(body_temperature=40.1), {'fever', 'seizure_risk'}),
+            (dict(body_temperature=35), set()),
+            (dict(body_temperature=34.9), {'hypothermia'}),
+            (dict(heart_rate=100), set()),
+            (dict(heart_rate=101), {'tachycardia'}),
+            (dict(heart_rate=60), set()),
+            (dict(heart_rate=59), {'bradycardia'}),
+        ])
+
+    def test_sugar_age_bands(self):
+        self.assertFires([
+            (dict(age=30, blood_sugar=100), set()),
+            (dict(age=30, blood_sugar=101), {'sugar_high'}),
+            (dict(age=31, blood_sugar=101), set()),
+            (dict(age=31, blood_sugar=109), {'sugar_high'}),
+            (dict(age=40, blood_sugar=108), set()),
+            (dict(age=40, blood_sugar=109), {'sugar_high'}),
+            (dict(age=41, blood_sugar=109), set()),
+            (dict(age=41, blood_sugar=160), set()),
+            (dict(age=41, blood_sugar=161), {'sugar_high'}),
+        ])
+
+    def test_suppression(self):
+        masks = evaluate_masks({'blood_pressure_systolic': [125, 140], 'blood_pressure_diastolic': [70, 90]})
+        self.assertEqual(masks['bp_elevated'].tolist(), [True, False])
+        self.assertEqual(masks['bp_high'].tolist(), [False, True])
+        # Without bp_high in the table nothing hides the borderline tier
+        rules = [rule for rule in RULES if rule.code == 'bp_elevated']
+        masks = evaluate_masks({'blood_pressure_systolic': [125, 140], 'blood_pressure_diastolic': [70, 90]}, rules)
+        self.assertEqual(masks['bp_elevated'].tolist(), [True, True])
+
+    def test_missing_values_fire_nothing(self):
+        self.assertFires([
+            (dict(blood_pressure_systolic=None, blood_pressure_diastolic=np.nan, heart_rate=None,
+                  blood_sugar=np.nan, body_temperature=None), set()),
+            (dict(age=None, blood_sugar=500), set()),
+            (dict(heart_rate='', body_temperature='n/a'), set()),
+        ])
+        # Absent columns behave like all-missing ones
+        masks = evaluate_masks({'heart_rate': [130, 70]})
+        self.assertEqual(masks['tachycardia'].tolist(), [True, False])
+        self.assertFalse(any(mask.any() for code, mask in masks.items() if code != 'tachycardia'))
+
+
+class AlertTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor_user = User.objects.create_user('doctor', password='pw')
+        Doctor.objects.create(user=cls.doctor_user, specialization='cardiology')
+        cls.patient = Patient.objects.create(first_name='Test', last_name='Patient', age=50)
+
+    def reading(self, day, **values):
+        defaults = dict(blood_pressure_systolic=110, blood_pressure_diastolic=70, heart_rate=70,
+                        blood_sugar=90, body_temperature=36.8)
+        return VitalSigns.objects.create(
+            patient=self.patient, date=jdatetime.date(1403, 1, day), **{**defaults, **values},
+        )
+
+    def statuses(self):
+        return dict(Alert.objects.values_list('code', 'status'))
+
+    def test_alerts_follow_latest_reading(self):
+        first = self.reading(1, body_temperature=38.5, heart_rate=110)
+        self.assertEqual(self.statuses(), {'fever': Alert.ACTIVE, 'tachycardia': Alert.ACTIVE})
+
+        first.heart_rate = 80
+        first.save()
+        self.assertEqual(self.statuses(), {'fever': Alert.ACTIVE, 'tachycardia': Alert.RESOLVED})
+
+        self.reading(2)
+        self.assertFalse(Alert.objects.filter(status=Alert.ACTIVE).exists())
+
+    def test_dismissal_persists(self):
+        self.client.force_login(self.doctor_user)
+        reading = self.reading(1, body_temperature=38.5)
+        alert = Alert.objects.get()
+        self.assertContains(self.client.get(reverse('doctor_dashboard')), alert.message)
+
+        response = self.client.post(reverse('doctor_dashboard'), {'dismiss_alert': alert.pk})
+        self.assertNotContains(response, alert.message)
+        self.assertNotContains(self.client.get(reverse('doctor_dashboard')), alert.message)
+
+        # Rewriting the same reading does not bring a dismissed alert back
+        reading.save()
+        alert.refresh_from_db()
+        self.assertEqual((alert.status, alert.dismissed_by), (Alert.DISMISSED, self.doctor_user))
+
+
+class RollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.nurse_user = User.objects.create_user('rollup_nurse', password='pw')
+        Nurse.objects.create(user=cls.nurse_user)
+        cls.patient = Patient.objects.create(first_name='r', last_name='test', age=40)
+        # 1403-01-01 is Wednesday 2024-03-20, so the first ISO week holds 5 readings
+        make_vitals(cls.patient, 60)
+        rebuild_rollups()
+
+    def week(self, start):
+        return VitalsRollup.objects.get(patient=self.patient, period=VitalsRollup.WEEK, period_start=start)
+
+    def test_weekly_stats(self):
+        first = self.week(jdatetime.date(1402, 12, 28))
+        self.assertEqual(first.count, 5)
+        self.assertEqual((first.heart_rate_min, first.heart_rate_max, first.heart_rate_mean), (60, 64, 62))
+        self.assertEqual(VitalsRollup.objects.filter(period=VitalsRollup.DAY).count(), 60)
+
+    def test_save_refreshes_its_week(self):
+        reading = VitalSigns.objects.get(patient=self.patient, date=jdatetime.date(1403, 1, 1))
+        reading.heart_rate = 160
+        reading.save()
+        self.assertEqual(self.week(jdatetime.date(1402, 12, 28)).heart_rate_max, 160)
+        reading.delete()
+        self.assertEqual(self.week(jdatetime.date(1402, 12, 28)).count, 4)
+
+    def test_moving_a_reading_refreshes_both_weeks(self):
+        reading = VitalSigns.objects.get(patient=self.patient, date=jdatetime.date(1403, 1, 1))
+        self.client.force_login(self.nurse_user)
+        response = self.client.post(reverse('edit_vital_signs_with_id', args=[self.patient.pk, reading.pk]), {
+            'date': '1403-03-01', 'blood_pressure_systolic': 120, 'blood_pressure_diastolic': 80,
+            'heart_rate': 70, 'blood_sugar': 100, 'body_temperature': 36.8,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.week(jdatetime.date(1402, 12, 28)).count, 4)
+        self.assertFalse(VitalsRollup.objects.filter(
+            patient=self.patient, period=VitalsRollup.DAY, period_start=jdatetime.date(1403, 1, 1)).exists())
+        self.assertEqual(self.week(jdatetime.date(1403, 2, 31)).count, 1)
+
+    def test_long_ranges_read_rollups(self):
+        # A COUNT picks the tier and one query reads the weeks; the raw rows are never loaded
+        with self.assertNumQueries(2):
+            data = vitals_chart_data(self.patient, points=20)
+        self.assertEqual((data['resolution'], data['total'], len(data['dates'])), ('week', 60, 9))
+        self.assertEqual(data['heart_rates'][0], 62.0)
+        self.assertEqual((data['envelope']['heart_rates']['min'][0], data['envelope']['heart_rates']['max'][0]), (60.0, 64.0))
+        raw = vitals_chart_data(self.patient)
+        self.assertEqual((raw['resolution'], raw['envelope']), ('raw', {}))
+
+    def test_weekly_envelope_keeps_spikes(self):
+        reading = VitalSigns.objects.get(patient=self.patient, date=jdatetime.date(1403, 1, 10))
+        reading.heart_rate = 190
+        reading.save()
+        data = vitals_chart_data(self.patient, points=20)
+        week = data['dates'].index('1403-01-06')
+        self.assertLess(data['heart_rates'][week], 100)
+        self.assertEqual(data['envelope']['heart_rates']['max'][week], 190.0)
+
+    def test_prompt_trends(self):
+        attach_weekly_trends(self.patient, weeks=4)
+        self.assertEqual(len(self.patient.weekly_rollups), 4)
+        self.assertGreater(self.patient.weekly_rollups[0].period_start, self.patient.weekly_rollups[1].period_start)
+
+
+class SeriesCacheTests(TransactionTestCase):
+    # Real commits: the cache is only written from transaction.on_commit
+
+    def setUp(self):
+        self.patient = Patient.objects.create(first_name='s', last_name='test', age=40)
+        make_vitals(self.patient, 80)
+        get_series_cache().clear()
+
+    def test_readers_share_one_load(self):
+        # The chart's tier COUNT, then one load shared by the chart, the prompt and the export
+        with self.assertNumQueries(2):
+            vitals_chart_data(self.patient, points=500)
+            summary_vitals(self.patient)
+            stream, _, _ = stream_vital_signs(self.patient, 'csv')
+        self.assertEqual(b''.join(stream).decode('utf-8-sig').count('\r\n'), 81)
+
+    def test_export_reads_the_cache_only_when_resident(self):
+        stream, _, _ = stream_vital_signs(self.patient, 'csv')
+        with self.assertNumQueries(1):
+            streamed = b''.join(stream)
+        # A long export must not load (or evict) cache entries
+        self.assertIsNone(get_series_cache().peek(self.patient.pk))
+
+        get_series(self.patient)
+        with self.assertNumQueries(0):
+            cached = b''.join(stream_vital_signs(self.patient, 'csv')[0])
+        self.assertEqual(cached, streamed)
+
+    def test_prompt_matches_model_rows(self):
+        rows = VitalSigns.objects.filter(patient=self.patient).order_by('-date')[:50]
+        self.assertEqual(build_messages(self.patient, summary_vitals(self.patient)), build_messages(self.patient, rows))
+
+    def test_write_invalidates(self):
+        get_series(self.patient)
+        VitalSigns.objects.filter(patient=self.patient).first().delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(len(get_series(self.patient)), 79)
+
+    def test_other_process_sees_writes(self):
+        # A second SeriesCache stands for another worker process sharing the Django cache
+        other = SeriesCache()
+        other.get(self.patient.pk)
+        reading = VitalSigns.objects.filter(patient=self.patient).order_by('date').first()
+        reading.heart_rate = 150
+        reading.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(other.get(self.patient.pk).values['heart_rate'][0], 150)
+
+    def test_reads_inside_a_transaction_are_cached_on_commit(self):
+        with transaction.atomic():
+            self.assertEqual(len(get_series(self.patient)), 80)
+            self.assertIsNone(get_series_cache().peek(self.patient.pk))
+        self.assertIsNotNone(get_series_cache().peek(self.patient.pk))
+
+        # A rolled-back write and the read that saw it leave no trace
+        get_series_cache().clear()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            make_vitals(self.patient, 1, start=jdatetime.date(1404, 1, 1))
+            self.assertEqual(len(get_series(self.patient)), 81)
+            raise RuntimeError
+        self.assertIsNone(get_series_cache().peek(self.patient.pk))
+        self.assertEqual(len(get_series(self.patient)), 80)
+
+    def test_writes_reach_other_processes_on_commit(self):
+        other = SeriesCache()
+        other.get(self.patient.pk)
+        with transaction.atomic():
+            VitalSigns.objects.filter(patient=self.patient).first().delete()
+            # Other processes cannot see the delete yet and keep their entry
+            self.assertIsNotNone(other.peek(self.patient.pk))
+        self.assertIsNone(other.peek(self.patient.pk))
+        self.assertEqual(len(other.get(self.patient.pk)), 79)
+
+    def test_lru_bounded_by_bytes(self):
+        other = Patient.objects.create(first_name='o', last_name='test', age=40)
+        make_vitals(other, 80)
+        cache = SeriesCache(max_bytes=int(get_series(self.patient).nbytes * 1.5))
+        cache.get(self.patient.pk)
+        cache.get(other.pk)
+        self.assertEqual(list(cache._entries), [other.pk])
+        self.assertEqual(cache.nbytes, cache.get(other.pk).nbytes)
+
+
+class DownsampleTests(SimpleTestCase):
+    rng = np.random.default_rng(0)
+    x = np.cumsum(rng.integers(1, 5, 1000))
+    y = rng.normal(80, 10, 1000)
+
+    def test_lttb_keeps_endpoints_and_threshold(self):
+        for threshold in (3, 10, 999):
+            with self.subTest(threshold=threshold):
+                kept = lttb_indices(self.x, self.y, threshold)
+                self.assertEqual(len(kept), threshold)
+                self.assertEqual((kept[0], kept[-1]), (0, len(self.y) - 1))
+                self.assertTrue((np.diff(kept) > 0).all())
+
+    def test_lttb_keeps_a_spike(self):
+        y = np.full(500, 70.0)
+        y[123] = 180
+        self.assertIn(123, lttb_indices(np.arange(500), y, 20))
+
+    def test_minmax_keeps_bucket_extremes(self):
+        kept = minmax_indices(self.y, 20)
+        self.assertLessEqual(len(kept), 20)
+        self.assertTrue((np.diff(kept) > 0).all())
+        self.assertIn(self.y.argmin(), kept)
+        self.assertIn(self.y.argmax(), kept)
+
+    def test_short_inputs_are_returned_whole(self):
+        for threshold in (5, 6, 100):
+            with self.subTest(threshold=threshold):
+                self.assertEqual(lttb_indices(self.x[:5], self.y[:5], threshold).tolist(), list(range(5)))
+                self.assertEqual(minmax_indices(self.y[:5], threshold).tolist(), list(range(5)))
+        self.assertEqual(len(lttb_indices(self.x, self.y, 2)), len(self.y))
+        self.assertEqual(len(minmax_indices(self.y, 1)), len(self.y))
+
+    def test_downsample_indices(self):
+        columns = [self.y, self.y[::-1]]
+        self.assertEqual(len(downsample_indices(self.x, columns, 1000)), 1000)
+        for method in METHODS:
+            with self.subTest(method=method):
+                kept = downsample_indices(self.x, columns, 100, method)
+                self.assertLessEqual(len(kept), 100)
+                self.assertTrue((np.diff(kept) > 0).all())
+        with self.assertRaises(ValueError):
+            downsample_indices(self.x, columns, 100, 'mean')
+
+
+class DateRangeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('nurse', password='pw')
+        Nurse.objects.create(user=cls.user)
+        cls.patient = Patient.objects.create(first_name='d', last_name='test', age=40)
+        make_vitals(cls.patient, 60)
+
+    def setUp(self):
+        get_series_cache().clear()
+        self.client.force_login(self.user)
+
+    def get(self, name, query):
+        return self.client.get(reverse(name, args=[self.patient.pk]) + query)
+
+    def test_cold_range_reads_only_its_rows(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.get('patient_chart_data', '?from=1403-01-05&to=1403-01-15').json()
+        self.assertEqual((data['total'], data['dates'][0], data['dates'][-1]), (11, '1403-01-05', '1403-01-15'))
+        self.assertTrue(any('"date" >=' in q['sql'] and '"date" <=' in q['sql'] for q in ctx.captured_queries))
+        # Nothing was cached, so a full-history read still loads everything
+        self.assertIsNone(get_series_cache().peek(self.patient.pk))
+
+        response = self.get('export_patient_data', '?format=csv&from=1403-02-20')
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8-sig').count('\r\n'), 11)
+
+    def test_page_table_and_summary_follow_range(self):
+        response = self.get('patient_detail_nr', '?from=1403-01-05&to=1403-01-15')
+        self.assertEqual([str(vs.date) for vs in response.context['vital_signs']][::10], ['1403-01-15', '1403-01-05'])
+        self.assertContains(response, 'from=1403-01-05&amp;to=1403-01-15')
+
+        with mock.patch('main_app.services.ai_summary.Client', None):
+            response = self.get('patient_ai_summary_nr', '?to=1403-01-15')
+            self.assertEqual(response.status_code, 202)
+            job = claim_next_job('test')
+            self.assertEqual((job.date_from, job.date_to), (None, jdatetime.date(1403, 1, 15)))
+            run_job(job)
+        job.refresh_from_db()
+        self.assertIn('1403-01-15', job.summary)
+
+    def test_invalid_range(self):
+        for name in ('patient_chart_data', 'export_patient_data', 'patient_ai_summary_nr', 'patient_ai_summary_stream'):
+            with self.subTest(name=name):
+                self.assertEqual(self.get(name, '?from=1403-13-40').status_code, 400)
+
+
+class FragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.nurse_user = User.objects.create_user('nurse', password='pw')
+        Nurse.objects.create(user=cls.nurse_user)
+        cls.doctor_user = User.objects.create_user('doctor', password='pw')
+        Doctor.objects.create(user=cls.doctor_user, specialization='cardiology')
+        cls.patient = Patient.objects.create(first_name='Cached', last_name='Patient', age=50, emergency=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def patient_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, [q['sql'] for q in ctx.captured_queries if 'main_app_patient' in q['sql']]
+
+    def test_burst_renders_once(self):
+        for user, url in ((self.nurse_user, reverse('nurse_dashboard')), (self.doctor_user, reverse('doctor_dashboard')),
+                          (self.doctor_user, reverse('patient_list') + '?q=Ca')):
+            with self.subTest(url=url):
+                self.client.force_login(user)
+                first, queries = self.patient_queries(url)
+                self.assertTrue(queries)
+                second, queries = self.patient_queries(url)
+                self.assertEqual(queries, [])
+                self.assertContains(second, 'Cached')
+
+    def test_writes_invalidate(self):
+        self.client.force_login(self.doctor_user)
+        self.patient_queries(reverse('doctor_dashboard'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Patient.objects.filter(pk=self.patient.pk).update(first_name='Renamed')
+            self.patient.refresh_from_db()
+            self.patient.save()
+        response, queries = self.patient_queries(reverse('doctor_dashboard'))
+        self.assertTrue(queries)
+        self.assertContains(response, 'Renamed')
+
+        self.patient_queries(reverse('nurse_list'))
+        Nurse.objects.create(user=User.objects.create_user('nurse2', password='pw', email='nurse2@example.com'))
+        self.assertContains(self.client.get(reverse('nurse_list')), 'nurse2@example.com')
+
+    def test_dismiss_form_outside_fragments(self):
+        self.client.force_login(self.doctor_user)
+        self.client.get(reverse('doctor_dashboard'))
+        other = self.client_class(enforce_csrf_checks=True)
+        other.force_login(self.doctor_user)
+        page = other.get(reverse('doctor_dashboard')).content.decode()
+        token = re.search(r'id="dismiss-form"[^>]*><input type="hidden" name="csrfmiddlewaretoken" value="([^"]+)"', page)
+        response = other.post(reverse('doctor_dashboard'), {
+            'csrfmiddlewaretoken': token.group(1), 'dismiss_patient_alert': self.patient.pk,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, f'data-patient-id="{self.patient.pk}"')
+
+
+
+class VitalsImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('nurse', password='pw')
+        Nurse.objects.create(user=cls.user)
+        cls.patient = Patient.objects.create(first_name='i', last_name='test', age=40)
+
+    def frame(self, rows):
+        columns = ['date', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'heart_rate', 'blood_sugar', 'body_temperature']
+        return pd.DataFrame(rows, columns=columns)
+
+    def test_bad_rows_are_rejected_with_messages(self):
+        result = import_vitals_frame(self.frame([
+            ['1403-01-01', 120, 80, 70, 100, 36.8],
+            ['1403-13-01', 120, 80, 70, 100, 36.8],
+            ['1403-01-02', 120, 80, 'fast', 100, 36.8],
+            ['1403-01-03', 500, 80, 70, 100, 36.8],
+            ['1403-01-04', 120, 80, 70.5, 100, 36.8],
+            ['1403-01-01', 130, 85, 75, 110, 37.0],
+        ]), patient=self.patient)
+
+        self.assertEqual((result.inserted, result.updated, result.rejected), (1, 0, 5))
+        self.assertEqual([e.split(':')[0] for e in result.errors], [f'خطا در ردیف {r}' for r in (1, 2, 3, 4, 5)])
+        self.assertIn('تاریخ تکراری', result.errors[0])
+        self.assertIn('تاریخ نامعتبر', result.errors[1])
+        self.assertIn("'heart_rate' عددی نیست", result.errors[2])
+        self.assertIn("'blood_pressure_systolic' خارج از محدوده", result.errors[3])
+        self.assertIn("'heart_rate' باید عدد صحیح باشد", result.errors[4])
+        # The later duplicate wins
+        self.assertEqual(VitalSigns.objects.get(patient=self.patient).heart_rate, 75)
+
+    def test_missing_columns(self):
+        result = import_vitals_frame(self.frame([['1403-01-01', 120, 80, 70, 100, 36.8]]).drop(columns='heart_rate'),
+                                     patient=self.patient)
+        self.assertEqual((result.inserted, result.rejected), (0, 1))
+        self.assertEqual(result.errors, ["ستون 'heart_rate' در فایل یافت نشد."])
+
+    def test_existing_readings_are_updated(self):
+        make_vitals(self.patient, 3)
+        result = import_vitals_frame(self.frame([
+            ['1403-01-02', 150, 95, 99, 140, 38.0],
+            ['1403-01-05', 120, 80, 70, 100, 36.8],
+        ]), patient=self.patient)
+        self.assertEqual((result.inserted, result.updated, result.rejected, result.updated_rows), (1, 1, 0, [1]))
+        self.assertEqual(VitalSigns.objects.filter(patient=self.patient).count(), 4)
+        updated = VitalSigns.objects.get(patient=self.patient, date=jdatetime.date(1403, 1, 2))
+        self.assertEqual((updated.heart_rate, updated.body_temperature), (99, 38.0))
+        self.assertEqual(LatestVitals.objects.get(patient=self.patient).date, jdatetime.date(1403, 1, 5))
+
+    def test_upload_reports_counts(self):
+        make_vitals(self.patient, 1)
+        fh = tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False)
+        fh.close()
+        self.addCleanup(os.remove, fh.name)
+        self.frame([
+            ['1403-01-01', 120, 80, 70, 100, 36.8],
+            ['1403-01-02', 120, 80, 70, 100, 36.8],
+            ['bad', 120, 80, 70, 100, 36.8],
+        ]).to_excel(fh.name, index=False)
+
+        self.client.force_login(self.user)
+        with open(fh.name, 'rb') as upload:
+            response = self.client.post(reverse('upload_excel'), {'file': upload, 'patient': self.patient.pk}, follow=True)
+        texts = [str(m) for m in response.context['messages']]
+        self.assertIn('فایل اکسل پردازش شد: 1 ردیف جدید، 1 ردیف به‌روزرسانی و 1 ردیف رد شد.', texts)
+        self.assertTrue(any(t.startswith('خطا در ردیف 3') for t in texts))
+
+
+class ExportTests(TestCase):
+    columns = ['id', 'date', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'heart_rate', 'blood_sugar', 'body_temperature']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('nurse', password='pw')
+        Nurse.objects.create(user=cls.user)
+        cls.patient = Patient.objects.create(first_name='Ali', last_name='Export', age=40)
+        cls.readings = make_vitals(cls.patient, 40)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def export(self, fmt, query=''):
+        response = self.client.get(reverse('export_patient_data', args=[self.patient.pk]) + f'?format={fmt}{query}')
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename=Ali_Export_data.{fmt}')
+        return response, b''.join(response.streaming_content)
+
+    def expected(self, readings):
+        return [
+            [r.pk, str(r.date), r.blood_pressure_systolic, r.blood_pressure_diastolic, r.heart_rate, r.blood_sugar, r.body_temperature]
+            for r in readings
+        ]
+
+    def test_csv(self):
+        response, body = self.export('csv', '&from=1403-01-31')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertTrue(body.startswith('\ufeff'.encode('utf-8')))
+        frame = pd.read_csv(io.BytesIO(body), encoding='utf-8-sig')
+        self.assertEqual(list(frame.columns), self.columns)
+        # Jalali dates across the Farvardin/Ordibehesht boundary
+        self.assertEqual(frame.values.tolist(), self.expected(self.readings[30:]))
+        self.assertEqual(frame['date'].iloc[1], '1403-02-01')
+
+    def test_xlsx(self):
+        response, body = self.export('xlsx')
+        self.assertEqual(response['Content-Type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        frame = pd.read_excel(io.BytesIO(body), sheet_name='Vital Signs')
+        self.assertEqual(list(frame.columns), self.columns)
+        self.assertEqual(frame.values.tolist(), self.expected(self.readings))
+
+    def test_parquet(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        response, body = self.export('parquet')
+        self.assertEqual(response['Content-Type'], 'application/vnd.apache.parquet')
+        frame = pd.read_parquet(io.BytesIO(body))
+        self.assertEqual(list(frame.columns), self.columns)
+        self.assertEqual(frame.values.tolist(), self.expected(self.readings))
+        self.assertEqual(str(frame['heart_rate'].dtype), 'int32')
+
+    def test_unknown_format(self):
+        response = self.client.get(reverse('export_patient_data', args=[self.patient.pk]) + '?format=pdf')
+        self.assertEqual(response.status_code, 400)
+
+
+class IngestApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(first_name='i', last_name='test', age=40)
+        make_vitals(cls.patient, 3)
+        cls.token, cls.key = create_token('ward gateway')
+
+    def post(self, body, key=None):
+        return self.client.post(
+            reverse('ingest_vitals'), body if isinstance(body, str) else json.dumps(body),
+            content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {key or self.key}',
+        )
+
+    def reading(self, date, patient_id=None, **values):
+        return {
+            'patient_id': patient_id or self.patient.pk, 'date': date, 'blood_pressure_systolic': 120,
+            'blood_pressure_diastolic': 80, 'heart_rate': 70, 'blood_sugar': 100, 'body_temperature': 36.8, **values,
+        }
+
+    def test_batch_reports_each_reading(self):
+        response = self.post({'readings': [
+            self.reading('1403-01-01'),
+            self.reading('1403-02-01', body_temperature=39.5),
+            self.reading('1403-02-02', heart_rate='fast'),
+            self.reading('1403-02-03', patient_id=self.patient.pk + 1000),
+        ]})
+        body = response.json()
+        self.assertEqual((body['inserted'], body['updated'], body['rejected']), (1, 1, 2))
+        self.assertEqual([item['status'] for item in body['results']], ['updated', 'inserted', 'rejected', 'rejected'])
+        self.assertIn('heart_rate', body['results'][2]['errors'])
+        self.assertIn('یافت نشد', body['results'][3]['errors'])
+        # The bulk write keeps the projections current
+        self.assertEqual(LatestVitals.objects.get(patient=self.patient).date, jdatetime.date(1403, 2, 1))
+        self.assertTrue(Alert.objects.filter(patient=self.patient, status=Alert.ACTIVE).exists())
+        self.token.refresh_from_db()
+        self.assertIsNotNone(self.token.last_used_at)
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.post([self.reading('1403-02-01')], key='wrong').status_code, 401)
+        self.token.is_active = False
+        self.token.save()
+        self.assertEqual(self.post([self.reading('1403-02-01')]).status_code, 401)
+        self.token.is_active = True
+        self.token.save()
+        for body in ('not json', {'readings': []}, [1, 2]):
+            with self.subTest(body=body):
+                self.assertEqual(self.post(body).status_code, 400)
+        with self.settings(INGEST_MAX_BATCH=1):
+            self.assertEqual(self.post([self.reading('1403-02-01')] * 2).status_code, 400)
+        self.assertEqual(self.client.get(reverse('ingest_vitals')).status_code, 405)
+
+
+class BulkImportCommandTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patients = [Patient.objects.create(first_name=f'b{i}', last_name='test', age=40) for i in range(2)]
+
+    def write_csv(self, rows):
+        fh = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8')
+        self.addCleanup(os.remove, fh.name)
+        self.addCleanup(lambda: os.path.exists(fh.name + '.checkpoint.json') and os.remove(fh.name + '.checkpoint.json'))
+        fh.write('patient_id,date,blood_pressure_systolic,blood_pressure_diastolic,heart_rate,blood_sugar,body_temperature\n')
+        fh.writelines(rows)
+        fh.close()
+        return fh.name
+
+    def import_csv(self, path, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_vitals', path, '--patient-column', 'patient_id', '--chunk-rows', '50',
+                     '--workers', '2', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_parallel_import_and_resume(self):
+        start = jdatetime.date(1400, 1, 1)
+        rows = [
+            f'{p.pk},{(start + jdatetime.timedelta(days=i)).togregorian()},120,80,70,100,36.8\n'
+            for i in range(150) for p in self.patients
+        ]
+        rows[10] = f'{self.patients[0].pk},1400-01-06,120,80,fast,100,36.8\n'
+        rows.append(f'{self.patients[1].pk + 1000},1400-01-01,120,80,70,100,36.8\n')
+        path = self.write_csv(rows)
+
+        out, err = self.import_csv(path)
+        self.assertEqual(VitalSigns.objects.filter(patient__in=self.patients).count(), 299)
+        self.assertIn('rows/s', out)
+        self.assertIn('خطا در ردیف 11', err)
+        self.assertEqual(len(err.strip().splitlines()), 2)
+        self.assertEqual(LatestVitals.objects.get(patient=self.patients[1]).date, start + jdatetime.timedelta(days=149))
+
+        checkpoint = json.load(open(path + '.checkpoint.json'))
+        self.assertEqual((checkpoint['rows'], checkpoint['inserted'], checkpoint['rejected']), (301, 299, 2))
+        # A finished checkpoint leaves nothing to do; without --resume everything is upserted again
+        out, _ = self.import_csv(path, '--resume')
+        self.assertIn('inserted 0, updated 0', out)
+        out, _ = self.import_csv(path)
+        self.assertIn('inserted 0, updated 299', out)
+
+
+
+class WorkbookUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ward_nurse', password='pw')
+        Nurse.objects.create(user=cls.user)
+        cls.patients = [Patient.objects.create(first_name=f'w{i}', last_name='test', age=50) for i in range(3)]
+
+    def upload(self, sheets):
+        fh = tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False)
+        fh.close()
+        self.addCleanup(os.remove, fh.name)
+        with pd.ExcelWriter(fh.name) as writer:
+            for name, frame in sheets.items():
+                frame.to_excel(writer, sheet_name=name, index=False)
+        self.client.force_login(self.user)
+        with open(fh.name, 'rb') as upload:
+            return self.client.post(reverse('upload_excel'), {'file': upload, 'patient': ''})
+
+    def readings(self, days, **extra):
+        start = jdatetime.date(1401, 3, 1)
+        return pd.DataFrame([{
+            **extra, 'date': (start + jdatetime.timedelta(days=i)).togregorian().isoformat(),
+            'blood_pressure_systolic': 120, 'blood_pressure_diastolic': 80, 'heart_rate': 70,
+            'blood_sugar': 100, 'body_temperature': 36.8,
+        } for i in range(days)])
+
+    def test_sheet_per_patient_and_patient_column(self):
+        first, second, third = self.patients
+        bad = self.readings(2).assign(heart_rate=[70, 'fast'])
+        response = self.upload({
+            f'{first.pk} - w0': self.readings(5),
+            f'{second.pk}': bad,
+            'ward': pd.concat([self.readings(3, patient_id=third.pk), self.readings(1, patient_id=third.pk + 1000)]),
+            'notes': self.readings(1),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        result = response.context['result']
+        self.assertEqual((result.inserted, result.updated, result.rejected), (9, 0, 2))
+        self.assertEqual(len(result.sheet_errors), 1)
+        summaries = {summary.patient_id: summary for summary in result.patients}
+        self.assertEqual(summaries[first.pk].inserted, 5)
+        self.assertEqual(summaries[first.pk].last_date, jdatetime.date(1401, 3, 5))
+        self.assertEqual((summaries[second.pk].inserted, summaries[second.pk].rejected), (1, 1))
+        self.assertIn("ردیف 2", summaries[second.pk].errors[0])
+        self.assertEqual(summaries[third.pk].sheets, ['ward'])
+        self.assertIsNone(summaries[third.pk + 1000].patient)
+        self.assertEqual(LatestVitals.objects.get(patient=third).date, jdatetime.date(1401, 3, 3))
+
+        # Re-uploading the same readings updates them
+        response = self.upload({f'{first.pk}': self.readings(5)})
+        self.assertEqual(response.context['result'].updated, 5)
+
+    def test_patient_with_only_rejected_rows_is_found(self):
+        first, second, _ = self.patients
+        response = self.upload({
+            str(first.pk): self.readings(2).assign(heart_rate=['fast', 'slow']),
+            str(second.pk): self.readings(1),
+        })
+        summary = {summary.patient_id: summary for summary in response.context['result'].patients}[first.pk]
+        self.assertEqual((summary.patient, summary.inserted, summary.rejected), (first, 0, 2))
+        self.assertNotContains(response, 'یافت نشد')
+
+    def test_broken_pool_is_replaced(self):
+        broken = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('fork'))
+        with self.assertRaises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result()
+        workbook_import._pool = broken
+        response = self.upload({str(patient.pk): self.readings(2) for patient in self.patients[:2]})
+        self.assertIsNot(workbook_import._pool, broken)
+        self.assertEqual(response.context['result'].inserted, 4)
+
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('nurse', password='pw')
+        Nurse.objects.create(user=cls.user)
+        cls.staff = User.objects.create_user('staff', password='pw', is_staff=True)
+        Patient.objects.create(first_name='p', last_name='test', age=40)
+
+    def setUp(self):
+        cache.clear()
+        profiling.recent_requests().clear()
+
+    def timings(self, response):
+        return {
+            part.split(';')[0].strip(): part for part in response['Server-Timing'].split(',')
+        }
+
+    def test_server_timing_header(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('nurse_patient_list'))
+        timings = self.timings(response)
+        self.assertEqual(set(timings), {'sql', 'tpl', 'ai', 'total'})
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', timings['sql'])
+        self.assertGreater(float(re.search(r'dur=([\d.]+)', timings['tpl']).group(1)), 0)
+
+    def test_slowest_requests(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('nurse_patient_list'))
+        self.client.get(reverse('nurse_dashboard'))
+        self.client.force_login(self.staff)
+        data = self.client.get(reverse('profiling_slowest') + '?limit=2').json()['requests']
+        self.assertEqual(len(data), 2)
+        self.assertEqual({row['path'] for row in data}, {reverse('nurse_patient_list'), reverse('nurse_dashboard')})
+        self.assertGreaterEqual(data[0]['total_ms'], data[1]['total_ms'])
+        self.assertEqual(self.client.get(reverse('profiling_slowest') + '?limit=x').status_code, 400)
+
+
+class DatabaseProfileTests(TestCase):
+    def test_production_pragmas_applied(self):
+        if settings.DB_PROFILE != 'production':
+            self.skipTest('DB_PROFILE is not production')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+class LiveFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor_user = User.objects.create_user('doctor', password='pw')
+        Doctor.objects.create(user=cls.doctor_user, specialization='cardiology')
+
+    def test_wait_is_woken_from_another_thread(self):
+        broker = live_feed.Broker(size=2)
+
+        async def wait():
+            threading.Timer(0.05, broker.publish, args=('emergency', {'patient_id': 1})).start()
+            return await broker.wait(0, timeout=5)
+
+        events, resync = asyncio.run(wait())
+        self.assertEqual([(e.id, e.kind) for e in events], [(1, 'emergency')])
+        self.assertFalse(resync)
+        # Ids that fell out of the buffer, or are from another process, need a resync
+        broker.publish('alert', {})
+        broker.publish('alert', {})
+        self.assertEqual(broker.events_after(0), ([], True))
+        self.assertEqual(broker.events_after(10), ([], True))
+        self.assertEqual([e.id for e in broker.events_after(1)[0]], [2, 3])
+
+    def write(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            patient = Patient.objects.create(first_name='Test', last_name='Patient', age=50, emergency=True)
+            VitalSigns.objects.create(
+                patient=patient, date=jdatetime.date(1403, 1, 1), blood_pressure_systolic=110,
+                blood_pressure_diastolic=70, heart_rate=70, blood_sugar=90, body_temperature=39,
+            )
+        return patient
+
+    async def test_long_poll_delivers_committed_writes(self):
+        await self.async_client.aforce_login(self.doctor_user)
+        after = live_feed.get_broker().last_id
+        patient = await sync_to_async(self.write)()
+
+        body = (await self.async_client.get(reverse('doctor_live_poll') + f'?after={after}')).json()
+        kinds = [(e['kind'], e['data'].get('patient_id')) for e in body['events']]
+        self.assertIn(('emergency', patient.pk), kinds)
+        self.assertIn(('alert', patient.pk), kinds)
+        self.assertEqual(body['last_id'], body['events'][-1]['id'])
+        self.assertNotIn('snapshot', body)
+
+        # An id the broker does not know (another process, a restart) resyncs from the database
+        body = (await self.async_client.get(reverse('doctor_live_poll') + f'?after={body["last_id"] + 1000}')).json()
+        self.assertTrue(body['resync'])
+        self.assertEqual([a['patient_id'] for a in body['snapshot']['alerts']], [patient.pk])
+
+    def test_wsgi_polls_return_at_once_from_the_database(self):
+        self.client.force_login(self.doctor_user)
+        # Published on another process's broker: this one never sees the events
+        with mock.patch('main_app.services.live_feed.publish'):
+            patient = self.write()
+        t0 = time.monotonic()
+        body = self.client.get(reverse('doctor_live_poll') + f'?after={live_feed.get_broker().last_id}').json()
+        self.assertLess(time.monotonic() - t0, 1)
+        self.assertEqual((body['events'], body['resync'], body['poll_after']), ([], True, live_feed.SHORT_POLL_INTERVAL))
+        self.assertEqual([a['patient_id'] for a in body['snapshot']['alerts']], [patient.pk])
+        self.assertEqual(body['snapshot']['emergency'], [live_feed.emergency_event(patient)])
+        # WSGI cannot stream the SSE endpoint
+        self.assertEqual(self.client.get(reverse('doctor_live_feed')).status_code, 204)
+
+
+class RoleMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.nurse_user = User.objects.create_user('nurse', password='pw')
+        cls.nurse = Nurse.objects.create(user=cls.nurse_user)
+        cls.doctor_user = User.objects.create_user('doctor', password='pw')
+        cls.doctor = Doctor.objects.create(user=cls.doctor_user, specialization='cardiology')
+        cls.plain_user = User.objects.create_user('plain', password='pw')
+
+    def test_role_and_profile(self):
+        for user, role, profile in ((self.nurse_user, 'nurse', self.nurse), (self.doctor_user, 'doctor', self.doctor)):
+            with self.subTest(role=role):
+                self.client.force_login(user)
+                request = self.client.get(reverse('home')).wsgi_request
+                self.assertEqual(request.role, role)
+                self.assertEqual(request.profile, profile)
+        self.client.logout()
+        request = self.client.get(reverse('home')).wsgi_request
+        self.assertIsNone(request.role)
+        self.assertIsNone(request.profile)
+
+    def test_user_without_profile(self):
+        self.client.force_login(self.plain_user)
+        response = self.client.get(reverse('nurse_dashboard'))
+        self.assertEqual(response.status_code, 403)
+        self.assertIsNone(response.wsgi_request.role)
+        self.assertIsNone(response.wsgi_request.profile)
+        # The doctor dashboard keeps its original 'doctor not found' response
+        self.assertEqual(self.client.get(reverse('doctor_dashboard')).status_code, 404)
+
+    def test_profile_is_loaded_with_the_user(self):
+        # Session + user joined with its profile; resolving the role costs nothing more
+        self.client.force_login(self.nurse_user, backend='main_app.backends.ProfileModelBackend')
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertRedirects(self.client.get(reverse('home')), reverse('nurse_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(len(ctx.captured_queries), 2)
+        self.assertIn('main_app_nurse', ctx.captured_queries[1]['sql'])
+        # Sessions from before ProfileModelBackend still authenticate, at one extra query
+        self.client.force_login(self.nurse_user, backend='django.contrib.auth.backends.ModelBackend')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.wsgi_request.role, 'nurse')
+        self.assertEqual(len(ctx.captured_queries), 3)
+
+    async def test_doctor_required_async_view(self):
+        @doctor_required
+        async def view(request):
+            return HttpResponse('ok')
+
+        self.assertTrue(iscoroutinefunction(view))
+        self.assertEqual((await view(SimpleNamespace(role='doctor'))).content, b'ok')
+        for role in ('nurse', None):
+            with self.assertRaises(PermissionDenied):
+                await view(SimpleNamespace(role=role))
+        # Through the async middleware stack: a nurse is refused before the long poll starts
+        await self.async_client.aforce_login(self.nurse_user)
+        response = await self.async_client.get(reverse('doctor_live_poll'))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.asgi_request.role, 'nurse')
+
+
+class ViewQueryCountTests(TestCase):
+    """
+    Drives every URL in main_app/urls.py at growing data sizes and fails when a view's
+    query count grows with the data (N+1). When $VIEW_BENCHMARK_OUTPUT is set, query counts
+    and wall times are appended to that file as one JSON line per run.
+    """
+
+    # (new patients, vitals per patient) added before each measurement round
+    SIZES = [(5, 10), (40, 60)]
+    DOCTOR_VIEWS = {
+        'doctor_dashboard', 'doctor_live_feed', 'doctor_live_poll', 'patient_list', 'nurse_list', 'nurse_detail', 'patient_detail',
+        'edit_patient', 'edit_medications', 'export_patient_data',
+    }
+    ANONYMOUS_VIEWS = {'login', 'register'}
+    # POST-only
+    SKIPPED_VIEWS = {'logout'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.nurse_user = User.objects.create_user('nurse', password='pw')
+        cls.nurse = Nurse.objects.create(user=cls.nurse_user)
+        cls.doctor_user = User.objects.create_user('doctor', password='pw')
+        Doctor.objects.create(user=cls.doctor_user, specialization='cardiology')
+
+    def url_for(self, pattern, patient):
+        values = {
+            'pk': self.nurse.pk if pattern.name == 'nurse_detail' else patient.pk,
+            'patient_id': patient.pk,
+            'vs_id': VitalSigns.objects.filter(patient=patient).values_list('pk', flat=True).first(),
+            'job_id': enqueue_summary(patient).pk,
+        }
+        return reverse(pattern.name, kwargs={name: values[name] for name in pattern.pattern.converters})
+
+    def measure(self, client, url):
+        # Count the queries of a render, not of a cached fragment
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            t0 = time.perf_counter()
+            response = client.get(url)
+            if hasattr(response, 'streaming_content'):
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - t0
+        return {'status': response.status_code, 'queries': len(ctx.captured_queries), 'ms': round(elapsed * 1000, 2)}
+
+    # The live summary endpoint would otherwise call g4f in-request
+    @mock.patch('main_app.services.ai_summary_async.AsyncClient', None)
+    def test_query_counts_do_not_grow(self):
+        clients = {}
+        for role, user in (('nurse', self.nurse_user), ('doctor', self.doctor_user), ('anonymous', None)):
+            clients[role] = self.client_class()
+            if user is not None:
+                clients[role].force_login(user)
+
+        patterns = [p for p in urls.urlpatterns if p.name not in self.SKIPPED_VIEWS]
+        results = {p.name: [] for p in patterns}
+        seeded = [0, 0]
+        for round_no, (patients, per_patient) in enumerate(self.SIZES):
+            seed_synthetic(patients, per_patient, seed=round_no)
+            seeded = [seeded[0] + patients, seeded[1] + patients * per_patient]
+            # The newest patient has the longest history of this round
+            patient = Patient.objects.latest('pk')
+            for pattern in patterns:
+                if pattern.name in self.ANONYMOUS_VIEWS:
+                    role = 'anonymous'
+                else:
+                    role = 'doctor' if pattern.name in self.DOCTOR_VIEWS else 'nurse'
+                url = self.url_for(pattern, patient)
+                clients[role].get(url)  # warm-up: template loading, first-touch caches
+                results[pattern.name].append({
+                    'patients': seeded[0], 'vital_signs': seeded[1], 'url': url, **self.measure(clients[role], url),
+                })
+
+        self.write_results(results)
+        for name, runs in results.items():
+            with self.subTest(view=name):
+                self.assertLess(runs[0]['status'], 500, runs[0])
+                self.assertLessEqual(
+                    runs[-1]['queries'], runs[0]['queries'],
+                    f"{name}: {runs[0]['queries']} queries at {runs[0]['patients']} patients, "
+                    f"{runs[-1]['queries']} at {runs[-1]['patients']}",
+                )
+
+    def write_results(self, results):
+        path = os.environ.get('VIEW_BENCHMARK_OUTPUT')
+        if not path:
+            return
+        record = {'run_at': timezone.now().isoformat(), 'views': results}
+        with open(path, 'a', encoding='utf-8') as fh:
+            fh.write(json.dumps(record, ensure_ascii=False) + '\n')
@@ -5,6 +5,8 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('doctor_dashboard/', views.doctor_dashboard, name='doctor_dashboard'),
+    path('doctor_dashboard/live/', views.doctor_live_feed, name='doctor_live_feed'),
+    path('doctor_dashboard/live/poll/', views.doctor_live_poll, name='doctor_live_poll'),
     path('nurse_dashboard/', views.nurse_dashboard, name='nurse_dashboard'),
     path('nurse_patients/', views.nurse_patient_list, name='nurse_patient_list'),
     path('nurses/', views.nurse_list, name='nurse_list'),
@@ -21,8 +23,14 @@ urlpatterns = [
     path('register/', views.register, name='register'),
     path('edit_medications/<int:pk>/', views.edit_medications, name='edit_medications'),
     path('upload_excel/', views.upload_excel, name='upload_excel'),
+    path('api/vitals/batch/', views.ingest_vitals, name='ingest_vitals'),
     path('export_patient_data/<int:pk>/', views.export_patient_data, name='export_patient_data'),
     path('edit_vital_signs/<int:patient_id>/', views.edit_vital_signs, name='edit_vital_signs'),
     path('edit_vital_signs/<int:patient_id>/<int:vs_id>/', views.edit_vital_signs, name='edit_vital_signs_with_id'),
+    path('patient/<int:pk>/chart_data/', views.patient_chart_data, name='patient_chart_data'),
     path('patient_nr/<int:pk>/ai_summary/', views.patient_ai_summary_nr, name='patient_ai_summary_nr'),
+    path('patient_nr/<int:pk>/ai_summary/live/', views.patient_ai_summary_live, name='patient_ai_summary_live'),
+    path('patient_nr/<int:pk>/ai_summary/stream/', views.patient_ai_summary_stream, name='patient_ai_summary_stream'),
+    path('ai_summary_job/<uuid:job_id>/', views.ai_summary_job_status, name='ai_summary_job_status'),
+    path('profiling/slowest/', views.profiling_slowest, name='profiling_slowest'),
 ]
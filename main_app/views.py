@@ -1,24 +1,49 @@
-from django.http import HttpResponse, JsonResponse
-from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.template.loader import render_to_string
+from django.utils.functional import SimpleLazyObject
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.contrib import messages
-from .models import Patient, ClinicalInfo, Nurse, Doctor, VitalSigns
+from django.core.exceptions import RequestDataTooBig
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .models import Alert, Patient, ClinicalInfo, Nurse, VitalSigns, SummaryJob
 from .forms import ExcelUploadForm, UserRegisterForm, NurseProfileForm, DoctorProfileForm, PatientForm, ClinicalInfoForm, VitalSignsForm, MedicationForm , ExcelUploadForm
 from django.contrib.auth.forms import AuthenticationForm
-from .decorators import nurse_required
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from .backends import resolve_role
+from .decorators import doctor_required, ingest_token_required, nurse_required
 import pandas as pd
 import tempfile
 import os
-from django.db.models import Max
 
-from .services.ai_summary import generate_patient_summary
+from .services.ai_summary import SOURCE_CACHE, SOURCE_FALLBACK
+from .services import live_feed
+from .services.ai_summary_stream import summary_stream
+from .services.alerts import active_alerts, dismiss_alerts, feed_snapshot
+from .services.chart_data import METHODS as CHART_METHODS, RESOLUTIONS as CHART_RESOLUTIONS, max_points as max_chart_points, vitals_chart_data
+from .services.jalali import date_range_params, parse_date_range
+from .services.patient_pages import InvalidCursor, decode_cursor, patient_filters, patient_page
+from .services.profiling import slowest_requests
+from .services.rollups import aattach_weekly_trends, attach_weekly_trends
+from .services.summary_cache import aget_patient_summary, get_cached_fallback, get_cached_summary
+from .services.summary_jobs import enqueue_summary, job_payload, settle_unclaimed, summary_vitals
+from .services.vitals_import import import_vitals_frame
+from .services.vitals_ingest import IngestError, ingest_readings, parse_readings
+from .services.vitals_export import ExportFormatError, stream_vital_signs
+from .services.vitals_series import vitals_between
+from .services.workbook_import import import_workbook
+
+MAX_IMPORT_ERROR_MESSAGES = 10
 
 def home(request):
     if request.user.is_authenticated:
-        if hasattr(request.user, 'nurse'):
+        if request.role == 'nurse':
             return redirect('nurse_dashboard')
-        elif hasattr(request.user, 'doctor'):
+        elif request.role == 'doctor':
             return redirect('doctor_dashboard')
     else:
         return redirect('login')
@@ -31,9 +56,10 @@ def login_view(request):
             login(request, user)
             messages.success(request, f"خوش آمدید {user.username}")
 
-            if hasattr(user, 'nurse'):
+            role, _ = resolve_role(user)
+            if role == 'nurse':
                 return redirect('nurse_dashboard')
-            elif hasattr(user, 'doctor'):
+            elif role == 'doctor':
                 return redirect('doctor_dashboard')
             else:
                 return redirect('home')
@@ -68,7 +94,8 @@ def register(request):
                 profile.last_name = user.last_name
                 profile.save()
 
-            login(request, user)
+            # Two backends are configured, so name the one that joins the profile
+            login(request, user, backend='main_app.backends.ProfileModelBackend')
             messages.success(request, f"ثبت‌نام با موفقیت انجام شد!")
             return redirect('nurse_dashboard' if role == 'nurse' else 'doctor_dashboard')
     else:
@@ -85,13 +112,16 @@ def register(request):
 @login_required
 @nurse_required
 def nurse_dashboard(request):
-    nurse = get_object_or_404(Nurse, user=request.user)
-    patients = Patient.objects.all()
-    emergency_patients = patients.filter(emergency=True)
+    nurse = request.profile
+    # Counts come from COUNT(*); only the newest page of emergency patients is rendered.
+    # Lazy, so a cached dashboard fragment (fragment_tags) runs none of the queries.
+    emergency_page = SimpleLazyObject(lambda: patient_page({'emergency': '1'}))
     return render(request, 'main_app/nurse/nurse_dashboard.html', {
-        'nurse': nurse, 
-        'patients': patients,
-        'emergency_patients': emergency_patients
+        'nurse': nurse,
+        'patient_count': SimpleLazyObject(Patient.objects.count),
+        'emergency_count': SimpleLazyObject(Patient.objects.filter(emergency=True).count),
+        'emergency_patients': SimpleLazyObject(lambda: emergency_page.patients),
+        'emergency_page': emergency_page,
     })
 
 @login_required
@@ -106,9 +136,9 @@ def edit_vital_signs(request, patient_id, vs_id=None):
 
     if request.method == 'POST':
         if vital_sign:
-            form = VitalSignsForm(request.POST, instance=vital_sign)
+            form = VitalSignsForm(request.POST, instance=vital_sign, patient=patient)
         else:
-            form = VitalSignsForm(request.POST)
+            form = VitalSignsForm(request.POST, patient=patient)
         if form.is_valid():
             new_vital_sign = form.save(commit=False)
             new_vital_sign.patient = patient
@@ -146,9 +176,45 @@ def add_patient(request):
 @login_required
 @nurse_required
 def nurse_patient_list(request):
-    nurse = get_object_or_404(Nurse, user=request.user)
-    patients = Patient.objects.all()
-    return render(request, 'main_app/nurse/nurse_patient_list.html', {'nurse': nurse, 'patients': patients})
+    nurse = request.profile
+    return _patient_list_response(
+        request, 'main_app/nurse/nurse_patient_list.html', 'main_app/nurse/_patient_rows.html', {'nurse': nurse},
+    )
+
+def _patient_list_response(request, template, rows_template, context):
+    """
+    Keyset-paginated patient list. ?format=json returns the next rows (rendered with
+    rows_template) and the next page URL for infinite scroll.
+    """
+    try:
+        if request.GET.get('cursor'):
+            decode_cursor(request.GET['cursor'])
+    except InvalidCursor as e:
+        return HttpResponseBadRequest(str(e))
+    # Lazy, so a cached list fragment (fragment_tags) runs no queries
+    page = SimpleLazyObject(lambda: patient_page(request.GET))
+    next_url = SimpleLazyObject(
+        lambda: f'{request.path}?{page.next_query(format="json")}' if page.has_next else ''
+    )
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'results': [
+                {'id': p.pk, 'first_name': p.first_name, 'last_name': p.last_name, 'emergency': p.emergency}
+                for p in page.patients
+            ],
+            'html': render_to_string(rows_template, {'patients': page.patients}, request=request),
+            'next_cursor': page.next_cursor,
+            'next_url': str(next_url) or None,
+        })
+    return render(request, template, {
+        **context,
+        'patients': SimpleLazyObject(lambda: page.patients),
+        'page': page,
+        'filters': patient_filters(request.GET),
+        'next_url': next_url,
+        'rows_template': rows_template,
+    })
 
 @login_required
 @nurse_required
@@ -160,75 +226,131 @@ def delete_patient(request, pk):
         return redirect('nurse_patient_list')
     return render(request, 'main_app/nurse/delete_patient_confirm.html', {'patient': patient})
 
+# Rows in the vitals tables of the detail pages; older readings are reached with ?from=&to=
+TABLE_ROWS = 200
+
+def _page_date_range(request):
+    """?from=&to= bounds for a page; an invalid range shows an error and falls back to all history."""
+    try:
+        return parse_date_range(request.GET)
+    except ValueError as e:
+        messages.error(request, str(e))
+        return None, None
+
+def _vitals_context(patient, start, end):
+    """The newest TABLE_ROWS readings of the range plus the downsampled chart of the whole range."""
+    return {
+        'vital_signs': vitals_between(patient, start, end).order_by('-date')[:TABLE_ROWS],
+        **vitals_chart_data(patient, start, end),
+        'chart_from': start,
+        'chart_to': end,
+        'range_params': date_range_params(start, end),
+    }
+
 @login_required
 @nurse_required
 def patient_detail_nr(request, pk):
     patient = get_object_or_404(Patient, pk=pk)
-    # Limit records for faster render and smaller JSON payloads
-    vital_signs_qs = VitalSigns.objects.filter(patient=patient).order_by('-date')[:200]
-    vital_signs_list = list(vital_signs_qs)
-
-    # Build chart arrays in chronological order
-    dates = [vs.date.strftime('%Y-%m-%d') for vs in reversed(vital_signs_list)]
-    systolic_bp = [vs.blood_pressure_systolic for vs in reversed(vital_signs_list)]
-    diastolic_bp = [vs.blood_pressure_diastolic for vs in reversed(vital_signs_list)]
-    heart_rates = [vs.heart_rate for vs in reversed(vital_signs_list)]
-    blood_sugars = [vs.blood_sugar for vs in reversed(vital_signs_list)]
-    body_temperatures = [vs.body_temperature for vs in reversed(vital_signs_list)]
-
+    start, end = _page_date_range(request)
     context = {
         'patient': patient,
-        'vital_signs': vital_signs_qs,
-        'dates': dates,
-        'systolic_bp': systolic_bp,
-        'diastolic_bp': diastolic_bp,
-        'heart_rates': heart_rates,
-        'blood_sugars': blood_sugars,
-        'body_temperatures': body_temperatures,
+        **_vitals_context(patient, start, end),
+        'stream_summary': isinstance(request, ASGIRequest),
     }
 
     return render(request, 'main_app/nurse/patient_detail.html', context)
 
-# Async endpoint to fetch AI summary after page load
+# Async endpoint to fetch AI summary after page load:
+# cached summaries return at once, otherwise a job is queued (202) for run_summary_worker;
+# a job no worker claims in time is answered with the local fallback
 @login_required
 def patient_ai_summary_nr(request, pk):
+    try:
+        start, end = parse_date_range(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    # The weekly trends are part of the prompt, hence of the cache key
+    patient = attach_weekly_trends(get_object_or_404(Patient, pk=pk), end=end)
+    vital_signs = summary_vitals(patient, start, end)
+    cached = get_cached_summary(patient, vital_signs)
+    if cached is not None:
+        return JsonResponse({'summary': cached, 'error': None, 'source': SOURCE_CACHE})
+    fallback = get_cached_fallback(patient, vital_signs)
+    if fallback is not None:
+        return JsonResponse({'summary': fallback, 'error': None, 'source': SOURCE_FALLBACK})
+
+    job = settle_unclaimed(enqueue_summary(patient, start, end))
+    return JsonResponse(job_payload(job), status=200 if job.status == SummaryJob.DONE else 202)
+
+# Native async variant for ASGI deployments: generates in-request without a worker thread,
+# and a client disconnect or deadline cancels the in-flight g4f calls
+@login_required
+async def patient_ai_summary_live(request, pk):
+    try:
+        start, end = parse_date_range(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    patient = await aattach_weekly_trends(await aget_object_or_404(Patient, pk=pk), end=end)
+    vital_signs = await sync_to_async(summary_vitals)(patient, start, end)
+    summary, error, source = await aget_patient_summary(patient, vital_signs)
+    return JsonResponse({'summary': summary, 'error': error, 'source': source})
+
+# Server-Sent Events under ASGI: tokens as the model writes them, then a final `done` event.
+# Under WSGI the stream would hold a web worker until the deadline, so answer 204; the page's
+# EventSource then fails and it falls back to the queued-job endpoint above.
+@login_required
+def patient_ai_summary_stream(request, pk):
+    try:
+        start, end = parse_date_range(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    patient = attach_weekly_trends(get_object_or_404(Patient, pk=pk), end=end)
+    events = summary_stream(patient, summary_vitals(patient, start, end))
+    response = StreamingHttpResponse(events, content_type='text/event-stream; charset=utf-8')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+def patient_chart_data(request, pk):
+    """
+    JSON chart series for ?from=&to= (Jalali), downsampled to ?points= with ?method=lttb|minmax,
+    from raw readings or weekly rollups per ?resolution=auto|raw|week.
+    """
     patient = get_object_or_404(Patient, pk=pk)
-    # Limit records for faster AI prompt creation
-    vital_signs = VitalSigns.objects.filter(patient=patient).order_by('-date')[:50]
-    summary, error = generate_patient_summary(patient, vital_signs)
-    return JsonResponse({'summary': summary, 'error': error})
-
-def check_alerts(vital_signs):
-    alerts = []
-    if vital_signs.blood_pressure_systolic > 120 or vital_signs.blood_pressure_diastolic > 80:
-        alerts.append(f"بیمار {vital_signs.patient} فشار خون بیش از حد مجاز")
-    if vital_signs.body_temperature > 38:
-        alerts.append(f"بیمار {vital_signs.patient} دمای بدن بیش از حد مجاز (تب)")
-    if vital_signs.body_temperature > 40:
-        alerts.append(f"بیمار {vital_signs.patient} خطر تشنج")
-    if vital_signs.body_temperature < 35:
-        alerts.append(f"بیمار {vital_signs.patient} خطر افت دما")
-
-    age = vital_signs.patient.age
-    if age <= 30 and vital_signs.blood_sugar > 100:
-        alerts.append(f"قند خون بیمار {vital_signs.patient} در حالت غیر طبیعی")
-    elif age > 30 and age <= 40 and vital_signs.blood_sugar > 108:
-        alerts.append(f"قند خون بیمار {vital_signs.patient} در حالت غیر طبیعی")
-    elif age > 40 and vital_signs.blood_sugar > 160:
-        alerts.append(f"قند خون بیمار {vital_signs.patient} در حالت غیر طبیعی")
-    
-    return alerts
+    try:
+        start, end = parse_date_range(request.GET)
+        points = int(request.GET.get('points') or 0) or None
+        method = request.GET.get('method', 'lttb')
+        if method not in CHART_METHODS:
+            raise ValueError(f"روش نمونه‌برداری نامعتبر است: {method}")
+        resolution = request.GET.get('resolution', 'auto')
+        if resolution not in CHART_RESOLUTIONS:
+            raise ValueError(f"تفکیک نمودار نامعتبر است: {resolution}")
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    if points is not None:
+        points = min(max(points, 3), max_chart_points())
+    return JsonResponse(vitals_chart_data(patient, start, end, points, method, resolution))
+
+@login_required
+def ai_summary_job_status(request, job_id):
+    job = settle_unclaimed(get_object_or_404(SummaryJob, pk=job_id))
+    finished = job.status in (SummaryJob.DONE, SummaryJob.FAILED)
+    return JsonResponse(job_payload(job), status=200 if finished else 202)
+
 @login_required
 @nurse_required
 def edit_patient_nr(request, pk):
     patient = get_object_or_404(Patient, pk=pk)
     if request.method == 'POST':
-        form = VitalSignsForm(request.POST)
+        form = VitalSignsForm(request.POST, patient=patient)
         if form.is_valid():
             vital_signs = form.save(commit=False)
             vital_signs.patient = patient
             vital_signs.save()
-            check_alerts(vital_signs)
             messages.success(request, "علائم بالینی با موفقیت ثبت شد!")
             return redirect('patient_detail', pk=pk)
     else:
@@ -238,39 +360,65 @@ def edit_patient_nr(request, pk):
 
 @login_required
 def doctor_dashboard(request):
-    doctor = get_object_or_404(Doctor, user=request.user)
+    if request.role != 'doctor':
+        raise Http404("پزشک یافت نشد.")
+    doctor = request.profile
     emergency_patients = Patient.objects.filter(emergency=True)
-    patients = Patient.objects.all()
-
-    # Get the latest vital signs for each patient
-    latest_dates = VitalSigns.objects.values('patient').annotate(latest_date=Max('date'))
-    latest_vital_signs = VitalSigns.objects.filter(
-        date__in=[entry['latest_date'] for entry in latest_dates]
-    )
-
-    alerts = []
-    for vs in latest_vital_signs:
-        alerts.extend(check_alerts(vs))
 
     # Handle dismissing of alerts and emergency patients
     if request.method == 'POST':
         if 'dismiss_alert' in request.POST:
-            alert_to_dismiss = request.POST.get('dismiss_alert')
-            if alert_to_dismiss and alert_to_dismiss in alerts:
-                alerts.remove(alert_to_dismiss)
-                messages.success(request, f"هشدار '{alert_to_dismiss}' حذف شد.")
+            alert_id = request.POST.get('dismiss_alert', '')
+            dismissed = active_alerts().filter(pk=alert_id).first() if alert_id.isdigit() else None
+            if dismissed is not None:
+                dismiss_alerts(Alert.objects.filter(pk=dismissed.pk), request.user)
+                messages.success(request, f"هشدار '{dismissed.message}' حذف شد.")
         elif 'dismiss_patient_alert' in request.POST:
-            patient_id_to_dismiss = request.POST.get('dismiss_patient_alert')
+            patient_id_to_dismiss = request.POST.get('dismiss_patient_alert', '')
             emergency_patients = emergency_patients.exclude(id=patient_id_to_dismiss)
+            if patient_id_to_dismiss.isdigit():
+                dismiss_alerts(Alert.objects.filter(patient_id=patient_id_to_dismiss), request.user)
             messages.success(request, f"بیمار اورژانسی با شناسه {patient_id_to_dismiss} حذف شد.")
 
     return render(request, 'main_app/dr/doctor_dashboard.html', {
         'doctor': doctor,
         'emergency_patients': emergency_patients,
-        'patients': patients,
-        'alerts': alerts
+        'patient_count': SimpleLazyObject(Patient.objects.count),
+        # Persisted by the vitals signals; one query on the (status, patient) index
+        'alerts': active_alerts(),
+        # Changes after this event id arrive over the live feed
+        'live_feed': True,
+        'feed_last_id': live_feed.get_broker().last_id,
     })
 
+# Live dashboard feed: SSE under ASGI. Under WSGI an endless stream would be buffered, so
+# answer 204, which stops EventSource reconnecting; the page then long-polls instead.
+@login_required
+@doctor_required
+async def doctor_live_feed(request):
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(
+        live_feed.stream(live_feed.parse_after(request), sync_to_async(feed_snapshot)),
+        content_type='text/event-stream; charset=utf-8',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+# Long poll under ASGI. Under WSGI a waiting poll would hold a worker thread, and the
+# in-process broker misses events published by other worker processes, so answer at once
+# with the state re-read from the database; the page polls again after `poll_after` seconds.
+@login_required
+@doctor_required
+async def doctor_live_poll(request):
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({
+            'events': [], 'last_id': live_feed.get_broker().last_id, 'resync': True,
+            'snapshot': await sync_to_async(feed_snapshot)(), 'poll_after': live_feed.SHORT_POLL_INTERVAL,
+        })
+    return JsonResponse(await live_feed.long_poll(live_feed.parse_after(request), sync_to_async(feed_snapshot)))
+
 @login_required
 def edit_medications(request, pk):
     patient = get_object_or_404(Patient, pk=pk)
@@ -286,12 +434,11 @@ def edit_medications(request, pk):
 
 @login_required
 def patient_list(request):
-    patients = Patient.objects.all()
-    return render(request, 'main_app/dr/patient_list.html', {'patients': patients})
+    return _patient_list_response(request, 'main_app/dr/patient_list.html', 'main_app/dr/_patient_rows.html', {})
 
 @login_required
 def nurse_list(request):
-    nurses = Nurse.objects.all()
+    nurses = Nurse.objects.select_related('user')
     return render(request, 'main_app/dr/nurse_list.html', {'nurses': nurses})
 
 @login_required
@@ -307,33 +454,14 @@ def nurse_detail(request, pk):
 def patient_detail(request, pk):
     patient = get_object_or_404(Patient, pk=pk)
     clinical_infos = ClinicalInfo.objects.filter(patient=patient)
-    vital_signs = VitalSigns.objects.filter(patient=patient).order_by('-date')
-
-    dates = []
-    systolic_bp = []
-    diastolic_bp = []
-    heart_rates = []
-    blood_sugars = []
-    body_temperatures = []
-
-    for vs in vital_signs:
-        dates.append(vs.date.strftime('%Y-%m-%d'))
-        systolic_bp.append(vs.blood_pressure_systolic)
-        diastolic_bp.append(vs.blood_pressure_diastolic)
-        heart_rates.append(vs.heart_rate)
-        blood_sugars.append(vs.blood_sugar)
-        body_temperatures.append(vs.body_temperature)
+    start, end = _page_date_range(request)
 
     return render(request, 'main_app/dr/patient_detail.html', {
         'patient': patient,
         'clinical_infos': clinical_infos,
-        'vital_signs': vital_signs,
-        'dates': dates,
-        'systolic_bp': systolic_bp,
-        'diastolic_bp': diastolic_bp,
-        'heart_rates': heart_rates,
-        'blood_sugars': blood_sugars,
-        'body_temperatures': body_temperatures,
+        **_vitals_context(patient, start, end),
+        # Only ASGI streams the summary without holding a worker; WSGI pages poll the job
+        'stream_summary': isinstance(request, ASGIRequest),
     })
 @login_required
 def edit_patient(request, pk):
@@ -364,48 +492,24 @@ def upload_excel(request):
                 temp_file_path = temp_file.name
 
             try:
+                # No patient picked: a ward workbook, one patient per sheet or a patient_id column
+                if patient is None:
+                    result = import_workbook(temp_file_path)
+                    return render(request, 'main_app/upload_excel_result.html', {'result': result})
+
                 df = pd.read_excel(temp_file_path)
-                errors = []
-                for index, row in df.iterrows():
-                    try:
-                        # Ensure column names are correct
-                        date = row['date']
-                        blood_pressure_systolic = row['blood_pressure_systolic']
-                        blood_pressure_diastolic = row['blood_pressure_diastolic']
-                        heart_rate = row['heart_rate']
-                        blood_sugar = row['blood_sugar']
-                        body_temperature = row['body_temperature']
-
-                        # Try to find existing vital signs for the given date
-                        vital_sign, created = VitalSigns.objects.get_or_create(
-                            patient=patient,
-                            date=date,
-                            defaults={
-                                'blood_pressure_systolic': blood_pressure_systolic,
-                                'blood_pressure_diastolic': blood_pressure_diastolic,
-                                'heart_rate': heart_rate,
-                                'blood_sugar': blood_sugar,
-                                'body_temperature': body_temperature
-                            }
-                        )
-                        if not created:
-                            # If vital signs already exist for the given date, update them
-                            vital_sign.blood_pressure_systolic = blood_pressure_systolic
-                            vital_sign.blood_pressure_diastolic = blood_pressure_diastolic
-                            vital_sign.heart_rate = heart_rate
-                            vital_sign.blood_sugar = blood_sugar
-                            vital_sign.body_temperature = body_temperature
-                            vital_sign.save()
-                    except KeyError as e:
-                        errors.append(f"خطا در ردیف {index + 1}: ستون '{e.args[0]}' یافت نشد.")
-                    except Exception as e:
-                        errors.append(f"خطا در ردیف {index + 1}: {e}")
-
-                if errors:
-                    for error in errors:
-                        messages.error(request, error)
-                else:
-                    messages.success(request, "فایل اکسل با موفقیت آپلود و پردازش شد.")
+                result = import_vitals_frame(df, patient=patient)
+
+                # Cookie-based message storage is small; show the first few errors only
+                for error in result.errors[:MAX_IMPORT_ERROR_MESSAGES]:
+                    messages.error(request, error)
+                if len(result.errors) > MAX_IMPORT_ERROR_MESSAGES:
+                    messages.error(request, f"و {len(result.errors) - MAX_IMPORT_ERROR_MESSAGES} خطای دیگر.")
+                messages.success(
+                    request,
+                    f"فایل اکسل پردازش شد: {result.inserted} ردیف جدید، "
+                    f"{result.updated} ردیف به‌روزرسانی و {result.rejected} ردیف رد شد."
+                )
             except Exception as e:
                 messages.error(request, f"خطا در پردازش فایل: {e}")
             finally:
@@ -415,16 +519,39 @@ def upload_excel(request):
     else:
         form = ExcelUploadForm()
     return render(request, 'main_app/upload_excel.html', {'form': form})
+# Bedside monitors and ward gateways: POST {"readings": [...]} with a bearer IngestToken
+@csrf_exempt
+@require_POST
+@ingest_token_required
+def ingest_vitals(request):
+    try:
+        readings = parse_readings(request.body)
+    except RequestDataTooBig:
+        return JsonResponse({'error': 'حجم درخواست بیش از حد مجاز است.'}, status=413)
+    except IngestError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(ingest_readings(readings))
+
 @login_required
 def export_patient_data(request, pk):
+    """The patient's readings (or those in ?from=&to=) as ?format=xlsx|csv|parquet."""
     patient = get_object_or_404(Patient, pk=pk)
-    vital_signs = VitalSigns.objects.filter(patient=patient).values()
-    
-    df = pd.DataFrame(list(vital_signs))
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = f'attachment; filename={patient.first_name}_{patient.last_name}_data.xlsx'
-    
-    with pd.ExcelWriter(response, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Vital Signs')
-    
-    return response
\ No newline at end of file
+    try:
+        start, end = parse_date_range(request.GET)
+        fmt = request.GET.get('format', 'xlsx')
+        stream, content_type, extension = stream_vital_signs(patient, fmt, start, end)
+    except (ExportFormatError, ValueError) as e:
+        return HttpResponseBadRequest(str(e))
+
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename={patient.first_name}_{patient.last_name}_data.{extension}'
+    return response
+
+@staff_member_required
+def profiling_slowest(request):
+    """Slowest requests in this process's profiling ring buffer (?limit=, default 20)."""
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 500)
+    except ValueError:
+        return HttpResponseBadRequest("limit نامعتبر است.")
+    return JsonResponse({'requests': [p.as_dict() for p in slowest_requests(limit)]})